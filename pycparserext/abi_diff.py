@@ -0,0 +1,384 @@
+from __future__ import annotations
+
+from typing import NamedTuple
+
+from pycparser import c_ast
+
+from pycparserext.decl_index import DeclarationIndex, declarator_extras
+from pycparserext.ext_c_generator import GnuCGenerator
+from pycparserext.structural import StructuralHasher
+
+
+class Difference(NamedTuple):
+    """One changed aspect of a declaration.
+
+    .. attribute:: aspect
+
+        What changed, e.g. ``"return type"``, ``"parameter 2 type"``,
+        ``"attributes"``, ``"asm label"`` or ``"member x type"``.
+
+    .. attribute:: old
+    .. attribute:: new
+
+        The aspect in the old and new version as C source text, or *None* if
+        it is absent from that version.
+    """
+
+    aspect: str
+    old: str | None
+    new: str | None
+
+
+class DeclarationChange(NamedTuple):
+    """A top-level declaration that differs between two versions.
+
+    .. attribute:: kind
+
+        ``"added"``, ``"removed"`` or ``"changed"``.
+
+    .. attribute:: category
+
+        ``"function"``, ``"variable"``, ``"typedef"``, ``"struct"``,
+        ``"union"`` or ``"enum"``.
+
+    .. attribute:: name
+    .. attribute:: old
+    .. attribute:: new
+
+        The declaration nodes, *None* for the version lacking the
+        declaration. For struct, union and enum tags, these are the
+        :class:`pycparser.c_ast.Struct` etc. nodes of the definitions.
+
+    .. attribute:: differences
+
+        A tuple of :class:`Difference` instances for changed declarations,
+        empty otherwise.
+    """
+
+    kind: str
+    category: str
+    name: str
+    old: c_ast.Node | None
+    new: c_ast.Node | None
+    differences: tuple[Difference, ...]
+
+
+# {{{ indexing top-level declarations
+
+def _index_entries(ast):
+    """Return a :class:`dict` mapping *(category, name)* to the
+    :class:`~pycparserext.decl_index.Declaration` entries that are compared,
+    taken from the :class:`~pycparserext.decl_index.DeclarationIndex` of
+    *ast*, which is reused if *ast* already has one.
+    """
+    decl_index = getattr(ast, "index", None)
+    if decl_index is None:
+        decl_index = DeclarationIndex.from_ast(ast)
+
+    index = {}
+    for entry in decl_index.names.values():
+        if entry.kind != "enumerator":
+            # compared as part of their enum
+            index[entry.kind, entry.name] = entry
+
+    for entry in decl_index.tags.values():
+        if entry.is_definition:
+            index[entry.kind, entry.name] = entry
+
+    return index
+
+
+def _entry_node(entry):
+    if isinstance(entry.node, c_ast.FuncDef):
+        return entry.node.decl
+    return entry.node
+
+
+def index_declarations(ast):
+    """Return a :class:`dict` mapping *(category, name)* to the top-level
+    declarations of the :class:`pycparser.c_ast.FileAST` *ast*, with
+    categories as in :attr:`DeclarationChange.category`. For function
+    definitions, the :class:`pycparser.c_ast.Decl` is used, and only tags
+    that are defined are included.
+
+    This is built from the :class:`~pycparserext.decl_index.DeclarationIndex`
+    of *ast*, which is reused if *ast* already has one, so which declaration
+    of a name is used follows its rules.
+    """
+    return {
+            key: _entry_node(entry)
+            for key, entry in _index_entries(ast).items()}
+
+# }}}
+
+
+class _Differ:
+    def __init__(self):
+        self.generator = GnuCGenerator()
+
+        # Parameter and member names are compared through Decl.name, not
+        # through the names their types declare.
+        self.hasher = StructuralHasher(ignore_fields=("declname",))
+        # Attributes and asm labels of declarators are reported on their own.
+        self.type_hasher = StructuralHasher(
+                ignore_fields=("declname", "attributes", "asm"))
+
+    # {{{ rendering
+
+    def type_text(self, node):
+        if node is None:
+            return None
+        if isinstance(node, (c_ast.Decl, c_ast.Typename)):
+            node = node.type
+        if isinstance(node, c_ast.EllipsisParam):
+            return "..."
+        return self.generator._generate_type(node, emit_declname=False).strip()
+
+    def exprs_text(self, exprs):
+        if not exprs:
+            return None
+        return ", ".join(self.generator.visit(expr) for expr in exprs)
+
+    def node_text(self, node):
+        if node is None:
+            return None
+        return self.generator.visit(node).strip()
+
+    # }}}
+
+    # {{{ aspects of declarations
+
+    def common_differences(self, old, new, prefix=""):
+        diffs = []
+
+        if old.storage != new.storage:
+            diffs.append(Difference(prefix + "storage",
+                    " ".join(old.storage) or None,
+                    " ".join(new.storage) or None))
+
+        old_specs = [
+                spec for spec in getattr(old, "funcspec", None) or []
+                if isinstance(spec, str)]
+        new_specs = [
+                spec for spec in getattr(new, "funcspec", None) or []
+                if isinstance(spec, str)]
+        if old_specs != new_specs:
+            diffs.append(Difference(prefix + "function specifiers",
+                    " ".join(old_specs) or None,
+                    " ".join(new_specs) or None))
+
+        old_align = getattr(old, "align", None) or []
+        new_align = getattr(new, "align", None) or []
+        if not self.hasher.equal(old_align, new_align):
+            diffs.append(Difference(prefix + "alignment",
+                    self.exprs_text(old_align), self.exprs_text(new_align)))
+
+        old_attributes, old_asm = declarator_extras(old)
+        new_attributes, new_asm = declarator_extras(new)
+        if not self.hasher.equal(old_attributes, new_attributes):
+            diffs.append(Difference(prefix + "attributes",
+                    self.exprs_text(old_attributes),
+                    self.exprs_text(new_attributes)))
+        if not self.hasher.equal(old_asm, new_asm):
+            diffs.append(Difference(prefix + "asm label",
+                    self.node_text(old_asm), self.node_text(new_asm)))
+
+        return diffs
+
+    def function_differences(self, old, new):
+        diffs = self.common_differences(old, new)
+        old_func = old.type
+        new_func = new.type
+
+        if not self.type_hasher.equal(old_func.type, new_func.type):
+            diffs.append(Difference("return type",
+                    self.type_text(old_func.type),
+                    self.type_text(new_func.type)))
+
+        old_params = None if old_func.args is None else old_func.args.params
+        new_params = None if new_func.args is None else new_func.args.params
+        if (old_params is None or new_params is None
+                or len(old_params) != len(new_params)):
+            if not self.type_hasher.equal(old_func.args, new_func.args):
+                diffs.append(Difference("parameters",
+                        self.params_text(old_params),
+                        self.params_text(new_params)))
+        else:
+            for i, (old_param, new_param) in enumerate(
+                    zip(old_params, new_params, strict=True)):
+                old_type = getattr(old_param, "type", old_param)
+                new_type = getattr(new_param, "type", new_param)
+                if (type(old_param) is not type(new_param)
+                        or not self.type_hasher.equal(old_type, new_type)):
+                    diffs.append(Difference("parameter %d type" % (i + 1),
+                            self.type_text(old_param),
+                            self.type_text(new_param)))
+
+        return diffs
+
+    def params_text(self, params):
+        if params is None:
+            return "()"
+        return "(%s)" % ", ".join(self.type_text(param) for param in params)
+
+    def object_differences(self, old, new, prefix=""):
+        """Differences between variables, typedefs or struct members."""
+        diffs = self.common_differences(old, new, prefix)
+
+        if not self.type_hasher.equal(old.type, new.type):
+            diffs.append(Difference(prefix + "type",
+                    self.type_text(old.type), self.type_text(new.type)))
+
+        old_bitsize = getattr(old, "bitsize", None)
+        new_bitsize = getattr(new, "bitsize", None)
+        if not self.hasher.equal(old_bitsize, new_bitsize):
+            diffs.append(Difference(prefix + "bit width",
+                    self.node_text(old_bitsize), self.node_text(new_bitsize)))
+
+        return diffs
+
+    def tag_attribute_differences(self, old_attributes, new_attributes):
+        """Differences between the attributes of struct, union or enum tags,
+        which include those following the closing brace, see
+        :attr:`pycparserext.decl_index.Declaration.attributes`.
+        """
+        if self.hasher.equal(old_attributes, new_attributes):
+            return []
+        return [Difference("attributes",
+                self.exprs_text(old_attributes),
+                self.exprs_text(new_attributes))]
+
+    def struct_differences(self, old, new):
+        diffs = []
+
+        old_members = self.members(old)
+        new_members = self.members(new)
+
+        old_order = [name for name in old_members if name in new_members]
+        new_order = [name for name in new_members if name in old_members]
+        if old_order != new_order:
+            diffs.append(Difference("member order",
+                    ", ".join(old_order), ", ".join(new_order)))
+
+        for name, old_member in old_members.items():
+            new_member = new_members.get(name)
+            if new_member is None:
+                diffs.append(Difference(
+                        "member %s" % name, self.node_text(old_member), None))
+            elif not self.hasher.equal(old_member, new_member):
+                diffs.extend(self.object_differences(
+                        old_member, new_member, "member %s " % name))
+
+        for name, new_member in new_members.items():
+            if name not in old_members:
+                diffs.append(Difference(
+                        "member %s" % name, None, self.node_text(new_member)))
+
+        return diffs
+
+    def members(self, struct):
+        members = {}
+        nanonymous = 0
+        for decl in struct.decls:
+            if not isinstance(decl, c_ast.Decl):
+                # e.g. a #pragma
+                continue
+            name = decl.name
+            if name is None:
+                name = "<anonymous %d>" % nanonymous
+                nanonymous += 1
+            members[name] = decl
+        return members
+
+    def enum_differences(self, old, new):
+        old_values = {
+                enumerator.name: enumerator.value
+                for enumerator in old.values.enumerators}
+        new_values = {
+                enumerator.name: enumerator.value
+                for enumerator in new.values.enumerators}
+
+        if list(old_values) != list(new_values):
+            return [Difference("enumerators",
+                    ", ".join(old_values), ", ".join(new_values))]
+
+        return [
+                Difference("enumerator %s value" % name,
+                    self.node_text(old_value),
+                    self.node_text(new_values[name]))
+                for name, old_value in old_values.items()
+                if not self.hasher.equal(old_value, new_values[name])]
+
+    # }}}
+
+    def differences(self, category, old_entry, new_entry):
+        old = _entry_node(old_entry)
+        new = _entry_node(new_entry)
+        if category == "function":
+            return self.function_differences(old, new)
+        elif category in ("struct", "union"):
+            return (
+                    self.tag_attribute_differences(
+                        old_entry.attributes, new_entry.attributes)
+                    + self.struct_differences(old, new))
+        elif category == "enum":
+            return (
+                    self.tag_attribute_differences(
+                        old_entry.attributes, new_entry.attributes)
+                    + self.enum_differences(old, new))
+        else:
+            return self.object_differences(old, new)
+
+
+def diff_declarations(old_ast, new_ast):
+    """Compare the top-level declarations of two versions of a translation
+    unit, such as a preprocessed header, and return a list of
+    :class:`DeclarationChange` instances.
+
+    Declarations are matched by category and name, see
+    :func:`index_declarations`. Matched declarations, along with the
+    attributes :class:`~pycparserext.decl_index.DeclarationIndex` collects
+    for them, are first compared by their structural hashes (see
+    :mod:`pycparserext.structural`), so only those that actually differ are
+    examined in detail. Changes that do not
+    affect the interface, such as renamed parameters or different source
+    coordinates, are not reported.
+
+    Changed declarations are listed in the order of the old version,
+    followed by the added declarations in the order of the new version.
+    """
+    differ = _Differ()
+    old_index = _index_entries(old_ast)
+    new_index = _index_entries(new_ast)
+
+    changes = []
+    for key, old_entry in old_index.items():
+        category, name = key
+        old = _entry_node(old_entry)
+        new_entry = new_index.get(key)
+        if new_entry is None:
+            changes.append(DeclarationChange(
+                    "removed", category, name, old, None, ()))
+            continue
+
+        new = _entry_node(new_entry)
+        if (differ.hasher.equal(old, new)
+                and differ.hasher.equal(
+                    old_entry.attributes, new_entry.attributes)):
+            continue
+        diffs = differ.differences(category, old_entry, new_entry)
+        if diffs:
+            changes.append(DeclarationChange(
+                    "changed", category, name, old, new, tuple(diffs)))
+
+    for key, new_entry in new_index.items():
+        if key not in old_index:
+            category, name = key
+            changes.append(DeclarationChange(
+                    "added", category, name, None, _entry_node(new_entry),
+                    ()))
+
+    return changes
+
+
+# vim: fdm=marker
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+
+from pycparserext import serialize
+
+
+# Bump this whenever the stored AST layout changes in a way that makes
+# existing cache entries unusable.
+CACHE_FORMAT_VERSION = 3
+
+_ENTRY_SUFFIX = ".ast"
+
+
+def _package_versions():
+    from importlib.metadata import PackageNotFoundError, version
+
+    import pycparser
+
+    try:
+        ext_version = version("pycparserext")
+    except PackageNotFoundError:
+        ext_version = "unknown"
+
+    return "pycparser=%s;pycparserext=%s;format=%d" % (
+            pycparser.__version__, ext_version, CACHE_FORMAT_VERSION)
+
+
+class ParseCache:
+    """A content-addressed, size-bounded on-disk cache of parse results.
+
+    Entries are keyed by a hash of the source text, the file name (which ends
+    up in the node coordinates), the parser class and those of its options
+    that affect the AST, the names in the initial file scope along with
+    whether they are typedef names, and the versions of :mod:`pycparser`
+    and :mod:`pycparserext`. A hit returns a
+    fresh copy of the stored :class:`pycparser.c_ast.FileAST` without lexing
+    or parsing.
+
+    Several processes may share one cache directory. Entries are written to a
+    temporary file and atomically renamed into place, so readers never see
+    partially written entries. Reading an entry updates its modification
+    time, and the least recently used entries are evicted once the total size
+    exceeds *max_size* bytes.
+    """
+
+    def __init__(self, directory, max_size=512 * 1024**2):
+        self.directory = os.fspath(directory)
+        self.max_size = max_size
+        self._versions = _package_versions()
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, parser, text, filename, initial_scope):
+        """Return the key for parsing *text* with *parser*, starting out with
+        *initial_scope*, a mapping of names to whether they are typedef
+        names. Other identifiers matter as well, since declaring one of them
+        as a typedef name is an error.
+        """
+        cls = type(parser)
+        h = hashlib.sha256()
+        h.update(self._versions.encode())
+        h.update(b"\0")
+        h.update(("%s.%s" % (cls.__module__, cls.__qualname__)).encode())
+        h.update(b"\0")
+        h.update(parser._cache_options().encode())
+        h.update(b"\0")
+        h.update("\n".join(
+                ("T" if is_type else "I") + name
+                for name, is_type in sorted(initial_scope.items())).encode())
+        h.update(b"\0")
+        h.update(filename.encode("utf-8", "surrogatepass"))
+        h.update(b"\0")
+        if isinstance(text, str):
+            text = text.encode("utf-8", "surrogatepass")
+        # otherwise, UTF-8 encoded bytes, e.g. from a memory-mapped file
+        h.update(text)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _ENTRY_SUFFIX)
+
+    def get(self, key):
+        """Return the cached :class:`~pycparser.c_ast.FileAST` for *key*, or
+        *None* if there is no usable entry.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as inf:
+                ast = serialize.load(inf)
+        except FileNotFoundError:
+            return None
+        except (AttributeError, ImportError, IndexError, TypeError,
+                ValueError):
+            # Unreadable entry, e.g. written by an incompatible version of
+            # one of the node classes. Drop it and treat this as a miss.
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return ast
+
+    def put(self, key, ast):
+        try:
+            data = serialize.dumps(ast)
+        except TypeError:
+            # a node field holding something other than plain values and
+            # nodes; simply don't cache this one.
+            return
+
+        fd, tmp_path = tempfile.mkstemp(
+                dir=self.directory, prefix=".tmp-", suffix=_ENTRY_SUFFIX)
+        try:
+            with os.fdopen(fd, "wb") as outf:
+                outf.write(data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+
+        self.evict()
+
+    def _entries(self):
+        result = []
+        try:
+            dir_entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return result
+
+        for entry in dir_entries:
+            if (not entry.name.endswith(_ENTRY_SUFFIX)
+                    or entry.name.startswith(".tmp-")):
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                # evicted concurrently by another process
+                continue
+            result.append((st.st_mtime, st.st_size, entry.path))
+
+        return result
+
+    def total_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits into
+        *max_size* bytes.
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_size:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self._entries():
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+# vim: fdm=marker
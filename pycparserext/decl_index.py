@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from typing import NamedTuple
+
+from pycparser import c_ast
+
+from pycparserext.ext_c_parser import FuncDeclExt
+
+
+_DECLARATOR_TYPES = (
+        c_ast.TypeDecl, c_ast.PtrDecl, c_ast.ArrayDecl, c_ast.FuncDecl,
+        FuncDeclExt)
+
+_TAG_TYPES = (c_ast.Struct, c_ast.Union, c_ast.Enum)
+
+
+def declarator_extras(decl):
+    """Return a tuple *(attributes, asm)* of the list of attribute
+    expressions and the asm label attached to the declaration *decl*.
+    """
+    attributes = [
+            expr
+            for spec in getattr(decl, "funcspec", None) or []
+            if isinstance(spec, c_ast.Node)
+            for expr in spec.exprlist.exprs]
+    asm = None
+
+    # Follow the declarator, but not into parameter lists.
+    node = decl.type
+    while isinstance(node, _DECLARATOR_TYPES):
+        node_attributes = getattr(node, "attributes", None)
+        if node_attributes is not None:
+            attributes.extend(node_attributes.exprs)
+        if asm is None:
+            asm = getattr(node, "asm", None)
+        node = node.type
+
+    return attributes, asm
+
+
+class Declaration(NamedTuple):
+    """An entry of a :class:`DeclarationIndex`.
+
+    .. attribute:: name
+
+    .. attribute:: kind
+
+        ``"function"``, ``"variable"``, ``"typedef"`` or ``"enumerator"``
+        for ordinary identifiers, ``"struct"``, ``"union"`` or ``"enum"``
+        for tags.
+
+    .. attribute:: node
+
+        The :class:`pycparser.c_ast.FuncDef` of a function definition, the
+        :class:`pycparser.c_ast.Decl` or :class:`pycparser.c_ast.Typedef`
+        of other declarations, the :class:`pycparser.c_ast.Enumerator` of an
+        enumerator, and the :class:`pycparser.c_ast.Struct` etc. node of a
+        tag.
+
+    .. attribute:: coord
+
+        The coordinates of *node*.
+
+    .. attribute:: attributes
+
+        A tuple of the ``__attribute__`` expressions attached to the
+        declaration.
+
+    .. attribute:: asm
+
+        The :class:`~pycparserext.ext_c_parser.Asm` label of the
+        declaration, or *None*.
+
+    .. attribute:: is_definition
+
+        Whether *node* is a definition: a function definition, a variable
+        declaration that is not ``extern``, a typedef, an enumerator, or a
+        tag declared with its members.
+    """
+
+    name: str
+    kind: str
+    node: c_ast.Node
+    coord: c_ast.Coord | None
+    attributes: tuple[c_ast.Node, ...]
+    asm: c_ast.Node | None
+    is_definition: bool
+
+
+class DeclarationIndex(Mapping):
+    """The top-level declarations of a translation unit by name, for lookup
+    in constant time.
+
+    As a mapping, this holds the ordinary identifiers: functions, variables,
+    typedefs and enumerators, mapped to :class:`Declaration` instances.
+    Struct, union and enum tags are in a namespace of their own, see
+    :meth:`tag`. This includes tags defined inside the members of structs
+    and unions, which C also puts in file scope.
+
+    If a name is declared more than once, a definition takes precedence
+    over other declarations, and otherwise the last declaration does. So
+    the entry for a tag that has been declared before its definition, e.g.
+    as ``struct s;``, refers to the definition once that has been added.
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.tags = {}
+
+    @classmethod
+    def from_ast(cls, ast):
+        """Return the index of the :class:`pycparser.c_ast.FileAST` *ast*."""
+        index = cls()
+        for node in ast.ext:
+            index.add(node)
+        return index
+
+    def __getitem__(self, name):
+        return self.names[name]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def tag(self, name, default=None):
+        """Return the :class:`Declaration` of the struct, union or enum tag
+        *name*, or *default*.
+        """
+        return self.tags.get(name, default)
+
+    # {{{ adding declarations
+
+    @staticmethod
+    def _add_entry(table, entry):
+        existing = table.get(entry.name)
+        if (existing is None
+                or entry.is_definition or not existing.is_definition):
+            table[entry.name] = entry
+
+    def add(self, node):
+        """Add the top-level declaration *node*, as found in
+        :attr:`pycparser.c_ast.FileAST.ext`. Nodes that do not declare
+        anything, such as pragmas, are ignored.
+        """
+        if isinstance(node, c_ast.FuncDef):
+            decl = node.decl
+            kind = "function"
+            is_definition = True
+        elif isinstance(node, c_ast.Typedef):
+            decl = node
+            kind = "typedef"
+            is_definition = True
+        elif isinstance(node, c_ast.Decl):
+            decl = node
+            if isinstance(node.type, (c_ast.FuncDecl, FuncDeclExt)):
+                kind = "function"
+                is_definition = False
+            else:
+                kind = "variable"
+                is_definition = "extern" not in node.storage
+        else:
+            return
+
+        if decl.name is not None:
+            attributes, asm = declarator_extras(decl)
+            self._add_entry(self.names, Declaration(
+                    decl.name, kind, node, node.coord, tuple(attributes), asm,
+                    is_definition))
+
+        self._add_tags(decl)
+
+    def _add_tags(self, decl):
+        """Add the tags declared in the type specifier of *decl*, and in
+        those of its members, if it defines a struct or union.
+        """
+        stack = [decl]
+        while stack:
+            decl = stack.pop()
+
+            type_node = decl.type
+            while isinstance(type_node, _DECLARATOR_TYPES):
+                type_node = type_node.type
+            if not isinstance(type_node, _TAG_TYPES):
+                continue
+
+            if isinstance(type_node, c_ast.Enum):
+                kind = "enum"
+                is_definition = type_node.values is not None
+            else:
+                kind = ("struct" if isinstance(type_node, c_ast.Struct)
+                        else "union")
+                is_definition = type_node.decls is not None
+
+            if type_node.name is not None:
+                attributes = []
+                attrib = getattr(type_node, "attrib", None)
+                if attrib is not None:
+                    attributes.extend(attrib.exprlist.exprs)
+                if decl.name is None:
+                    # Attributes following the closing brace end up with
+                    # the declaration if it declares nothing else.
+                    attributes.extend(declarator_extras(decl)[0])
+
+                self._add_entry(self.tags, Declaration(
+                        type_node.name, kind, type_node, type_node.coord,
+                        tuple(attributes), None, is_definition))
+
+            if not is_definition:
+                continue
+            if kind == "enum":
+                for enumerator in type_node.values.enumerators:
+                    self._add_entry(self.names, Declaration(
+                            enumerator.name, "enumerator", enumerator,
+                            enumerator.coord, (), None, True))
+            else:
+                stack.extend(
+                        member for member in reversed(type_node.decls)
+                        if isinstance(member, c_ast.Decl))
+
+    # }}}
+
+
+# vim: fdm=marker
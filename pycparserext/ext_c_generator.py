@@ -1,10 +1,116 @@
+from typing import ClassVar
+
 from pycparser import c_ast
 from pycparser.c_generator import CGenerator as CGeneratorBaseBuggy
 
-from pycparserext.ext_c_parser import FuncDeclExt, TypeDeclExt
+from pycparserext.ext_c_parser import ArrayDeclExt, FuncDeclExt, TypeDeclExt
+
+
+_DECLARATOR_TYPES = frozenset({
+    c_ast.ArrayDecl, ArrayDeclExt, c_ast.PtrDecl, c_ast.FuncDecl, FuncDeclExt})
+
+_POSTFIX_TYPES = (c_ast.StructRef, c_ast.ArrayRef, c_ast.FuncCall)
+
+
+class _StmtSuffixProbe(CGeneratorBaseBuggy):
+    """Generates the code ``@`` for every node, with an indentation of two,
+    so that the output of :meth:`_generate_stmt` shows what it adds around
+    the code for a statement.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.indent_level = 2
+
+    def visit(self, node):
+        return "@"
+
+
+_stmt_suffix_probe = _StmtSuffixProbe()
+_stmt_suffix_cache = {}
+
+
+def _get_stmt_suffix(cls):
+    """Return what CGenerator._generate_stmt appends to the indented code
+    for a statement of class *cls*, or *None* if it does not indent it
+    either, as for compound statements. This asks pycparser's
+    implementation, so that the two cannot disagree.
+    """
+    code = _stmt_suffix_probe._generate_stmt(cls.__new__(cls))
+    if code == "@":
+        suffix = None
+    else:
+        assert code.startswith("  @")
+        suffix = code[3:]
+    _stmt_suffix_cache[cls] = suffix
+    return suffix
 
 
 class CGeneratorBase(CGeneratorBaseBuggy):
+    """Base class for extended C code generators.
+
+    Trees of binary operators and chains of conditional expressions,
+    assignments, ``else if`` statements and postfix operators are generated
+    in loops, so they may be of any size. Other nesting is generated
+    recursively, as in pycparser, and raises :exc:`RecursionError` if it is
+    too deep. With the default recursion limit of 1000, that happens at
+    roughly 190 nested prefix operators, casts or compound statements.
+    """
+
+    # {{{ dispatch
+
+    # Maps node classes to the functions visiting them. Each generator class
+    # gets its own table (see __init_subclass__), filled in as nodes are
+    # visited, so that overriding a visit method in a subclass works as
+    # usual.
+    _visit_methods: ClassVar[dict] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._visit_methods = {}
+
+    @classmethod
+    def _get_visit_method(cls, node_cls):
+        """Return the function visiting nodes of class *node_cls*: the method
+        ``visit_XXX`` for the first class ``XXX`` in the MRO of *node_cls*
+        for which there is one, else
+        :meth:`~pycparser.c_generator.CGenerator.generic_visit`.
+        """
+        for base in node_cls.__mro__:
+            method = getattr(cls, "visit_" + base.__name__, None)
+            if method is not None:
+                break
+        else:
+            method = cls.generic_visit
+
+        cls._visit_methods[node_cls] = method
+        return method
+
+    def visit(self, node):
+        try:
+            method = self._visit_methods[node.__class__]
+        except KeyError:
+            method = self._get_visit_method(node.__class__)
+        return method(self, node)
+
+    def _generate_stmt(self, n, add_indent=False):
+        try:
+            suffix = _stmt_suffix_cache[n.__class__]
+        except KeyError:
+            suffix = _get_stmt_suffix(n.__class__)
+
+        if suffix is None:
+            return self.visit(n)
+
+        if add_indent:
+            self.indent_level += 2
+        indent = self._make_indent()
+        if add_indent:
+            self.indent_level -= 2
+        return indent + self.visit(n) + suffix
+
+    # }}}
+
     # bug fix
     def visit_UnaryOp(self, n):
         operand = self._parenthesize_unless_simple(n.expr)
@@ -22,6 +128,172 @@ class CGeneratorBase(CGeneratorBaseBuggy):
             # avoid merging of "- - x" or "__real__varname"
             return "%s %s" % (n.op, operand)
 
+    # {{{ chains
+
+    # Generated code may contain chains of thousands of binary operators,
+    # "?:"s, assignments, "else if"s or postfix operators (as in
+    # "a.b[i].c()"), which pycparser's generator visits with several
+    # recursive calls per link.
+
+    def visit_BinaryOp(self, n):
+        binary_op = c_ast.BinaryOp
+        precedence_map = self.precedence_map
+        reduce_parentheses = self.reduce_parentheses
+
+        # Post-order traversal of the tree of binary operators. Nodes on the
+        # stack are paired with whether their operands have been generated,
+        # the code for which is on *results*.
+        results = []
+        stack = [(n, False)]
+        while stack:
+            node, expanded = stack.pop()
+            left = node.left
+            right = node.right
+            if not expanded:
+                stack.append((node, True))
+                if type(right) is binary_op:
+                    stack.append((right, False))
+                if type(left) is binary_op:
+                    stack.append((left, False))
+                continue
+
+            precedence = precedence_map[node.op]
+            rval = results.pop() if type(right) is binary_op else None
+            lval = results.pop() if type(left) is binary_op else None
+
+            # See CGenerator.visit_BinaryOp for when parentheses are needed.
+            if lval is None:
+                lval = self._visit_expr(left)
+                if not self._is_simple_node(left):
+                    lval = "(" + lval + ")"
+            elif not (reduce_parentheses
+                    and precedence_map[left.op] >= precedence):
+                lval = "(" + lval + ")"
+
+            if rval is None:
+                rval = self._visit_expr(right)
+                if not self._is_simple_node(right):
+                    rval = "(" + rval + ")"
+            elif not (reduce_parentheses
+                    and precedence_map[right.op] > precedence):
+                rval = "(" + rval + ")"
+
+            results.append(lval + " " + node.op + " " + rval)
+
+        return results[0]
+
+    def visit_TernaryOp(self, n):
+        s = ""
+        depth = 1
+        while True:
+            s += ("(" + self._visit_expr(n.cond) + ") ? "
+                    + "(" + self._visit_expr(n.iftrue) + ") : (")
+            if type(n.iffalse) is not c_ast.TernaryOp:
+                break
+            n = n.iffalse
+            depth += 1
+        return s + self._visit_expr(n.iffalse) + ")" * depth
+
+    def visit_Assignment(self, n):
+        s = ""
+        depth = 0
+        while True:
+            s += self.visit(n.lvalue) + " " + n.op + " "
+            if type(n.rvalue) is not c_ast.Assignment:
+                break
+            s += "("
+            n = n.rvalue
+            depth += 1
+        return s + self._visit_expr(n.rvalue) + ")" * depth
+
+    def _visit_postfix_chain(self, n):
+        visit_methods = self._visit_methods
+        suffixes = []
+        while True:
+            if isinstance(n, c_ast.StructRef):
+                suffixes.append(n.type + self.visit(n.field))
+            elif isinstance(n, c_ast.ArrayRef):
+                suffixes.append("[" + self.visit(n.subscript) + "]")
+            else:
+                suffixes.append(
+                        "(" + ("" if n.args is None else self.visit(n.args))
+                        + ")")
+
+            n = n.name
+            if not isinstance(n, _POSTFIX_TYPES):
+                break
+            # Follow the chain only as far as this method would be called
+            # for its links, so that overrides in subclasses take effect.
+            try:
+                method = visit_methods[n.__class__]
+            except KeyError:
+                method = self._get_visit_method(n.__class__)
+            if method is not CGeneratorBase._visit_postfix_chain:
+                break
+
+        suffixes.append(self._parenthesize_unless_simple(n))
+        suffixes.reverse()
+        return "".join(suffixes)
+
+    visit_ArrayRef = visit_StructRef = visit_FuncCall = _visit_postfix_chain
+
+    def visit_If(self, n):
+        s = ""
+        while True:
+            s += "if ("
+            if n.cond:
+                s += self.visit(n.cond)
+            s += ")\n"
+            s += self._generate_stmt(n.iftrue, add_indent=True)
+            if not n.iffalse:
+                return s
+            s += self._make_indent() + "else\n"
+            if type(n.iffalse) is not c_ast.If:
+                return s + self._generate_stmt(n.iffalse, add_indent=True)
+
+            # the indentation _generate_stmt(n.iffalse, add_indent=True)
+            # would emit
+            s += self._make_indent() + "  "
+            n = n.iffalse
+
+    # }}}
+
+    def _iter_file_ast(self, n):
+        """Yield the code for the top-level declarations in the
+        :class:`~pycparser.c_ast.FileAST` *n*, one by one.
+        """
+        for ext in n.ext:
+            if isinstance(ext, c_ast.FuncDef):
+                yield self.visit(ext)
+            elif isinstance(ext, c_ast.Pragma):
+                yield self.visit(ext) + "\n"
+            else:
+                yield self.visit(ext) + ";\n"
+
+    def visit_FileAST(self, n):
+        # CPython extends a string in place if nothing else refers to it,
+        # which needs about half the memory of joining a list of pieces.
+        s = ""
+        for code in self._iter_file_ast(n):
+            s += code
+        return s
+
+    def generate_to(self, node, out):
+        """Write the code for *node* to *out*, which is either a text stream,
+        such as an open file, or a :class:`list`, to which the code is
+        appended in pieces.
+
+        For a :class:`~pycparser.c_ast.FileAST`, the code for each top-level
+        declaration is written as soon as it is generated, so that only that
+        much of the output is held in memory at a time.
+        """
+        write = out.append if isinstance(out, list) else out.write
+        if isinstance(node, c_ast.FileAST):
+            for code in self._iter_file_ast(node):
+                write(code)
+        else:
+            write(self.visit(node))
+
 
 class AsmAndAttributesMixin:
     def visit_Asm(self, n):
@@ -42,47 +314,66 @@ class AsmAndAttributesMixin:
                 " : ".join(
                     self.visit(c) for c in components))
 
-    def _generate_type(self, n, modifiers=None, emit_declname=True):
-        """ Recursive generation from a type node. n is the type node.
+    def _generate_type(self, n, modifiers=None, emit_declname=True,
+            emit_base_type=True):
+        """ Generation from a type node. n is the type node.
             modifiers collects the PtrDecl, ArrayDecl and FuncDecl modifiers
             encountered on the way down to a TypeDecl, to allow proper
             generation from it.
         """
-        if modifiers is None:
-            modifiers = []
+        modifiers = [] if modifiers is None else list(modifiers)
+
+        # Walk down to the TypeDecl in a loop, since declarators may be
+        # nested arbitrarily deep.
         typ = type(n)
+        while typ in _DECLARATOR_TYPES or typ is c_ast.Typename:
+            if typ is c_ast.Typename:
+                modifiers = []
+            else:
+                modifiers.append(n)
+            n = n.type
+            typ = type(n)
         # print(n, modifiers)
 
-        if typ in (c_ast.TypeDecl, TypeDeclExt):
+        if typ is c_ast.TypeDecl or typ is TypeDeclExt:
             s = ""
-            if n.quals:
-                s += " ".join(n.quals) + " "
-            s += self.visit(n.type)
+            if emit_base_type:
+                if n.quals:
+                    s += " ".join(n.quals) + " "
+                s += self.visit(n.type)
 
             nstr = n.declname if n.declname and emit_declname else ""
             # Resolve modifiers.
             # Wrap in parens to distinguish pointer to array and pointer to
             # function syntax.
             #
-            for i, modifier in enumerate(modifiers):
-                if isinstance(modifier, c_ast.ArrayDecl):
-                    if i != 0 and isinstance(modifiers[i - 1], c_ast.PtrDecl):
-                        nstr = "(" + nstr + ")"
-
+            after_ptr = False
+            for modifier in modifiers:
+                mtyp = type(modifier)
+                if mtyp is c_ast.PtrDecl:
+                    # BUG FIX: pycparser ignores quals
+                    if modifier.quals:
+                        nstr = "*" + " ".join(modifier.quals) + " " + nstr
+                    else:
+                        nstr = "*" + nstr
+                    after_ptr = True
+                    continue
+
+                if after_ptr:
+                    nstr = "(" + nstr + ")"
+                    after_ptr = False
+
+                if mtyp is c_ast.ArrayDecl or mtyp is ArrayDeclExt:
                     # BUG FIX: pycparser ignores quals
                     dim_quals = (" ".join(modifier.dim_quals) + " "
                                  if modifier.dim_quals else "")
 
                     nstr += "[" + dim_quals + self.visit(modifier.dim) + "]"
 
-                elif isinstance(modifier, c_ast.FuncDecl):
-                    if i != 0 and isinstance(modifiers[i - 1], c_ast.PtrDecl):
-                        nstr = "(" + nstr + ")"
+                elif mtyp is c_ast.FuncDecl:
                     nstr += "(" + self.visit(modifier.args) + ")"
 
-                elif isinstance(modifier, FuncDeclExt):
-                    if i != 0 and isinstance(modifiers[i - 1], c_ast.PtrDecl):
-                        nstr = "(" + nstr + ")"
+                elif mtyp is FuncDeclExt:
                     nstr += "(" + self.visit(modifier.args) + ")"
 
                     if modifier.asm is not None:
@@ -94,42 +385,45 @@ class AsmAndAttributesMixin:
                                 + self.visit(modifier.attributes)
                                 + "))")
 
-                elif isinstance(modifier, c_ast.PtrDecl):
-                    # BUG FIX: pycparser ignores quals
-                    quals = " ".join(modifier.quals)
-                    if quals:
-                        quals = quals + " "
-                    nstr = "*" + quals + nstr
-
-            if hasattr(n, "asm") and n.asm:
-                nstr += self.visit(n.asm)
+            if typ is TypeDeclExt:
+                # These slots may be unset.
+                asm = getattr(n, "asm", None)
+                if asm:
+                    nstr += self.visit(asm)
 
-            if hasattr(n, "attributes") and n.attributes.exprs:
-                nstr += " __attribute__((" + self.visit(n.attributes) + "))"
+                attributes = getattr(n, "attributes", None)
+                if attributes is not None and attributes.exprs:
+                    nstr += " __attribute__((" + self.visit(attributes) + "))"
 
+            if not emit_base_type:
+                return nstr
             if nstr:
                 s += " " + nstr
             return s
 
-        elif typ == c_ast.Decl:
+        elif typ is c_ast.Decl:
             return self._generate_decl(n.type)
 
-        elif typ == c_ast.Typename:
-            return self._generate_type(n.type, emit_declname=emit_declname)
-
-        elif typ == c_ast.IdentifierType:
+        elif typ is c_ast.IdentifierType:
             return " ".join(n.names) + " "
 
-        elif typ in (c_ast.ArrayDecl, c_ast.PtrDecl, c_ast.FuncDecl, FuncDeclExt):
-            return self._generate_type(
-                    n.type, [*modifiers, n], emit_declname=emit_declname)
-
         else:
             return self.visit(n)
 
     def visit_AttributeSpecifier(self, n):
         return "__attribute__((" + self.visit(n.exprlist) + "))"
 
+    def visit_StructExt(self, n):
+        """Generate code for StructExt with attributes."""
+        s = self._generate_struct_union_enum(n, "struct")
+        attrib = getattr(n, "attrib", None)
+        if attrib:
+            s += " " + self.visit(attrib)
+        return s
+
+    def visit_FuncDeclExt(self, n):
+        return self._generate_type(n)
+
 
 class GnuCGenerator(AsmAndAttributesMixin, CGeneratorBase):
     def _generate_decl(self, n):
@@ -166,14 +460,11 @@ class GnuCGenerator(AsmAndAttributesMixin, CGeneratorBase):
         """Generate code for struct, handling attributes if present."""
         s = self._generate_struct_union_enum(n, "struct")
         # If this is a StructExt with attributes, add them
-        if hasattr(n, "attrib") and n.attrib:
-            s += " " + self.visit(n.attrib)
+        attrib = getattr(n, "attrib", None)
+        if attrib:
+            s += " " + self.visit(attrib)
         return s
 
-    def visit_StructExt(self, n):
-        """Generate code for StructExt with attributes."""
-        return self.visit_Struct(n)
-
 
 class GNUCGenerator(GnuCGenerator):
     def __init__(self):
@@ -183,15 +474,13 @@ class GNUCGenerator(GnuCGenerator):
 
 
 class OpenCLCGenerator(AsmAndAttributesMixin, CGeneratorBase):
-    def visit_FileAST(self, n):
-        s = ""
+    def _iter_file_ast(self, n):
         from pycparserext.ext_c_parser import PreprocessorLine
         for ext in n.ext:
             if isinstance(ext, (c_ast.FuncDef, PreprocessorLine)):
-                s += self.visit(ext)
+                yield self.visit(ext)
             else:
-                s += self.visit(ext) + ";\n"
-        return s
+                yield self.visit(ext) + ";\n"
 
     def visit_PreprocessorLine(self, n):
         return n.contents
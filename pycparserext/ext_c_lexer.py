@@ -1,4 +1,10 @@
+from __future__ import annotations
+
+import codecs
+from typing import ClassVar, NamedTuple
+
 from pycparser.c_lexer import CLexer as CLexerBase
+from pycparser.c_parser import Coord, ParseError
 
 
 _COMMON_EXTRA_KEYWORDS = {
@@ -46,19 +52,141 @@ _OCL_EXTRA_KEYWORDS = {
 }
 
 
-class GnuCLexer(CLexerBase):
-    """GNU C lexer that recognizes GNU-specific keywords."""
+class TokenInfo(NamedTuple):
+    """A token as yielded by :meth:`GnuCLexer.tokenize` and
+    :meth:`OpenCLCLexer.tokenize`.
+    """
+
+    type: str
+    value: str
+    lineno: int
+    column: int
+
+
+def _iter_line_chunks(source, encoding, chunk_size):
+    """Yield the text of *source* in pieces of roughly *chunk_size* that each
+    end at a line break (except possibly the last one).
+    """
+    if isinstance(source, str):
+        yield source
+        return
+
+    if hasattr(source, "read"):
+        # files and mmap objects
+        read = source.read
+    else:
+        buf = memoryview(source)
+        pos = 0
+
+        def read(size):
+            nonlocal pos
+            data = buf[pos:pos + size]
+            pos += len(data)
+            return data
+
+    decoder = None
+    pending = []
+    while True:
+        data = read(chunk_size)
+        if not data:
+            break
+        if not isinstance(data, str):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(encoding)()
+            data = decoder.decode(data)
+
+        cut = data.rfind("\n") + 1
+        if not cut:
+            pending.append(data)
+            continue
+
+        pending.append(data[:cut])
+        yield "".join(pending)
+        pending = [data[cut:]]
+
+    if decoder is not None:
+        pending.append(decoder.decode(b"", final=True))
+    rest = "".join(pending)
+    if rest:
+        yield rest
+
+
+def _ignore_brace():
+    pass
+
+
+class _ExtCLexerBase(CLexerBase):
+    """Lexer base that recognizes the class's :attr:`_extra_keywords`, by
+    turning identifier tokens spelled like them into keyword tokens.
+    """
 
-    _extra_keywords = {**_COMMON_EXTRA_KEYWORDS, **_GNU_EXTRA_KEYWORDS}  # noqa: RUF012
+    _extra_keywords: ClassVar[dict[str, str]] = {}
 
     def token(self):
         tok = super().token()
+        # C keywords are never lexed as IDs, so they take precedence, and so
+        # do typedef names, which are lexed as TYPEIDs.
         if tok is not None and tok.type == "ID":
             new_type = self._extra_keywords.get(tok.value)
             if new_type is not None:
                 tok.type = new_type
         return tok
 
+    @classmethod
+    def tokenize(cls, source, filename="", encoding="utf-8",
+            type_names=frozenset(), chunk_size=1 << 20):
+        """Lex *source* without parsing it, yielding a :class:`TokenInfo` for
+        each token.
+
+        :arg source: a :class:`str`, a file object opened in text or binary
+            mode, an :class:`mmap.mmap`, or a bytes-like object. Anything but
+            a :class:`str` is read and lexed piecewise, so that memory use
+            does not grow with the size of the input.
+        :arg encoding: used to decode binary input.
+        :arg type_names: identifiers to report as ``TYPEID`` rather than
+            ``ID``. Since no parsing happens, typedefs in *source* itself are
+            not tracked.
+
+        Raises :exc:`pycparser.c_parser.ParseError` on lexical errors.
+        """
+        lexer = None
+
+        def error_func(msg, line, column):
+            raise ParseError("%s: %s" % (
+                Coord(lexer.filename, line, column), msg))
+
+        lexer = cls(error_func, _ignore_brace, _ignore_brace,
+                type_names.__contains__)
+        lexer.input("", filename)
+
+        for tok in lexer._iter_chunk_tokens(
+                _iter_line_chunks(source, encoding, chunk_size)):
+            yield TokenInfo(tok.type, tok.value, tok.lineno, tok.column)
+
+    def _iter_chunk_tokens(self, chunks):
+        """Yield the tokens of the concatenation of *chunks*, each of which
+        must end at a line break (except the last). Lexer state other than
+        the input, such as the line number and file name, carries over from
+        one chunk to the next.
+        """
+        for chunk in chunks:
+            # Each chunk starts at the beginning of a line, so only the
+            # position needs resetting.
+            self._lexdata = chunk
+            self._pos = 0
+            self._line_start = 0
+
+            token = self.token
+            while (tok := token()) is not None:
+                yield tok
+
+
+class GnuCLexer(_ExtCLexerBase):
+    """GNU C lexer that recognizes GNU-specific keywords."""
+
+    _extra_keywords: ClassVar[dict[str, str]] = {
+            **_COMMON_EXTRA_KEYWORDS, **_GNU_EXTRA_KEYWORDS}
+
 
 class GNUCLexer(GnuCLexer):
     def __init__(self, *args, **kwargs):
@@ -68,25 +196,18 @@ class GNUCLexer(GnuCLexer):
         GnuCLexer.__init__(self, *args, **kwargs)
 
 
-class OpenCLCLexer(CLexerBase):
+class OpenCLCLexer(_ExtCLexerBase):
     """OpenCL C lexer that recognizes OpenCL-specific keywords and line
     comments."""
 
-    _extra_keywords = {**_COMMON_EXTRA_KEYWORDS, **_OCL_EXTRA_KEYWORDS}  # noqa: RUF012
-
-    def token(self):
-        tok = super().token()
-        if tok is not None and tok.type == "ID":
-            new_type = self._extra_keywords.get(tok.value)
-            if new_type is not None:
-                tok.type = new_type
-        return tok
+    _extra_keywords: ClassVar[dict[str, str]] = {
+            **_COMMON_EXTRA_KEYWORDS, **_OCL_EXTRA_KEYWORDS}
 
     def _match_token(self):
         """Override to silently consume // line comments."""
         text = self._lexdata
         pos = self._pos
-        if text[pos:pos + 2] == "//":
+        if text.startswith("//", pos):
             end = text.find("\n", pos)
             if end == -1:
                 self._pos = len(text)
@@ -27,6 +27,12 @@ THE SOFTWARE.
 """
 
 
+import codecs
+import mmap
+import os
+import re
+from functools import partial
+
 import pycparser.c_parser
 from pycparser import c_ast
 from pycparser.c_parser import (
@@ -35,12 +41,54 @@ from pycparser.c_parser import (
     _STORAGE_CLASS,
     _TYPE_QUALIFIER,
     _TYPE_SPEC_SIMPLE,
+    _TokenStream,
 )
 
+from pycparserext.ext_c_lexer import _iter_line_chunks
+
 
 # {{{ ast extensions
 
+# As in pycparser, __slots__ lists the node's fields first, followed by
+# "coord" and "__weakref__": Node.__repr__ relies on this order.
+
+def _node_field_repr(value):
+    # as pycparser.c_ast._repr
+    if isinstance(value, list):
+        return "[" + ",\n ".join(
+                _node_field_repr(item).replace("\n", "\n ")
+                for item in value) + "\n]"
+    return repr(value)
+
+
+def _ext_node_repr(self):
+    """Like :meth:`pycparser.c_ast.Node.__repr__`, for subclasses of
+    pycparser's node classes, whose own ``__slots__`` only lists the fields
+    they add. Fields that have not been set are shown as *None*.
+    """
+    cls = self.__class__
+    names = []
+    for base in reversed(cls.__mro__):
+        for name in base.__dict__.get("__slots__", ()):
+            if name not in ("coord", "__weakref__") and name not in names:
+                names.append(name)
+
+    cls_name = cls.__name__
+    result = cls_name + "("
+    indent = ""
+    separator = ""
+    for name in names:
+        result += separator + indent + name + "=" + _node_field_repr(
+                getattr(self, name, None)).replace(
+                        "\n", "\n  " + " " * (len(name) + len(cls_name)))
+        separator = ","
+        indent = "\n " + " " * len(cls_name)
+    return result + indent + ")"
+
+
 class TypeList(c_ast.Node):
+    __slots__ = ("types", "coord", "__weakref__")
+
     def __init__(self, types, coord=None):
         self.types = types
         self.coord = coord
@@ -58,13 +106,21 @@ class TypeList(c_ast.Node):
 
 
 class AttributeSpecifier(c_ast.Node):
-    def __init__(self, exprlist):
+    __slots__ = ("exprlist", "coord", "__weakref__")
+
+    def __init__(self, exprlist, coord=None):
         self.exprlist = exprlist
+        self.coord = coord
 
     def __eq__(self, other):
         if not isinstance(other, AttributeSpecifier):
             return False
-        return self._compare_ast_nodes(self.exprlist, other.exprlist)
+        if self.exprlist is other.exprlist:
+            # always the case for equal interned attribute lists
+            return True
+
+        from pycparserext.structural import structurally_equal
+        return structurally_equal(self.exprlist, other.exprlist)
 
     def _compare_ast_nodes(self, node1, node2):
         if type(node1) is not type(node2):
@@ -97,6 +153,9 @@ class AttributeSpecifier(c_ast.Node):
 
 
 class Asm(c_ast.Node):
+    __slots__ = ("asm_keyword", "template", "output_operands",
+            "input_operands", "clobbered_regs", "coord", "__weakref__")
+
     def __init__(self, asm_keyword, template, output_operands,
             input_operands, clobbered_regs, coord=None):
         self.asm_keyword = asm_keyword
@@ -132,6 +191,8 @@ class Asm(c_ast.Node):
 
 
 class PreprocessorLine(c_ast.Node):
+    __slots__ = ("contents", "coord", "__weakref__")
+
     def __init__(self, contents, coord=None):
         self.contents = contents
         self.coord = coord
@@ -147,6 +208,8 @@ class PreprocessorLine(c_ast.Node):
 
 
 class TypeOfDeclaration(c_ast.Node):
+    __slots__ = ("typeof_keyword", "declaration", "coord", "__weakref__")
+
     def __init__(self, typeof_keyword, declaration, coord=None):
         self.typeof_keyword = typeof_keyword
         self.declaration = declaration
@@ -166,6 +229,8 @@ class TypeOfDeclaration(c_ast.Node):
 
 
 class TypeOfExpression(c_ast.Node):
+    __slots__ = ("typeof_keyword", "expr", "coord", "__weakref__")
+
     def __init__(self, typeof_keyword, expr, coord=None):
         self.typeof_keyword = typeof_keyword
         self.expr = expr
@@ -185,6 +250,8 @@ class TypeOfExpression(c_ast.Node):
 
 
 class RangeExpression(c_ast.Node):
+    __slots__ = ("first", "last", "coord", "__weakref__")
+
     def __init__(self, first, last, coord=None):
         self.first = first
         self.last = last
@@ -210,6 +277,8 @@ class RangeExpression(c_ast.Node):
 class TypeDeclExt(c_ast.TypeDecl):
     __slots__ = ("asm", "attributes", "init")
 
+    __repr__ = _ext_node_repr
+
     @staticmethod
     def from_pycparser(td):
         assert isinstance(td, c_ast.TypeDecl)
@@ -225,6 +294,8 @@ class TypeDeclExt(c_ast.TypeDecl):
 class ArrayDeclExt(c_ast.ArrayDecl):
     __slots__ = ("asm", "attributes", "init")
 
+    __repr__ = _ext_node_repr
+
     @staticmethod
     def from_pycparser(ad):
         assert isinstance(ad, c_ast.ArrayDecl)
@@ -238,14 +309,21 @@ class ArrayDeclExt(c_ast.ArrayDecl):
 
 class StructExt(c_ast.Struct):
     """Extended Struct that can hold attributes."""
+
+    __slots__ = ("attrib",)
+
+    __repr__ = _ext_node_repr
+
     @staticmethod
     def from_pycparser(st):
         assert isinstance(st, c_ast.Struct)
-        return StructExt(
+        result = StructExt(
             name=st.name,
             decls=st.decls,
             coord=st.coord
         )
+        result.attrib = None
+        return result
 
 
 def to_decl_ext(d):
@@ -258,6 +336,8 @@ def to_decl_ext(d):
 
 
 class FuncDeclExt(c_ast.Node):
+    __slots__ = ("args", "type", "attributes", "asm", "coord", "__weakref__")
+
     def __init__(self, args, type, attributes, asm, coord=None):
         self.args = args
         self.type = type
@@ -289,33 +369,748 @@ class FuncDeclExt(c_ast.Node):
 
     attr_names = ()
 
+
+def _lazy_field_properties(base_cls, name):
+    """Return two properties for a subclass of *base_cls*: one for the field
+    *name*, which the parser may have left unparsed (see
+    :class:`_LazyBraces`) and which is parsed when first accessed, and one
+    telling whether that has happened.
+    """
+    field = base_cls.__dict__[name]
+
+    def get(self):
+        value = field.__get__(self)
+        if isinstance(value, _LazyBraces):
+            value = value.parse()
+            field.__set__(self, value)
+        return value
+
+    def is_parsed(self):
+        return not isinstance(field.__get__(self), _LazyBraces)
+
+    return (
+            property(get, field.__set__),
+            property(is_parsed, doc="Whether :attr:`%s` has been parsed."
+                % name))
+
+
+class FuncDefExt(c_ast.FuncDef):
+    """A function definition whose body is parsed when :attr:`body` is first
+    accessed. Created by parsers constructed with
+    *lazy_function_bodies=True*.
+    """
+
+    __slots__ = ()
+
+    body, body_parsed = _lazy_field_properties(c_ast.FuncDef, "body")
+
+    __repr__ = _ext_node_repr
+
+
+class DeclExt(c_ast.Decl):
+    """A declaration whose braced initializer is parsed when :attr:`init` is
+    first accessed. Created by parsers constructed with
+    *lazy_initializers=True*.
+    """
+
+    __slots__ = ()
+
+    init, init_parsed = _lazy_field_properties(c_ast.Decl, "init")
+
+    __repr__ = _ext_node_repr
+
+    @staticmethod
+    def from_pycparser(d):
+        assert isinstance(d, c_ast.Decl)
+        return DeclExt(
+            name=d.name,
+            quals=d.quals,
+            align=d.align,
+            storage=d.storage,
+            funcspec=d.funcspec,
+            type=d.type,
+            init=d.init,
+            bitsize=d.bitsize,
+            coord=d.coord
+        )
+
+
+class FileASTExt(c_ast.FileAST):
+    """A translation unit with an index of its top-level declarations.
+    Returned by parsers constructed with *index_declarations=True*.
+
+    .. attribute:: index
+
+        A :class:`pycparserext.decl_index.DeclarationIndex`, or *None* for
+        an instance that was e.g. loaded using :mod:`pycparserext.serialize`,
+        which does not store the index.
+    """
+
+    # Not a slot, so that the index is not taken for a field of the AST,
+    # e.g. by pycparserext.structural and pycparserext.serialize.
+    index = None
+
 # }}}
 
 
 # {{{ base parser
 
+_GROUP_DELIMITERS = {
+    # token type: (kind, is_opening)
+    "LPAREN": (0, True), "RPAREN": (0, False),
+    "LBRACKET": (1, True), "RBRACKET": (1, False),
+    "LBRACE": (2, True), "RBRACE": (2, False),
+}
+
+
+class _GroupMatchingTokenStream(_TokenStream):
+    """A token stream that can find where parenthesized, bracketed and
+    braced groups end without the parser stepping through their contents.
+
+    The table of matching delimiters is built on demand, looking at each
+    token at most once. Each kind of delimiter is matched separately, i.e.
+    an unbalanced ')' does not affect how brackets match.
+    """
+
+    def __init__(self, lexer):
+        super().__init__(lexer)
+
+        # Positions are absolute, counting tokens dropped by
+        # discard_consumed, so that they stay valid across it.
+        self._base = 0
+        self._matched_upto = 0
+        self._open_stacks = ([], [], [])
+        self._group_ends = {}
+
+    def _match_delimiters(self):
+        """Record the delimiters among the buffered tokens not looked at
+        yet.
+        """
+        base = self._base
+        buffer = self._buffer
+        start = self._matched_upto - base
+        if start < 0:
+            # Tokens were dropped before being looked at.
+            start = 0
+            self._open_stacks = ([], [], [])
+
+        open_stacks = self._open_stacks
+        group_ends = self._group_ends
+        for index in range(start, len(buffer)):
+            tok = buffer[index]
+            if tok is None:
+                break
+            delim = _GROUP_DELIMITERS.get(tok.type)
+            if delim is not None:
+                stack = open_stacks[delim[0]]
+                if delim[1]:
+                    stack.append(base + index)
+                elif stack:
+                    group_ends[stack.pop()] = base + index + 1
+
+        self._matched_upto = base + len(buffer)
+
+    def group_end(self, open_index):
+        """Return the index just past the token closing the group opened by
+        the token at *open_index*, or *None* if the input ends first.
+
+        Only lexes as far as the closing token, so that identifiers are
+        classified as they would be when reading the group token by token.
+        """
+        key = self._base + open_index
+        group_ends = self._group_ends
+        buffer = self._buffer
+
+        self._match_delimiters()
+        while key not in group_ends:
+            if buffer and buffer[-1] is None:
+                return None
+            self._fill(len(buffer) - self._index + 1)
+            self._match_delimiters()
+        return group_ends[key] - self._base
+
+    def discard_consumed(self):
+        """Drop the tokens before the current position."""
+        index = self._index
+        del self._buffer[:index]
+        self._index = 0
+        self._base = base = self._base + index
+        if self._group_ends:
+            self._group_ends = {
+                    key: end for key, end in self._group_ends.items()
+                    if end > base}
+
+
+class _ChunkedTokenSource:
+    """Stands in for the lexer in a :class:`pycparser.c_parser._TokenStream`,
+    feeding it the tokens of a sequence of text chunks.
+    """
+
+    def __init__(self, lexer, chunks):
+        self.token = partial(next, lexer._iter_chunk_tokens(chunks), None)
+
+
+# Within braces, strings and character constants may contain braces. The
+# lexer handles '#' (e.g. #line) specially, and the OpenCL lexer skips '//'
+# comments, which may contain braces, so groups containing a '#' or a '/'
+# are lexed as usual, as are those with quotes not matched here.
+_BRACES_SCAN_RE = re.compile(r"""
+    "(?:\\.|[^"\\\n])*"
+    | '(?:\\.|[^'\\\n])*'
+    | (?P<brace>[{}])
+    | (?P<other>["'\#/])
+    """, re.VERBOSE)
+
+
+class _LazyBraces:
+    """The text of a braced function body or initializer, from ``{`` to
+    ``}``, along with what is needed to parse it later.
+
+    It is parsed by a new parser of the same class as the one that skipped
+    it, which may be busy with other input by then, possibly on another
+    thread.
+    """
+
+    __slots__ = ("column", "filename", "lineno", "parser_class",
+            "parser_kwargs", "production", "scopes", "text")
+
+    def __init__(self, parser_class, parser_kwargs, production, text, lineno,
+            column, filename, scopes):
+        self.parser_class = parser_class
+        self.parser_kwargs = parser_kwargs
+        # name of the parser method
+        self.production = production
+        self.text = text
+        # coordinates of the '{'
+        self.lineno = lineno
+        self.column = column
+        self.filename = filename
+        self.scopes = scopes
+
+    def parse(self):
+        parser = self.parser_class(**self.parser_kwargs)
+        return parser._parse_lazy_braces(self)
+
+
 class CParserBase(pycparser.c_parser.CParser):
-    """Base class for extended C parsers."""
+    """Base class for extended C parsers.
+
+    Chains of ``else if`` statements, conditional expressions, assignments,
+    left-associative binary operators and postfix operators (as in
+    ``a.b[i]()``) are parsed in loops, so they may be of any length. Other
+    nesting is parsed recursively, as in pycparser, and raises
+    :exc:`RecursionError` if it is too deep. With the default recursion limit
+    of 1000, that happens at roughly 90 levels of parenthesized
+    subexpressions that nest to the right (as in ``a + (b + (c + ...))``),
+    300 prefix operators, 900 casts or 150 nested compound statements.
+    """
 
     initial_type_symbols = frozenset()
 
-    def __init__(self, **kwds):
+    def __init__(self, cache=None, intern_attributes=False,
+            lazy_function_bodies=False, lazy_initializers=False,
+            index_declarations=False, **kwds):
+        """
+        :arg cache: an optional :class:`pycparserext.cache.ParseCache`.
+            If given, :meth:`parse` looks up its result there before lexing
+            and parsing, and stores newly parsed ASTs in it. Parsers that
+            parse lazily (see below) do not use the cache, since storing an
+            AST parses all of it.
+        :arg intern_attributes: if *True*, structurally identical
+            ``__attribute__`` lists share a single
+            :class:`pycparser.c_ast.ExprList` (and
+            :class:`AttributeSpecifier`) within each parsed input. Shared
+            nodes carry the coordinates of their first occurrence and must
+            not be modified.
+        :arg lazy_function_bodies: if *True*, the bodies of top-level
+            function definitions are skipped by matching braces in the
+            source text, and the definitions are represented by
+            :class:`FuncDefExt` nodes, which lex and parse the body when
+            :attr:`~pycparser.c_ast.FuncDef.body` is first accessed (as
+            happens when visiting all children of the AST), using a new
+            parser of the same class, so this parser may be reused
+            meanwhile. Bodies containing preprocessor directives are parsed
+            right away.
+        :arg lazy_initializers: like *lazy_function_bodies*, for braced
+            initializers of top-level declarations, e.g. of large tables.
+            Declarations with such initializers are represented by
+            :class:`DeclExt` nodes, which parse the initializer when
+            :attr:`~pycparser.c_ast.Decl.init` is first accessed.
+        :arg index_declarations: if *True*, :meth:`parse` and
+            :meth:`parse_file` return a :class:`FileASTExt`, with an index
+            of the top-level declarations by name that is built while
+            parsing.
+        """
+        self.cache = cache
+        self._interned_attributes = {} if intern_attributes else None
+        self.lazy_function_bodies = lazy_function_bodies
+        self.lazy_initializers = lazy_initializers
+        self.index_declarations = index_declarations
+        self._function_body_follows = False
+        self._declaration_index = None
+
         kwds["lexer"] = self.lexer_class
         pycparser.c_parser.CParser.__init__(self, **kwds)
 
+        self._default_initial_scope = dict.fromkeys(
+                self.initial_type_symbols, True)
+
+    def profile(self, callback=None):
+        """Return a context manager that counts and times calls to the
+        grammar productions and the lexer while it is active. It yields a
+        :class:`pycparserext.profiling.ParseProfile`, which is also passed
+        to *callback*, if given, on exit::
+
+            with parser.profile() as prof:
+                parser.parse(text)
+            print(prof.report())
+
+        Outside of such a context, profiling has no cost.
+        """
+        from pycparserext.profiling import ParseProfiler
+        return ParseProfiler(self, callback)
+
+    def _get_cache(self):
+        """Return the cache to use, or *None*."""
+        if self.lazy_function_bodies or self.lazy_initializers:
+            return None
+        return self.cache
+
+    def _cache_options(self):
+        """Return a string describing the options of this parser that the
+        ASTs it returns depend on, for the keys of the cache.
+        """
+        return "intern_attributes=%d" % (
+                self._interned_attributes is not None)
+
+    def _make_initial_scope(self, initial_type_symbols, snapshot=None):
+        """Return the file scope that parsing starts out with. The result
+        must not be modified.
+        """
+        if snapshot is not None:
+            snapshot._check_parser(self)
+            base_scope = snapshot.scope
+        else:
+            base_scope = self._default_initial_scope
+
+        if not initial_type_symbols:
+            return base_scope
+        return dict.fromkeys(initial_type_symbols, True) | base_scope
+
+    def reset(self, initial_type_symbols=frozenset(), snapshot=None):
+        """Discard what is left of the state of the previous parse, also
+        after a :exc:`~pycparser.c_parser.ParseError`, and set up the file
+        scope for *initial_type_symbols* and *snapshot*.
+
+        :meth:`parse` and :meth:`parse_file` start from a clean state
+        anyway, so a parser can be reused without calling this. It releases
+        the input and the tokens of the previous parse, though, e.g. before
+        keeping the parser around for later use. The scope of the parser's
+        own :attr:`initial_type_symbols` is only built once per parser.
+        """
+        self.clex.input("")
+        self._scope_stack = [dict(self._make_initial_scope(
+                initial_type_symbols, snapshot))]
+        self._tokens = self._make_token_stream(self.clex)
+        self._scan_memo = None
+        self._function_body_follows = False
+        self._declaration_index = None
+        self._clear_interned_attributes()
+
     def parse(self, text, filename="", debuglevel=0,
-            initial_type_symbols=frozenset()):
-        self._pending_initial_type_symbols = (
-            dict.fromkeys(initial_type_symbols, True)
-            | dict.fromkeys(self.initial_type_symbols, True)
-        )
-        return pycparser.c_parser.CParser.parse(self, text, filename)
+            initial_type_symbols=frozenset(), snapshot=None):
+        """Parse *text*. If *snapshot*, a
+        :class:`~pycparserext.snapshot.ParserSnapshot` taken by
+        :meth:`parse_prelude`, is given, parse it as if it followed the
+        prelude, whose declarations are not part of the result.
+        """
+        initial_scope = self._make_initial_scope(
+                initial_type_symbols, snapshot)
+
+        cache = self._get_cache()
+        if cache is None:
+            self.clex.input(text, filename)
+            return self._parse_token_source(self.clex, initial_scope)
+
+        cache_key = cache.key(self, text, filename, initial_scope)
+        ast = cache.get(cache_key)
+        if ast is not None:
+            return self._add_declaration_index(ast)
+
+        self.clex.input(text, filename)
+        ast = self._parse_token_source(self.clex, initial_scope)
+        cache.put(cache_key, ast)
+        return ast
+
+    def parse_file(self, path, encoding="utf-8",
+            initial_type_symbols=frozenset(), chunk_size=1 << 20,
+            snapshot=None):
+        """Parse the file at *path*, using *path* as the file name in
+        coordinates. *snapshot* is as for :meth:`parse`.
+
+        Unlike reading the file and passing its contents to :meth:`parse`,
+        this memory-maps the file and decodes and lexes it piecewise, so the
+        source text is never held in memory as a whole.
+
+        The cache, if any, is only consulted for UTF-8 input. Its entries are
+        shared with :meth:`parse`.
+        """
+        filename = os.fspath(path)
+
+        with open(filename, "rb") as inf:
+            if os.fstat(inf.fileno()).st_size == 0:
+                # empty files cannot be mapped
+                return self.parse("", filename,
+                        initial_type_symbols=initial_type_symbols,
+                        snapshot=snapshot)
+
+            with mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                initial_scope = self._make_initial_scope(
+                        initial_type_symbols, snapshot)
+
+                cache = self._get_cache()
+                if codecs.lookup(encoding).name != "utf-8":
+                    cache = None
+                if cache is not None:
+                    cache_key = cache.key(
+                            self, mm, filename, initial_scope)
+                    ast = cache.get(cache_key)
+                    if ast is not None:
+                        return self._add_declaration_index(ast)
+
+                self.clex.input("", filename)
+                ast = self._parse_token_source(
+                        _ChunkedTokenSource(
+                            self.clex,
+                            _iter_line_chunks(mm, encoding, chunk_size)),
+                        initial_scope)
+
+        if cache is not None:
+            cache.put(cache_key, ast)
+        return ast
+
+    def parse_prelude(self, text, filename="",
+            initial_type_symbols=frozenset(), snapshot=None):
+        """Parse *text*, e.g. preprocessed system headers, and return a
+        :class:`~pycparserext.snapshot.ParserSnapshot` of the resulting
+        file scope and AST, from which :meth:`parse` can start later on.
+        Giving a *snapshot* extends that one by *text*.
+
+        This does not use the cache, since the scope is not stored there.
+        Save the snapshot instead.
+        """
+        from pycparserext.snapshot import ParserSnapshot, _class_name
+
+        initial_scope = self._make_initial_scope(
+                initial_type_symbols, snapshot)
+        self.clex.input(text, filename)
+        ast = self._parse_token_source(self.clex, initial_scope)
+        if snapshot is not None:
+            ast = self._add_declaration_index(
+                    c_ast.FileAST(snapshot.ast.ext + ast.ext, ast.coord))
+
+        return ParserSnapshot(
+                _class_name(type(self)), self._scope_stack[0], ast)
+
+    def _make_token_stream(self, token_source):
+        return _GroupMatchingTokenStream(token_source)
+
+    def _parse_token_source(self, token_source, initial_scope):
+        """Parse a translation unit from *token_source*, which is either
+        the lexer, after its input has been set, or something standing in for
+        it. *initial_scope* is as returned by :meth:`_make_initial_scope`.
+        """
+        self._scope_stack = [dict(initial_scope)]
+        self._tokens = self._make_token_stream(token_source)
+        self._function_body_follows = False
+        self._clear_interned_attributes()
+
+        index = None
+        if self.index_declarations:
+            from pycparserext.decl_index import DeclarationIndex
+            index = DeclarationIndex()
+        self._declaration_index = index
+
+        ast = self._parse_translation_unit_or_empty()
+        tok = self._peek()
+        if tok is not None:
+            self._parse_error(f"before: {tok.value}", self._tok_coord(tok))
+
+        self._declaration_index = None
+        if index is not None:
+            ast = self._add_declaration_index(ast, index)
+        return ast
+
+    def _add_declaration_index(self, ast, index=None):
+        """Return *ast* as a :class:`FileASTExt` with *index*, if this parser
+        indexes declarations. If *index* is *None*, index *ast* now, e.g.
+        after loading it from the cache.
+        """
+        if not self.index_declarations:
+            return ast
+        if index is None:
+            from pycparserext.decl_index import DeclarationIndex
+            index = DeclarationIndex.from_ast(ast)
+
+        result = FileASTExt(ast.ext, ast.coord)
+        result.index = index
+        return result
 
-    def _parse_translation_unit_or_empty(self):
-        if hasattr(self, "_pending_initial_type_symbols"):
-            self._scope_stack[0].update(self._pending_initial_type_symbols)
-            del self._pending_initial_type_symbols
-        return super()._parse_translation_unit_or_empty()
+    def _parse_translation_unit(self):
+        tokens = self._tokens
+        index = self._declaration_index
+        ext = []
+        while self._peek() is not None:
+            nodes = self._parse_external_declaration()
+            ext.extend(nodes)
+            if index is not None:
+                for node in nodes:
+                    index.add(node)
+
+            # No backtracking reaches across external declarations, so the
+            # tokens consumed so far can be dropped.
+            tokens.discard_consumed()
+            self._scan_memo = None
+        return ext
+
+    # {{{ attribute interning
+
+    def _clear_interned_attributes(self):
+        """Start interning afresh, so that the table does not grow over the
+        lifetime of the parser.
+        """
+        if self._interned_attributes is not None:
+            self._interned_attributes = {}
+
+    def _attribute_key(self, node):
+        """Return a hashable key for *node* that is equal for structurally
+        identical nodes, ignoring coordinates.
+        """
+        attrs = []
+        for name in node.attr_names:
+            value = getattr(node, name)
+            attrs.append(tuple(value) if isinstance(value, list) else value)
+        return (type(node), tuple(attrs), tuple(
+                (name, self._attribute_key(child))
+                for name, child in node.children()))
+
+    def _intern_attributes(self, exprlist):
+        """Return the shared instance of the attribute list *exprlist* if
+        interning is enabled, else *exprlist* itself.
+        """
+        table = self._interned_attributes
+        if table is None:
+            return exprlist
+
+        key = self._attribute_key(exprlist)
+        try:
+            return table.setdefault(key, exprlist)
+        except TypeError:
+            # an unhashable attribute value
+            return exprlist
+
+    def _make_attribute_specifier(self, exprlist):
+        table = self._interned_attributes
+        if table is None:
+            return AttributeSpecifier(exprlist)
+
+        # The specifier keeps its list alive, so the id stays unique.
+        exprlist = self._intern_attributes(exprlist)
+        key = (AttributeSpecifier, id(exprlist))
+        spec = table.get(key)
+        if spec is None:
+            spec = table[key] = AttributeSpecifier(exprlist)
+        return spec
+
+    # }}}
+
+    # {{{ lazy function bodies and initializers
+
+    def _parse_compound_statement(self):
+        if self._function_body_follows:
+            self._function_body_follows = False
+            body = self._skip_braces("_parse_compound_statement")
+            if body is not None:
+                return body
+        return super()._parse_compound_statement()
+
+    def _parse_initializer(self):
+        # Lexing the '{' has opened a scope. If that is the only one below
+        # file scope, this is the initializer of a top-level declaration.
+        if (self.lazy_initializers
+                and self._peek_type() == "LBRACE"
+                and len(self._scope_stack) == 2):
+            init = self._skip_braces("_parse_initializer")
+            if init is not None:
+                return init
+        return super()._parse_initializer()
+
+    def _skip_braces(self, production):
+        """Skip the text of the braced group opened by the next token by
+        matching braces, without lexing it. Return a :class:`_LazyBraces`
+        to be parsed by the method *production*, or *None* if the group
+        needs to be lexed as usual.
+        """
+        tokens = self._tokens
+        clex = self.clex
+        buffer = tokens._buffer
+        if tokens._index != len(buffer) - 1 or clex._pending_tok is not None:
+            # The lexer is not right after the '{'.
+            return None
+
+        text = clex._lexdata
+        start = clex._pos - 1
+        if text[start] != "{":
+            return None
+
+        depth = 1
+        for match in _BRACES_SCAN_RE.finditer(text, start + 1):
+            kind = match.lastgroup
+            if kind == "brace":
+                if text[match.start()] == "{":
+                    depth += 1
+                else:
+                    depth -= 1
+                    if not depth:
+                        break
+            elif kind == "other":
+                return None
+        else:
+            # end of input, or of the chunk being lexed
+            return None
+
+        end = match.end()
+        nlines = text.count("\n", start, end)
+        if nlines:
+            clex._lineno += nlines
+            clex._line_start = text.rfind("\n", start, end) + 1
+        clex._pos = end
+        tokens._index += 1
+
+        lbrace = buffer[-1]
+        # These include the scope opened by the '{', holding the parameters
+        # in the case of a function body.
+        scopes = list(self._scope_stack)
+        # as the lexer would upon the '}'
+        self._lex_on_rbrace_func()
+
+        return _LazyBraces(
+                type(self), self._lazy_parser_kwargs(), production,
+                text[start:end], lbrace.lineno, lbrace.column,
+                clex.filename, scopes)
+
+    def _lazy_parser_kwargs(self):
+        """Return the keyword arguments for the parser that parses skipped
+        braces later on. Braces are only skipped at the top level, so that
+        one need not parse lazily itself.
+        """
+        return {"intern_attributes": self._interned_attributes is not None}
+
+    def _parse_lazy_braces(self, lazy_braces):
+        """Parse *lazy_braces* using this parser, which must not be in use
+        otherwise.
+        """
+        clex = self.clex
+        clex.input(lazy_braces.text, lazy_braces.filename)
+        clex._lineno = lazy_braces.lineno
+        clex._line_start = 1 - lazy_braces.column
+
+        self._tokens = self._make_token_stream(clex)
+        # Lexing the '{' again opens another scope, inside the ones seen
+        # before, which are only read. Names are looked up in the file scope
+        # as it is at the end of the translation unit, which only differs
+        # from the one at the '{' for names declared further on.
+        self._scope_stack = list(lazy_braces.scopes)
+        self._scan_memo = None
+        self._function_body_follows = False
+        return getattr(self, lazy_braces.production)()
+
+    def _build_declarations(self, spec, decls, typedef_namespace=False):
+        declarations = super()._build_declarations(
+                spec, decls, typedef_namespace)
+        if self.lazy_initializers:
+            declarations = [
+                    DeclExt.from_pycparser(decl)
+                    if isinstance(decl, c_ast.Decl)
+                    and isinstance(decl.init, _LazyBraces)
+                    else decl
+                    for decl in declarations]
+        return declarations
+
+    def _build_function_definition(self, spec, decl, param_decls, body):
+        func = super()._build_function_definition(
+                spec, decl, param_decls, body)
+        if isinstance(body, _LazyBraces):
+            func = FuncDefExt(
+                    decl=func.decl, param_decls=func.param_decls, body=body,
+                    coord=func.coord)
+        return func
+
+    # }}}
+
+    # {{{ else-if, conditional and assignment chains
+
+    # Generated code may chain thousands of "else if"s, "?:"s or
+    # assignments, which the productions in pycparser parse with one
+    # recursive call per link.
+
+    def _parse_selection_statement(self):
+        if self._peek_type() != "IF":
+            return super()._parse_selection_statement()
+
+        links = []
+        else_stmt = None
+        while True:
+            tok = self._advance()
+            self._expect("LPAREN")
+            cond = self._parse_expression()
+            self._expect("RPAREN")
+            then_stmt = self._parse_pragmacomp_or_statement()
+            links.append((cond, then_stmt, self._tok_coord(tok)))
+            if not self._accept("ELSE"):
+                break
+            if self._peek_type() != "IF":
+                else_stmt = self._parse_pragmacomp_or_statement()
+                break
+
+        for cond, then_stmt, coord in reversed(links):
+            else_stmt = c_ast.If(cond, then_stmt, else_stmt, coord)
+        return else_stmt
+
+    def _parse_conditional_expression(self):
+        links = []
+        expr = self._parse_binary_expression()
+        while self._accept("CONDOP"):
+            iftrue = self._parse_expression()
+            self._expect("COLON")
+            links.append((expr, iftrue))
+            expr = self._parse_binary_expression()
+
+        for cond, iftrue in reversed(links):
+            expr = c_ast.TernaryOp(cond, iftrue, expr, cond.coord)
+        return expr
+
+    def _parse_assignment_expression(self):
+        links = []
+        while True:
+            if (self._peek_type() == "LPAREN"
+                    and self._peek_type(2) == "LBRACE"):
+                # a GNU statement expression, which ends the chain
+                self._advance()
+                expr = self._parse_compound_statement()
+                self._expect("RPAREN")
+                break
+
+            expr = self._parse_conditional_expression()
+            if not self._is_assignment_op():
+                break
+            links.append((expr, self._advance().value))
+
+        for lvalue, op in reversed(links):
+            expr = c_ast.Assignment(op, lvalue, expr, lvalue.coord)
+        return expr
+
+    # }}}
 
     def _parse_attribute_list(self):
         exprs = [self._parse_attribute()]
@@ -354,7 +1149,7 @@ class CParserBase(pycparser.c_parser.CParser):
         while self._peek_type() in {"__ATTRIBUTE__", "__ATTRIBUTE"}:
             attr_list = self._parse_attribute_decl()
             result.exprs.extend(attr_list.exprs)
-        return result
+        return self._intern_attributes(result)
 
     def _parse_asm_keyword(self):
         tok = self._advance()
@@ -422,23 +1217,59 @@ _ATTRIBUTE_TOKENS = frozenset({"__ATTRIBUTE__", "__ATTRIBUTE"})
 class _AsmAndAttributesMixin:
     """Provides asm/attribute parsing for pycparser 3.0 recursive descent."""
 
+    # {{{ speculative scanning
+
+    # Declarator scans for nested declarators look at the same tokens again,
+    # so their results are remembered by token index for the current token
+    # stream.
+    _scan_memo = None
+
+    def _scan_memo_table(self):
+        """Return a dict mapping the token index at which a declarator scan
+        started to its result and the index at which it ended.
+        """
+        memo = self._scan_memo
+        if memo is None or memo[0] is not self._tokens:
+            memo = self._scan_memo = (self._tokens, {})
+        return memo[1]
+
+    def _scan_skip_to_group_end(self, open_index):
+        """In scan context: advance past the ')' matching the already
+        consumed '(' at token index *open_index*. Returns *False* if the end
+        of input is reached first.
+        """
+        tokens = self._tokens
+        end = tokens.group_end(open_index)
+        if end is None:
+            # at the end of input
+            tokens._index = len(tokens._buffer) - 1
+            return False
+        tokens._index = end
+        return True
+
     def _scan_skip_paren_group(self):
         """In scan context: skip a balanced group starting at '('."""
         if self._peek_type() != "LPAREN":
             return
+        open_index = self._tokens._index
         self._advance()
-        depth = 1
-        while depth > 0:
-            tok = self._peek()
-            if tok is None:
-                return
-            if tok.type == "LPAREN":
-                depth += 1
-            elif tok.type == "RPAREN":
-                depth -= 1
-            self._advance()
+        self._scan_skip_to_group_end(open_index)
 
     def _scan_declarator_name_info(self):
+        tokens = self._tokens
+        names = self._scan_memo_table()
+
+        start = tokens._index
+        result = names.get(start)
+        if result is None:
+            result = (*self._scan_declarator_name_info_uncached(),
+                    tokens._index)
+            names[start] = result
+        else:
+            tokens._index = result[2]
+        return result[:2]
+
+    def _scan_declarator_name_info_uncached(self):
         """Override to skip GNU type qualifiers and __attribute__ in scan."""
         from pycparser.c_parser import _TYPE_QUALIFIER
         saw_paren = False
@@ -460,27 +1291,18 @@ class _AsmAndAttributesMixin:
             return tok.type, saw_paren
         if tok.type == "LPAREN":
             saw_paren = True
+            open_index = self._tokens._index
             self._advance()
             tok_type, nested_paren = self._scan_declarator_name_info()
             if nested_paren:
                 saw_paren = True
-            depth = 1
-            while True:
-                tok = self._peek()
-                if tok is None:
-                    return None, saw_paren
-                if tok.type == "LPAREN":
-                    depth += 1
-                elif tok.type == "RPAREN":
-                    depth -= 1
-                    self._advance()
-                    if depth == 0:
-                        break
-                    continue
-                self._advance()
+            if not self._scan_skip_to_group_end(open_index):
+                return None, saw_paren
             return tok_type, saw_paren
         return None, saw_paren
 
+    # }}}
+
     def _parse_typeof_specifier(self, typeof_tok):
         coord = self._tok_coord(typeof_tok)
         self._expect("LPAREN")
@@ -508,11 +1330,12 @@ class _AsmAndAttributesMixin:
         asm_label = self._parse_asm_label_opt()
         attrs_after_direct = self._parse_attributes_opt()
 
-        # Merge attribute lists
+        # Merge attribute lists, which may be shared
         if attrs_before_direct is not None and attrs_before_direct.exprs:
             attrs = attrs_before_direct
             if attrs_after_direct.exprs:
-                attrs.exprs.extend(attrs_after_direct.exprs)
+                attrs = self._intern_attributes(c_ast.ExprList(
+                    attrs.exprs + attrs_after_direct.exprs, attrs.coord))
         else:
             attrs = attrs_after_direct
 
@@ -571,7 +1394,15 @@ class _AsmAndAttributesMixin:
             coord=base_decl.coord,
         )
 
-        if self._peek_type() == "LBRACE" and func.args is not None:
+        if self._peek_type() != "LBRACE":
+            return func
+
+        # Lexing the '{' has opened the scope of the body. If that is the
+        # only scope below file scope, this is a top-level definition.
+        self._function_body_follows = (
+                self.lazy_function_bodies and len(self._scope_stack) == 2)
+
+        if func.args is not None:
             for param in func.args.params:
                 if isinstance(param, c_ast.EllipsisParam):
                     break
@@ -611,7 +1442,8 @@ class _AsmAndAttributesMixin:
                 if all_exprs and isinstance(st, c_ast.Struct):
                     all_attrs = c_ast.ExprList(all_exprs, self._tok_coord(tok))
                     struct_ext = StructExt.from_pycparser(st)
-                    struct_ext.attrib = AttributeSpecifier(all_attrs)
+                    struct_ext.attrib = self._make_attribute_specifier(
+                            all_attrs)
                     return struct_ext
                 return st
 
@@ -630,7 +1462,7 @@ class _AsmAndAttributesMixin:
 
             if attrs_before.exprs and isinstance(st, c_ast.Struct):
                 struct_ext = StructExt.from_pycparser(st)
-                struct_ext.attrib = AttributeSpecifier(attrs_before)
+                struct_ext.attrib = self._make_attribute_specifier(attrs_before)
                 return struct_ext
             return st
 
@@ -650,7 +1482,8 @@ class _AsmAndAttributesMixin:
 
         if leading_attrs.exprs:
             spec = self._add_declaration_specifier(
-                spec, AttributeSpecifier(leading_attrs), "function", append=True)
+                spec, self._make_attribute_specifier(leading_attrs), "function",
+                append=True)
 
         assert "typedef" not in spec.get("storage", [])
 
@@ -670,7 +1503,8 @@ class _AsmAndAttributesMixin:
                         if not isinstance(st, StructExt):
                             st = StructExt.from_pycparser(st)
                             decl.type = st
-                        st.attrib = AttributeSpecifier(trailing_attrs)
+                        st.attrib = self._make_attribute_specifier(
+                                trailing_attrs)
             return result
 
         if len(spec["type"]) == 1:
@@ -681,7 +1515,8 @@ class _AsmAndAttributesMixin:
                     if not isinstance(node, StructExt):
                         node = StructExt.from_pycparser(node)
                         spec["type"][0] = node
-                    node.attrib = AttributeSpecifier(trailing_attrs)
+                    node.attrib = self._make_attribute_specifier(
+                            trailing_attrs)
                     decl_type = node
             else:
                 decl_type = c_ast.IdentifierType(node)
@@ -837,7 +1672,8 @@ class GnuCParser(_AsmAndAttributesMixin, CParserBase):
                 if first_coord is None:
                     first_coord = self._tok_coord(tok)
                 spec = self._add_declaration_specifier(
-                    spec, AttributeSpecifier(self._parse_attribute_decl()),
+                    spec, self._make_attribute_specifier(
+                        self._parse_attribute_decl()),
                     "function", append=True)
                 continue
 
@@ -1269,7 +2105,8 @@ class OpenCLCParser(_AsmAndAttributesMixin, CParserBase):
                 if first_coord is None:
                     first_coord = self._tok_coord(tok)
                 spec = self._add_declaration_specifier(
-                    spec, AttributeSpecifier(self._parse_attribute_decl()),
+                    spec, self._make_attribute_specifier(
+                        self._parse_attribute_decl()),
                     "function", append=True)
                 continue
 
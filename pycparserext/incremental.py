@@ -0,0 +1,394 @@
+from __future__ import annotations
+
+import re
+from typing import NamedTuple
+
+from pycparser import c_ast
+from pycparser.c_parser import Coord
+
+from pycparserext.structural import _iter_subnodes, _node_fields
+
+
+# {{{ helpers
+
+_COMPARE_BLOCK = 1 << 16
+
+
+def _common_prefix_len(a, b):
+    n = min(len(a), len(b))
+    lo = 0
+    # Skip over equal blocks quickly, then narrow down within the block
+    # that differs.
+    while lo < n:
+        hi = min(lo + _COMPARE_BLOCK, n)
+        if a[lo:hi] != b[lo:hi]:
+            break
+        lo = hi
+    else:
+        return n
+
+    hi = min(lo + _COMPARE_BLOCK, n)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix_len(a, b, limit):
+    la = len(a)
+    lb = len(b)
+    n = min(limit, la, lb)
+    lo = 0
+    while lo < n:
+        hi = min(lo + _COMPARE_BLOCK, n)
+        if a[la-hi:la-lo] != b[lb-hi:lb-lo]:
+            break
+        lo = hi
+    else:
+        return n
+
+    hi = min(lo + _COMPARE_BLOCK, n)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[la-mid:la-lo] == b[lb-mid:lb-lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+_MISSING = object()
+
+
+def _shift_coords(nodes, line_delta, shared_ids):
+    """Return copies of *nodes* and the nodes below them, with line numbers
+    shifted by *line_delta*. The nodes and coordinates passed in are left
+    unchanged, since they belong to the previously returned AST. Nodes
+    whose id is in *shared_ids* (interned attribute lists) are shared across
+    regions, and are neither copied nor shifted.
+    """
+    # pre-order, so that reversing it lists descendants before ancestors
+    order = []
+    seen = set(shared_ids)
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        order.append(node)
+        for name, _ in _node_fields(type(node))[1]:
+            stack.extend(_iter_subnodes(getattr(node, name, None)))
+
+    copies = {}
+    new_coords = {}
+
+    def substitute(value):
+        if isinstance(value, c_ast.Node):
+            return copies.get(id(value), value)
+        if isinstance(value, list):
+            return [substitute(item) for item in value]
+        if isinstance(value, tuple):
+            return tuple(substitute(item) for item in value)
+        return value
+
+    for node in reversed(order):
+        cls = type(node)
+        new_node = cls.__new__(cls)
+        for name, _ in _node_fields(cls)[1]:
+            value = getattr(node, name, _MISSING)
+            if value is not _MISSING:
+                setattr(new_node, name, substitute(value))
+
+        coord = node.coord
+        if coord is not None:
+            # Coord objects are shared between nodes, keep them shared.
+            new_coord = new_coords.get(id(coord))
+            if new_coord is None:
+                new_coord = new_coords[id(coord)] = Coord(
+                        coord.file, coord.line + line_delta, coord.column)
+            coord = new_coord
+        new_node.coord = coord
+
+        copies[id(node)] = new_node
+
+    return [copies.get(id(node), node) for node in nodes]
+
+
+# Only __setitem__ needs overriding, and the parser looks names up in its
+# scopes in its innermost loops, which is faster on a dict than through the
+# methods of a collections.UserDict.
+class _RecordingScope(dict):
+    """File scope of the parser that remembers which names were (re)defined
+    while parsing one top-level declaration.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.changes = []
+
+    def __setitem__(self, name, is_type):
+        self.changes.append((name, is_type))
+        super().__setitem__(name, is_type)
+
+
+class _Region(NamedTuple):
+    """One or more top-level declarations, along with the text preceding
+    them. A region ends at a point where the lexer holds no look-ahead, so
+    that parsing may be resumed from there.
+    """
+
+    end: int
+    ext: list
+    scope_changes: list
+
+    # lexer state at *end*
+    lineno: int
+    column: int
+    filename: str
+
+    has_directive: bool
+
+# }}}
+
+
+class IncrementalParser:
+    """Re-parses a translation unit after edits, reusing the results for
+    unchanged top-level declarations.
+
+    The text is split into regions at top-level declaration boundaries.
+    For each region, the resulting :attr:`pycparser.c_ast.FileAST.ext`
+    entries and the changes it made to the file-level typedef scope are
+    remembered. On the next call to :meth:`parse`, regions before the first
+    edit are reused outright. Parsing resumes after them and stops as soon
+    as it reaches a region boundary after the last edit at which the typedef
+    scope agrees with the one seen in the previous parse; the remaining
+    regions are then reused, with line numbers adjusted if needed.
+
+    Reused nodes are shared with the previously returned AST, except in
+    regions whose line numbers have changed, which are copied. Interned
+    attribute lists (see *intern_attributes* of
+    :class:`~pycparserext.ext_c_parser.CParserBase`) keep the coordinates of
+    their first occurrence.
+
+    If *parser* indexes declarations (see *index_declarations* of
+    :class:`~pycparserext.ext_c_parser.CParserBase`), :meth:`parse` returns
+    a :class:`~pycparserext.ext_c_parser.FileASTExt`, whose index is built
+    anew on each call.
+
+    .. attribute:: n_reused
+    .. attribute:: n_reparsed
+
+        The number of regions reused from, resp. parsed after, the previous
+        call to :meth:`parse`.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+
+        self._text = None
+        self._filename = None
+        self._initial_scope = None
+        self._regions = None
+
+        self.n_reused = 0
+        self.n_reparsed = 0
+
+    def _start_lexing(self, text, filename, pos, lineno, column, scope):
+        parser = self.parser
+        clex = parser.clex
+
+        parser._scope_stack = [scope]
+        clex.input(text, filename)
+        clex._pos = pos
+        clex._lineno = lineno
+        clex._line_start = pos - column
+        parser._tokens = parser._make_token_stream(clex)
+
+    def _parse_region(self, text):
+        """Parse external declarations up to the next resumable boundary.
+        Returns *None* at the end of input.
+        """
+        parser = self.parser
+        clex = parser.clex
+        tokens = parser._tokens
+        scope = parser._scope_stack[0]
+        start = clex._pos
+
+        if parser._peek() is None:
+            return None
+
+        ext = []
+        scope.changes = []
+        while True:
+            ext.extend(parser._parse_external_declaration())
+
+            if (tokens._index == len(tokens._buffer)
+                    and clex._pending_tok is None
+                    and len(parser._scope_stack) == 1):
+                break
+
+            if parser._peek() is None:
+                break
+
+        end = clex._pos
+        self.n_reparsed += 1
+        return _Region(
+                end=end,
+                ext=ext,
+                scope_changes=scope.changes,
+                lineno=clex._lineno,
+                column=end - clex._line_start,
+                filename=clex.filename,
+                has_directive=text.find("#", start, end) != -1)
+
+    def parse(self, text, filename="", initial_type_symbols=frozenset(),
+            snapshot=None):
+        parser = self.parser
+        initial_scope = parser._make_initial_scope(
+                initial_type_symbols, snapshot)
+
+        self.n_reused = 0
+        self.n_reparsed = 0
+
+        old_text = self._text
+        old_regions = self._regions
+        if (old_regions is None
+                or filename != self._filename
+                or initial_scope != self._initial_scope):
+            old_text = ""
+            old_regions = []
+
+        # {{{ reuse unchanged leading regions
+
+        prefix_len = _common_prefix_len(old_text, text)
+        if prefix_len == len(old_text) == len(text):
+            nprefix = len(old_regions)
+        else:
+            nprefix = 0
+            while (nprefix < len(old_regions)
+                    and old_regions[nprefix].end < prefix_len):
+                nprefix += 1
+
+        regions = list(old_regions[:nprefix])
+        self.n_reused += nprefix
+
+        base_scope = dict(initial_scope)
+        for region in regions:
+            base_scope.update(region.scope_changes)
+
+        # }}}
+
+        suffix_len = _common_suffix_len(
+                old_text, text, min(len(old_text), len(text)) - prefix_len)
+        delta = len(text) - len(old_text)
+        old_boundaries = {
+                region.end: i
+                for i, region in enumerate(old_regions)
+                if i >= nprefix and region.end >= len(old_text) - suffix_len}
+
+        if regions:
+            last = regions[-1]
+            resume_at = (last.end, last.lineno, last.column, last.filename)
+        else:
+            resume_at = (0, 1, 0, filename)
+
+        scope = _RecordingScope(base_scope)
+        self._start_lexing(text, resume_at[3], *resume_at[:3], scope)
+
+        # names whose meaning may differ between old and new parse
+        dirty = set()
+        # scope changes made by old regions that were skipped over
+        old_overlay = {}
+        next_old = nprefix
+
+        while True:
+            region = self._parse_region(text)
+            if region is None:
+                break
+            regions.append(region)
+            dirty.update(name for name, _ in region.scope_changes)
+
+            # {{{ try to resynchronize with the old parse
+
+            old_end = region.end - delta
+            iold = old_boundaries.get(old_end)
+            if iold is None:
+                continue
+
+            for old_region in old_regions[next_old:iold+1]:
+                old_overlay.update(old_region.scope_changes)
+                dirty.update(name for name, _ in old_region.scope_changes)
+            next_old = iold + 1
+
+            old_region = old_regions[iold]
+            if (old_region.filename != region.filename
+                    or old_region.column != region.column):
+                continue
+
+            # Names that still mean something different than they did in
+            # the old parse. Old regions mentioning any of them need to be
+            # parsed again.
+            missing = object()
+            stale = [
+                    name for name in dirty
+                    if scope.get(name, missing)
+                    != old_overlay.get(name, base_scope.get(name, missing))]
+            stale_re = None
+            if stale:
+                stale_re = re.compile(r"(?<![\w$])(?:%s)(?![\w$])"
+                        % "|".join(re.escape(name) for name in stale))
+
+            line_delta = region.lineno - old_region.lineno
+            interned = parser._interned_attributes
+            shared_ids = (
+                    {id(node) for node in interned.values()}
+                    if line_delta and interned else ())
+
+            for old_region in old_regions[iold+1:]:
+                start = regions[-1].end
+                end = old_region.end + delta
+
+                if line_delta and old_region.has_directive:
+                    # A #line directive inside this region may reset line
+                    # numbering, so shifting is not safe.
+                    break
+                if stale_re is not None and stale_re.search(text, start, end):
+                    break
+
+                ext = old_region.ext
+                if line_delta:
+                    ext = _shift_coords(ext, line_delta, shared_ids)
+
+                regions.append(old_region._replace(
+                        end=end,
+                        ext=ext,
+                        lineno=old_region.lineno + line_delta))
+                dict.update(scope, old_region.scope_changes)
+                old_overlay.update(old_region.scope_changes)
+                self.n_reused += 1
+                next_old += 1
+            else:
+                break
+
+            last = regions[-1]
+            self._start_lexing(
+                    text, last.filename, last.end, last.lineno, last.column,
+                    scope)
+
+            # }}}
+
+        # Only record state once parsing has succeeded.
+        self._text = text
+        self._filename = filename
+        self._initial_scope = initial_scope
+        self._regions = regions
+
+        return parser._add_declaration_index(c_ast.FileAST(
+                [node for region in regions for node in region.ext]))
+
+
+# vim: fdm=marker
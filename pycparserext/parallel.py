@@ -0,0 +1,465 @@
+from __future__ import annotations
+
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import NamedTuple
+
+from pycparser import c_ast
+from pycparser.c_parser import ParseError
+
+from pycparserext.ext_c_parser import GnuCParser
+
+
+class ParseResult(NamedTuple):
+    """The outcome of parsing one input of :func:`parse_many`.
+
+    .. attribute:: index
+
+        The position of the input in the sequence passed to
+        :func:`parse_many`.
+
+    .. attribute:: source
+
+        The path that was read, or *None* if the input was given as text.
+
+    .. attribute:: ast
+
+        The resulting :class:`pycparser.c_ast.FileAST`, or *None* on error.
+
+    .. attribute:: error
+
+        *None* on success, otherwise the error message. For parse errors,
+        this starts with the coordinates of the error. For exceptions other
+        than parse errors and errors reading the file, e.g.
+        :exc:`RecursionError`, it starts with the name of the exception.
+    """
+
+    index: int
+    source: str | None
+    ast: c_ast.FileAST | None
+    error: str | None
+
+
+# {{{ worker side
+
+_worker_parser = None
+
+
+def _init_worker(parser_class, parser_kwargs):
+    global _worker_parser
+    _worker_parser = parser_class(**parser_kwargs)
+
+
+def _source_path(source):
+    return os.fspath(source) if isinstance(source, os.PathLike) else None
+
+
+def _error_message(exc):
+    if isinstance(exc, (ParseError, OSError)):
+        return str(exc)
+    return "%s: %s" % (type(exc).__name__, exc)
+
+
+def _parse_one(parser, index, source, parse_kwargs):
+    path = _source_path(source)
+    try:
+        if path is not None:
+            with open(path) as inf:
+                text = inf.read()
+            parse_kwargs = {"filename": path, **parse_kwargs}
+        else:
+            text = source
+
+        ast = parser.parse(text, **parse_kwargs)
+    # Whatever goes wrong with one input is reported for that input alone.
+    except Exception as e:
+        return ParseResult(index, path, None, _error_message(e))
+
+    return ParseResult(index, path, ast, None)
+
+
+def _parse_in_worker(index, source, parse_kwargs):
+    return _parse_one(_worker_parser, index, source, parse_kwargs)
+
+
+def _parse_chunk_in_worker(text, filename, initial_type_symbols):
+    try:
+        return _worker_parser.parse(
+                text, filename, initial_type_symbols=initial_type_symbols).ext
+    except ParseError:
+        return None
+
+# }}}
+
+
+def parse_many(sources, parser_class=GnuCParser, workers=None,
+        parser_kwargs=None, **parse_kwargs):
+    """Parse many independent translation units on a pool of processes.
+
+    :arg sources: an iterable of inputs. Each is either an
+        :class:`os.PathLike` (such as :class:`pathlib.Path`), which is read
+        in the worker and used as the file name, or a :class:`str`
+        containing the source text itself.
+    :arg parser_class: the parser to use, e.g.
+        :class:`~pycparserext.ext_c_parser.GnuCParser` or
+        :class:`~pycparserext.ext_c_parser.OpenCLCParser`.
+    :arg workers: the number of worker processes, defaulting to the number
+        of CPUs. Each worker constructs one parser instance and reuses it for
+        all the inputs it handles. With *workers=1*, parsing happens in the
+        calling process.
+    :arg parser_kwargs: keyword arguments for *parser_class*.
+    :arg parse_kwargs: further keyword arguments are passed to
+        :meth:`~pycparserext.ext_c_parser.CParserBase.parse`.
+
+    :returns: a generator of :class:`ParseResult` instances, yielded in the
+        order in which parsing finishes. Errors are reported per input,
+        including those that occur while sending a result back from a
+        worker. *sources* is consumed as parsing proceeds, with at most
+        twice as many inputs handed out as there are workers.
+    """
+    if parser_kwargs is None:
+        parser_kwargs = {}
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers == 1:
+        parser = parser_class(**parser_kwargs)
+        for index, source in enumerate(sources):
+            yield _parse_one(parser, index, source, parse_kwargs)
+        return
+
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(parser_class, parser_kwargs)) as executor:
+        max_pending = 2 * workers
+        inputs = enumerate(sources)
+        pending = {}
+
+        try:
+            while True:
+                for index, source in islice(
+                        inputs, max_pending - len(pending)):
+                    future = executor.submit(
+                            _parse_in_worker, index, source, parse_kwargs)
+                    pending[future] = (index, source)
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, source = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = ParseResult(
+                                index, _source_path(source), None,
+                                _error_message(e))
+                    yield result
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+# {{{ splitting a translation unit at top-level boundaries
+
+_TOPLEVEL_SCAN_RE = re.compile(r"""
+    "(?:\\.|[^"\\\n])*"
+    | '(?:\\.|[^'\\\n])*'
+    | //[^\n]*
+    | ^[ \t]*\#(?P<directive>[^\n]*)
+    | (?P<word>\b(?:typedef|__attribute__|__attribute)\b)
+    | (?P<punct>[{}();=])
+    """, re.MULTILINE | re.VERBOSE)
+
+_LINE_DIRECTIVE_RE = re.compile(r"\s*(?:line\s+)?(\d+)(?:\s+\"([^\"]*)\")?")
+
+_DIRECTIVE_LINE_RE = re.compile(r"^[ \t]*#[^\n]*$", re.MULTILINE)
+
+
+class _Boundary(NamedTuple):
+    """The end of a top-level declaration, with the coordinates that the
+    lexer would assign to the text following it.
+    """
+
+    offset: int
+    lineno: int
+    column: int
+    filename: str
+
+
+def _scan_toplevel(text, filename):
+    """Find the ends of top-level declarations and the extents of typedef
+    declarations by scanning *text* for braces, parentheses, semicolons and
+    a few keywords, without lexing it fully.
+
+    Returns a tuple *(boundaries, typedefs)*. *typedefs* is a list of
+    *(start, end)* offsets of the declarations containing a ``typedef``.
+    """
+    boundaries = []
+    typedefs = []
+
+    depth = 0
+    paren_depth = 0
+    stmt_start = 0
+    saw_typedef = False
+    saw_equals = False
+
+    # A '{' at depth 0 opens a function body if it directly follows the
+    # ')' of a parameter list (as opposed to that of an __attribute__, or
+    # a struct/union/enum tag or an '='). Only then does the matching '}'
+    # end the declaration.
+    attribute_end = None
+    group_is_attribute = False
+    last_group_end = None
+    in_function_body = False
+
+    # physical line -> logical line mapping, as changed by #line
+    phys_line = 1
+    phys_pos = 0
+    logical_base = 1
+    logical_base_phys = 1
+    cur_filename = filename
+
+    def boundary(offset):
+        nonlocal phys_line, phys_pos
+        phys_line += text.count("\n", phys_pos, offset)
+        phys_pos = offset
+        line_start = text.rfind("\n", 0, offset) + 1
+        return _Boundary(
+                offset,
+                logical_base + phys_line - logical_base_phys,
+                offset - line_start,
+                cur_filename)
+
+    def end_statement(offset):
+        nonlocal stmt_start, saw_typedef, saw_equals, last_group_end
+        if saw_typedef:
+            typedefs.append((stmt_start, offset))
+        boundaries.append(boundary(offset))
+        stmt_start = offset
+        saw_typedef = False
+        saw_equals = False
+        last_group_end = None
+
+    for match in _TOPLEVEL_SCAN_RE.finditer(text):
+        directive = match.group("directive")
+        if directive is not None:
+            line_match = _LINE_DIRECTIVE_RE.match(directive)
+            if line_match is not None:
+                phys_line += text.count("\n", phys_pos, match.start())
+                phys_pos = match.start()
+                logical_base = int(line_match.group(1))
+                logical_base_phys = phys_line + 1
+                if line_match.group(2) is not None:
+                    cur_filename = line_match.group(2)
+            continue
+
+        if depth == 0:
+            word = match.group("word")
+            if word == "typedef":
+                saw_typedef = True
+            elif word is not None:
+                attribute_end = match.end()
+
+        punct = match.group("punct")
+        if punct is None:
+            continue
+
+        if punct == "{":
+            if depth == 0:
+                in_function_body = (
+                        not saw_equals
+                        and last_group_end is not None
+                        and not group_is_attribute
+                        and not text[last_group_end:match.start()].strip())
+            depth += 1
+        elif punct == "}":
+            depth -= 1
+            if depth == 0 and in_function_body:
+                in_function_body = False
+                end_statement(match.end())
+        elif depth == 0:
+            if punct == "(":
+                if paren_depth == 0:
+                    group_is_attribute = (
+                            attribute_end is not None
+                            and not text[attribute_end:match.start()].strip())
+                paren_depth += 1
+            elif punct == ")":
+                paren_depth -= 1
+                if paren_depth == 0:
+                    last_group_end = match.end()
+            elif punct == ";":
+                end_statement(match.end())
+            elif punct == "=":
+                saw_equals = True
+
+    return boundaries, typedefs
+
+
+def _collect_typedef_names(parser_class, parser_kwargs, text, typedefs,
+        initial_type_symbols):
+    """Parse just the typedef declarations in *text*, in order, and return
+    the list of names each of them declares.
+    """
+    parser = parser_class(**parser_kwargs)
+    parser.reset(initial_type_symbols)
+
+    result = []
+    for start, end in typedefs:
+        # A misdetected boundary may have merged further declarations into
+        # this one, so parse all of them.
+        parser.clex.input(_DIRECTIVE_LINE_RE.sub("", text[start:end]))
+        parser._tokens = parser._make_token_stream(parser.clex)
+        names = []
+        while parser._peek() is not None:
+            names.extend(
+                decl.name for decl in parser._parse_external_declaration()
+                if isinstance(decl, c_ast.Typedef))
+        result.append(names)
+
+    return result
+
+
+def _chunk_scopes_agree(chunks, chunk_exts, initial_type_symbols):
+    """Return whether each chunk was parsed knowing exactly the typedef names
+    that the chunks before it declare, and no name declared in file scope
+    changes between a typedef name and an ordinary identifier across chunks.
+    A sequential parse raises an error for the latter, so the chunks must
+    not be trusted then.
+    """
+    from pycparserext.decl_index import DeclarationIndex
+
+    scope = dict.fromkeys(initial_type_symbols, True)
+    for (_, chunk_types), chunk_ext in zip(chunks, chunk_exts, strict=True):
+        if chunk_types != {name for name, is_type in scope.items() if is_type}:
+            return False
+
+        index = DeclarationIndex()
+        for node in chunk_ext:
+            index.add(node)
+        for name, decl in index.items():
+            is_type = decl.kind == "typedef"
+            if scope.setdefault(name, is_type) != is_type:
+                return False
+
+    return True
+
+# }}}
+
+
+def parse_parallel(text, parser_class=GnuCParser, filename="", workers=None,
+        parser_kwargs=None, initial_type_symbols=frozenset(),
+        min_chunk_size=1 << 16):
+    """Parse a single large translation unit by splitting it into chunks at
+    top-level declaration boundaries and parsing the chunks on a pool of
+    processes.
+
+    Boundaries are found by a cheap scan for braces and semicolons at brace
+    depth zero. Before the chunks are handed out, the typedef declarations
+    alone are parsed in order, so that each chunk starts out knowing the
+    typedef names declared before it. Coordinates in the result are the same
+    as for a sequential parse.
+
+    If any chunk fails to parse, e.g. because a boundary was misdetected,
+    or if the file-scope declarations of the parsed chunks show that a chunk
+    started out with the wrong typedef names, or that a name was redeclared
+    as a different kind of identifier, the whole text is parsed
+    sequentially. So the result (or the error raised) is the same as for
+    :meth:`~pycparserext.ext_c_parser.CParserBase.parse`.
+
+    :arg workers: the number of worker processes, defaulting to the number
+        of CPUs.
+    :arg min_chunk_size: chunks are at least this many characters long.
+    """
+    if parser_kwargs is None:
+        parser_kwargs = {}
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    def parse_sequentially():
+        return parser_class(**parser_kwargs).parse(
+                text, filename, initial_type_symbols=initial_type_symbols)
+
+    if workers == 1 or len(text) < 2*min_chunk_size or '"' in filename:
+        return parse_sequentially()
+
+    boundaries, typedefs = _scan_toplevel(text, filename)
+
+    # {{{ pick chunks
+
+    chunk_size = max(min_chunk_size, len(text) // (4 * workers))
+
+    chunk_starts = [_Boundary(0, 1, 0, filename)]
+    for bdry in boundaries:
+        if (bdry.offset - chunk_starts[-1].offset >= chunk_size
+                and len(text) - bdry.offset >= min_chunk_size):
+            chunk_starts.append(bdry)
+
+    if len(chunk_starts) < 2:
+        return parse_sequentially()
+
+    # }}}
+
+    try:
+        typedef_names = _collect_typedef_names(
+                parser_class, parser_kwargs, text, typedefs,
+                initial_type_symbols)
+    except ParseError:
+        return parse_sequentially()
+
+    chunks = []
+    known_types = set(initial_type_symbols)
+    itypedef = 0
+    for i, start in enumerate(chunk_starts):
+        while (itypedef < len(typedefs)
+                and typedefs[itypedef][1] <= start.offset):
+            known_types.update(typedef_names[itypedef])
+            itypedef += 1
+
+        end = (chunk_starts[i+1].offset
+                if i + 1 < len(chunk_starts) else len(text))
+        if i == 0:
+            chunk_text = text[:end]
+        else:
+            # Make the lexer assign the same coordinates as it would when
+            # parsing the whole text.
+            chunk_text = '#line %d "%s"\n%s%s' % (
+                    start.lineno, start.filename, " " * start.column,
+                    text[start.offset:end])
+        chunks.append((chunk_text, frozenset(known_types)))
+
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(parser_class, parser_kwargs)) as executor:
+        futures = [
+                executor.submit(
+                    _parse_chunk_in_worker, chunk_text, filename, chunk_types)
+                for chunk_text, chunk_types in chunks]
+
+        chunk_exts = []
+        for future in futures:
+            chunk_ext = future.result()
+            if chunk_ext is None:
+                for future in futures:
+                    future.cancel()
+                break
+            chunk_exts.append(chunk_ext)
+        else:
+            if _chunk_scopes_agree(chunks, chunk_exts, initial_type_symbols):
+                # e.g. with index_declarations=True, return what a sequential
+                # parse would
+                return parser_class(**parser_kwargs)._add_declaration_index(
+                        c_ast.FileAST([
+                            node
+                            for chunk_ext in chunk_exts
+                            for node in chunk_ext]))
+
+    return parse_sequentially()
+
+
+# vim: fdm=marker
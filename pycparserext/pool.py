@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from pycparserext.ext_c_parser import GnuCParser
+
+
+class ParserPool:
+    """A bounded pool of parsers to share between threads, e.g. those of a
+    server handling requests concurrently.
+
+    A parser is only ever used by one thread at a time. Parsers are created
+    as needed, up to *max_size* of them, and reused most recently returned
+    first. Each parser is :meth:`~pycparserext.ext_c_parser.CParserBase.reset`
+    when it is returned to the pool, so that it holds on to nothing from
+    the previous parse, even if that failed.
+
+    :arg parser_class: the parser to use, e.g.
+        :class:`~pycparserext.ext_c_parser.GnuCParser` or
+        :class:`~pycparserext.ext_c_parser.OpenCLCParser`.
+    :arg max_size: the maximum number of parsers, defaulting to the number
+        of CPUs.
+    :arg parser_kwargs: keyword arguments for *parser_class*.
+    """
+
+    def __init__(self, parser_class=GnuCParser, max_size=None,
+            parser_kwargs=None):
+        if parser_kwargs is None:
+            parser_kwargs = {}
+        if max_size is None:
+            max_size = os.cpu_count() or 1
+        if max_size < 1:
+            raise ValueError("max_size must be positive")
+
+        self.parser_class = parser_class
+        self.parser_kwargs = parser_kwargs
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        self._available = threading.Semaphore(max_size)
+        self._idle = []
+        self._size = 0
+
+    @property
+    def size(self):
+        """The number of parsers created so far."""
+        return self._size
+
+    def acquire(self, timeout=None):
+        """Take a parser out of the pool, waiting for one to be returned if
+        *max_size* parsers are in use. Raises :exc:`TimeoutError` if none
+        becomes available within *timeout* seconds.
+
+        The parser must be given back using :meth:`release`.
+        """
+        if not self._available.acquire(timeout=timeout):
+            raise TimeoutError("no parser became available")
+
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self._size += 1
+
+        try:
+            return self.parser_class(**self.parser_kwargs)
+        except BaseException:
+            with self._lock:
+                self._size -= 1
+            self._available.release()
+            raise
+
+    def release(self, parser):
+        """Return *parser*, obtained from :meth:`acquire`, to the pool."""
+        parser.reset()
+        with self._lock:
+            self._idle.append(parser)
+        self._available.release()
+
+    @contextmanager
+    def parser(self, timeout=None):
+        """Return a context manager that takes a parser out of the pool
+        using :meth:`acquire` and returns it on exit::
+
+            with pool.parser() as parser:
+                ast = parser.parse(text)
+        """
+        parser = self.acquire(timeout)
+        try:
+            yield parser
+        finally:
+            self.release(parser)
+
+    def parse(self, text, filename="", **kwargs):
+        """Parse *text* with a parser from the pool. Further keyword
+        arguments are passed to
+        :meth:`~pycparserext.ext_c_parser.CParserBase.parse`.
+        """
+        with self.parser() as parser:
+            return parser.parse(text, filename, **kwargs)
+
+    async def parse_async(self, text, filename="", executor=None, **kwargs):
+        """Like :meth:`parse`, but run in *executor* (by default, that of
+        the event loop), so that the event loop keeps running meanwhile.
+        *executor* must run its tasks in threads of this process.
+
+        Parsing holds the global interpreter lock, so parsing on several
+        threads does not make it faster.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+                executor, partial(self.parse, text, filename, **kwargs))
+
+
+# vim: fdm=marker
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from time import perf_counter
+
+
+LEXER_ENTRY = "<lexer>"
+
+
+class ProfileEntry:
+    """Statistics for one grammar production, or for the lexer.
+
+    .. attribute:: calls
+    .. attribute:: cumulative_time
+
+        Time spent in the production including everything it called, in
+        seconds. Recursive calls are only counted once.
+
+    .. attribute:: self_time
+
+        Time spent in the production excluding other profiled productions
+        and the lexer.
+
+    .. attribute:: backtracks
+
+        How often the production rewound the token stream to retry from an
+        earlier position.
+
+    .. attribute:: rewound_tokens
+
+        The total number of tokens given back by those rewinds.
+    """
+
+    __slots__ = ("backtracks", "calls", "cumulative_time", "rewound_tokens",
+            "self_time")
+
+    def __init__(self):
+        self.calls = 0
+        self.cumulative_time = 0.0
+        self.self_time = 0.0
+        self.backtracks = 0
+        self.rewound_tokens = 0
+
+    def __repr__(self):
+        return ("ProfileEntry(calls=%d, cumulative_time=%g, self_time=%g, "
+                "backtracks=%d, rewound_tokens=%d)" % (
+                    self.calls, self.cumulative_time, self.self_time,
+                    self.backtracks, self.rewound_tokens))
+
+
+class ParseProfile:
+    """The result of profiling with :meth:`CParserBase.profile
+    <pycparserext.ext_c_parser.CParserBase.profile>`.
+
+    .. attribute:: entries
+
+        A :class:`dict` mapping method names (such as
+        ``"_parse_declaration_specifiers"``) and :data:`LEXER_ENTRY` to
+        :class:`ProfileEntry` instances.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    @property
+    def tokens(self):
+        """The number of tokens produced by the lexer."""
+        entry = self.entries.get(LEXER_ENTRY)
+        return 0 if entry is None else entry.calls
+
+    def report(self, sort="cumulative_time", limit=None):
+        """Return a table of the entries as a string, sorted in decreasing
+        order of the :class:`ProfileEntry` attribute named *sort*.
+        """
+        entries = sorted(
+                ((name, entry) for name, entry in self.entries.items()
+                    if entry.calls),
+                key=lambda item: getattr(item[1], sort), reverse=True)
+        if limit is not None:
+            entries = entries[:limit]
+
+        lines = ["%-45s %9s %10s %10s %9s %9s" % (
+            "production", "calls", "cumtime", "selftime", "backtrack",
+            "rewound")]
+        for name, entry in entries:
+            lines.append("%-45s %9d %10.4f %10.4f %9d %9d" % (
+                name, entry.calls, entry.cumulative_time, entry.self_time,
+                entry.backtracks, entry.rewound_tokens))
+        return "\n".join(lines)
+
+
+class ParseProfiler:
+    """A context manager that instruments one parser while it is active.
+
+    Entering it installs timing wrappers as instance attributes that shadow
+    the parser's ``_parse_*`` and ``_scan_*`` methods and its lexer's
+    ``token`` method. Leaving it removes them again, so that a parser that is
+    not being profiled runs exactly the same code as before.
+    """
+
+    def __init__(self, parser, callback=None, prefixes=("_parse_", "_scan_")):
+        self.parser = parser
+        self.callback = callback
+        self.prefixes = prefixes
+        self.profile = ParseProfile()
+
+        self._installed = []
+
+    def _wrap(self, name, method):
+        entry = self.profile.entries.setdefault(name, ProfileEntry())
+        # time spent in profiled callees, one slot per active call
+        stack = self._stack
+        active = self._active
+
+        def wrapper(*args, **kwargs):
+            entry.calls += 1
+            active[name] = depth = active.get(name, 0) + 1
+            stack.append((entry, 0.0))
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                _, child_time = stack.pop()
+                entry.self_time += elapsed - child_time
+                if depth == 1:
+                    entry.cumulative_time += elapsed
+                active[name] = depth - 1
+                if stack:
+                    caller, caller_child_time = stack[-1]
+                    stack[-1] = (caller, caller_child_time + elapsed)
+
+        return wrapper
+
+    def _wrap_reset(self, reset):
+        parser = self.parser
+        stack = self._stack
+
+        def wrapper(mark):
+            if stack:
+                entry = stack[-1][0]
+                entry.backtracks += 1
+                entry.rewound_tokens += parser._tokens.mark() - mark
+            return reset(mark)
+
+        return wrapper
+
+    def _install(self, obj, name, wrapper):
+        obj.__dict__[name] = wrapper
+        self._installed.append((obj, name))
+
+    def __enter__(self):
+        parser = self.parser
+        if "_reset" in parser.__dict__:
+            raise RuntimeError("parser is already being profiled")
+
+        self._stack = []
+        self._active = {}
+
+        for name in dir(type(parser)):
+            if name.startswith(self.prefixes) and callable(
+                    getattr(type(parser), name)):
+                self._install(parser, name,
+                        self._wrap(name, getattr(parser, name)))
+
+        self._install(parser, "_reset", self._wrap_reset(parser._reset))
+        self._install(parser.clex, "token",
+                self._wrap(LEXER_ENTRY, parser.clex.token))
+
+        return self.profile
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for obj, name in self._installed:
+            del obj.__dict__[name]
+        self._installed = []
+
+        if self.callback is not None:
+            self.callback(self.profile)
+
+
+# vim: fdm=marker
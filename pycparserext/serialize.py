@@ -0,0 +1,537 @@
+from __future__ import annotations
+
+import gc
+import importlib
+import struct
+import sys
+from array import array
+
+from pycparser import c_ast
+from pycparser.c_parser import Coord
+
+from pycparserext.structural import _node_fields
+
+
+FORMAT_VERSION = 1
+
+_MAGIC = b"PCXAST\0\0"
+
+# magic, version, number of strings, string data size, class table size,
+# number of coords, number of nodes, value stream size, root node
+_HEADER = struct.Struct("<8s8i")
+
+# Values in the stream are tagged in their lowest two bits.
+_TAG_NODE = 0
+_TAG_STRING = 1
+_TAG_LIST = 2
+_TAG_OTHER = 3
+
+# for _TAG_OTHER
+_NONE = 0 << 2 | _TAG_OTHER
+_ABSENT = 1 << 2 | _TAG_OTHER
+_FALSE = 2 << 2 | _TAG_OTHER
+_TRUE = 3 << 2 | _TAG_OTHER
+_TUPLE = 4 << 2 | _TAG_OTHER
+_INT = 5 << 2 | _TAG_OTHER
+
+_ABSENT_VALUE = object()
+
+_ALLOWED_MODULES = frozenset({"pycparser.c_ast", "pycparserext.ext_c_parser"})
+
+
+def _int_array(data):
+    result = array("i")
+    result.frombytes(data)
+    if sys.byteorder == "big":
+        result.byteswap()
+    return result
+
+
+# {{{ writing
+
+class _Writer:
+    def __init__(self):
+        self.strings = {}
+        self.classes = {}
+        self.class_table = [0]
+        self.coords = {}
+        self.coord_table = []
+        self.node_indices = {}
+        self.offsets = []
+        self.values = []
+
+    def string(self, s):
+        index = self.strings.get(s)
+        if index is None:
+            index = self.strings[s] = len(self.strings)
+        return index
+
+    def node_class(self, cls):
+        entry = self.classes.get(cls)
+        if entry is None:
+            type_name, fields = _node_fields(cls)
+            names = [name for name, _ in fields]
+            entry = self.classes[cls] = (len(self.classes), names)
+
+            table = self.class_table
+            table[0] += 1
+            table.append(self.string(type_name.decode()))
+            table.append(len(names))
+            table.extend(self.string(name) for name in names)
+        return entry
+
+    def coord(self, coord):
+        if coord is None:
+            return -1
+        index = self.coords.get(id(coord))
+        if index is None:
+            # The coordinate objects are kept alive by the nodes, so their
+            # ids stay unique.
+            index = self.coords[id(coord)] = len(self.coords)
+            self.coord_table.extend((
+                    self.string(coord.file),
+                    -1 if coord.line is None else coord.line,
+                    -1 if coord.column is None else coord.column))
+        return index
+
+    def value(self, value):
+        values = self.values
+        if value is None:
+            values.append(_NONE)
+        elif isinstance(value, c_ast.Node):
+            values.append(self.node_indices[id(value)] << 2)
+        elif isinstance(value, str):
+            values.append(self.string(value) << 2 | _TAG_STRING)
+        elif isinstance(value, list):
+            values.append(len(value) << 2 | _TAG_LIST)
+            for item in value:
+                self.value(item)
+        elif value is _ABSENT_VALUE:
+            values.append(_ABSENT)
+        elif value is True:
+            values.append(_TRUE)
+        elif value is False:
+            values.append(_FALSE)
+        elif isinstance(value, tuple):
+            values.append(_TUPLE)
+            values.append(len(value))
+            for item in value:
+                self.value(item)
+        elif isinstance(value, int):
+            values.append(_INT)
+            values.append(value)
+        else:
+            raise TypeError("cannot serialize value of type '%s'"
+                    % type(value).__name__)
+
+    def add_tree(self, root):
+        node_indices = self.node_indices
+        node_type = c_ast.Node
+
+        # Post-order, so that nodes only refer to nodes stored before them.
+        # Tuples on the stack are nodes whose children have been stored.
+        stack = [root]
+        while stack:
+            item = stack.pop()
+            if type(item) is tuple:
+                node, names, node_values = item
+                if id(node) in node_indices:
+                    continue
+                class_index, _ = self.node_class(type(node))
+                self.offsets.append(len(self.values))
+                self.values.append(class_index)
+                self.values.append(self.coord(getattr(node, "coord", None)))
+                for value in node_values:
+                    self.value(value)
+                node_indices[id(node)] = len(node_indices)
+                continue
+
+            if id(item) in node_indices:
+                continue
+
+            _, names = self.node_class(type(item))
+            node_values = [
+                    getattr(item, name, _ABSENT_VALUE) for name in names]
+            stack.append((item, names, node_values))
+            for value in node_values:
+                if isinstance(value, node_type):
+                    if id(value) not in node_indices:
+                        stack.append(value)
+                elif isinstance(value, (list, tuple)):
+                    stack.extend(_iter_list_nodes(value))
+
+        return node_indices[id(root)]
+
+    def getvalue(self, root_index):
+        strings = list(self.strings)
+        string_data = "".join(strings).encode("utf-8", "surrogatepass")
+        padding = -len(string_data) % 4
+
+        int_sections = [
+                [len(s) for s in strings],
+                self.class_table,
+                self.coord_table,
+                self.offsets,
+                self.values,
+                ]
+        arrays = [array("i", section) for section in int_sections]
+        if sys.byteorder == "big":
+            for a in arrays:
+                a.byteswap()
+
+        header = _HEADER.pack(
+                _MAGIC, FORMAT_VERSION,
+                len(strings), len(string_data), len(self.class_table),
+                len(self.coord_table) // 3, len(self.offsets),
+                len(self.values), root_index)
+
+        return b"".join([
+                header, arrays[0].tobytes(), string_data, b"\0" * padding,
+                arrays[1].tobytes(), arrays[2].tobytes(), arrays[3].tobytes(),
+                arrays[4].tobytes()])
+
+
+def _iter_list_nodes(value):
+    for item in value:
+        if isinstance(item, c_ast.Node):
+            yield item
+        elif isinstance(item, (list, tuple)):
+            yield from _iter_list_nodes(item)
+
+
+def dumps(node):
+    """Return a compact binary representation of the AST rooted at *node*.
+
+    The result consists of a table of strings (identifiers, constants, file
+    names), a table of the node classes used along with their field names,
+    a table of distinct coordinates and a flat table of nodes in which
+    children are referred to by index. Nodes that occur more than once in
+    the tree (e.g. with ``intern_attributes=True``) are stored once and
+    remain shared after loading.
+    """
+    writer = _Writer()
+    root_index = writer.add_tree(node)
+    return writer.getvalue(root_index)
+
+
+def dump(node, file):
+    """Write the binary representation of *node* (see :func:`dumps`) to the
+    binary file object *file*.
+    """
+    file.write(dumps(node))
+
+# }}}
+
+
+# {{{ reading
+
+def _resolve_class(type_name):
+    module_name, _, qualname = type_name.rpartition(".")
+    if module_name not in _ALLOWED_MODULES:
+        raise ValueError("unexpected node class '%s'" % type_name)
+    cls = getattr(importlib.import_module(module_name), qualname, None)
+    if isinstance(cls, type) and issubclass(cls, c_ast.Node):
+        return cls
+    raise ValueError("unexpected node class '%s'" % type_name)
+
+
+class ASTReader:
+    """Provides access to an AST in the format written by :func:`dumps`,
+    without necessarily building all of it.
+
+    *data* may be any bytes-like object, such as :class:`bytes` or an
+    :class:`mmap.mmap`. The node table is accessed in place. If the root
+    is a :class:`pycparser.c_ast.FileAST`, indexing the reader returns the
+    top-level declarations, which are built (along with the nodes they
+    contain) only when first accessed.
+
+    :raises ValueError: if *data* is not in a supported format.
+    """
+
+    def __init__(self, data):
+        view = memoryview(data)
+        if view.nbytes < _HEADER.size:
+            raise ValueError("not a serialized AST")
+
+        (magic, version, nstrings, string_data_size, class_table_size,
+                ncoords, nnodes, nvalues, self._root_index) = \
+                _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError("not a serialized AST")
+        if version != FORMAT_VERSION:
+            raise ValueError("unsupported serialized AST version %d" % version)
+
+        pos = _HEADER.size
+
+        def take(nbytes):
+            nonlocal pos
+            if pos + nbytes > view.nbytes:
+                raise ValueError("truncated serialized AST")
+            result = view[pos:pos + nbytes]
+            pos += nbytes
+            return result
+
+        string_lengths = _int_array(take(4 * nstrings))
+        string_data = str(take(string_data_size), "utf-8", "surrogatepass")
+        take(-string_data_size % 4)
+        class_table = _int_array(take(4 * class_table_size))
+        coord_table = _int_array(take(4 * 3 * ncoords))
+
+        node_view = take(4 * nnodes)
+        value_view = take(4 * nvalues)
+        if sys.byteorder == "little":
+            # zero-copy
+            self._offsets = node_view.cast("i")
+            self._values = value_view.cast("i")
+        else:
+            self._offsets = _int_array(node_view)
+            self._values = _int_array(value_view)
+
+        # {{{ tables
+
+        strings = self._strings = []
+        start = 0
+        for length in string_lengths:
+            strings.append(string_data[start:start + length])
+            start += length
+
+        self._classes = classes = []
+        i = 1
+        for _ in range(class_table[0] if class_table_size else 0):
+            cls = _resolve_class(strings[class_table[i]])
+            nfields = class_table[i + 1]
+            names = [strings[k] for k in class_table[i + 2:i + 2 + nfields]]
+            classes.append((cls, names))
+            i += 2 + nfields
+
+        # built on first use
+        self._coord_table = coord_table
+        self._coords = [None] * ncoords
+
+        # }}}
+
+        self._built = {}
+        self._top_level = None
+
+    # {{{ decoding
+
+    def _decode(self, values, pos, get_node):
+        """Decode the value at *pos* in *values*, returning it and the
+        position after it.
+        """
+        v = values[pos]
+        pos += 1
+        tag = v & 3
+        if tag == _TAG_NODE:
+            return get_node(v >> 2), pos
+        elif tag == _TAG_STRING:
+            return self._strings[v >> 2], pos
+        elif tag == _TAG_LIST:
+            result = []
+            for _ in range(v >> 2):
+                item, pos = self._decode(values, pos, get_node)
+                result.append(item)
+            return result, pos
+        elif v == _NONE:
+            return None, pos
+        elif v == _ABSENT:
+            return _ABSENT_VALUE, pos
+        elif v == _TRUE:
+            return True, pos
+        elif v == _FALSE:
+            return False, pos
+        elif v == _TUPLE:
+            n = values[pos]
+            pos += 1
+            result = []
+            for _ in range(n):
+                item, pos = self._decode(values, pos, get_node)
+                result.append(item)
+            return tuple(result), pos
+        elif v == _INT:
+            return values[pos], pos + 1
+        else:
+            raise ValueError("invalid value in serialized AST")
+
+    def _build_node(self, values, pos, get_node):
+        cls, names = self._classes[values[pos]]
+        coord_index = values[pos + 1]
+        pos += 2
+
+        node = cls.__new__(cls)
+        strings = self._strings
+        for name in names:
+            v = values[pos]
+            # the common cases, inlined
+            tag = v & 3
+            if tag == _TAG_NODE:
+                setattr(node, name, get_node(v >> 2))
+                pos += 1
+            elif tag == _TAG_STRING:
+                setattr(node, name, strings[v >> 2])
+                pos += 1
+            elif v == _NONE:
+                setattr(node, name, None)
+                pos += 1
+            elif v == _TAG_LIST:
+                # empty list
+                setattr(node, name, [])
+                pos += 1
+            else:
+                value, pos = self._decode(values, pos, get_node)
+                if value is not _ABSENT_VALUE:
+                    setattr(node, name, value)
+
+        if coord_index == -1:
+            node.coord = None
+        else:
+            coord = self._coords[coord_index]
+            if coord is None:
+                coord = self._make_coord(coord_index)
+            node.coord = coord
+        return node
+
+    def _make_coord(self, index):
+        table = self._coord_table
+        line = table[3*index + 1]
+        column = table[3*index + 2]
+        coord = self._coords[index] = Coord(
+                self._strings[table[3*index]],
+                None if line == -1 else line,
+                None if column == -1 else column)
+        return coord
+
+    def _node_refs(self, pos):
+        """Return the indices of the nodes referred to by the node stored
+        at *pos*.
+        """
+        values = self._values
+        _, names = self._classes[values[pos]]
+        pos += 2
+        refs = []
+        # number of values left to read, including list items
+        remaining = len(names)
+        while remaining:
+            v = values[pos]
+            pos += 1
+            remaining -= 1
+            tag = v & 3
+            if tag == _TAG_NODE:
+                refs.append(v >> 2)
+            elif tag == _TAG_LIST:
+                remaining += v >> 2
+            elif v == _TUPLE:
+                remaining += values[pos]
+                pos += 1
+            elif v == _INT:
+                pos += 1
+        return refs
+
+    # }}}
+
+    def node(self, index):
+        """Return the node stored at *index*, building it if needed."""
+        built = self._built
+        node = built.get(index)
+        if node is not None:
+            return node
+
+        offsets = self._offsets
+        values = self._values
+        stack = [index]
+        while stack:
+            i = stack[-1]
+            if i in built:
+                stack.pop()
+                continue
+
+            missing = [k for k in self._node_refs(offsets[i])
+                    if k not in built]
+            if missing:
+                stack.extend(missing)
+                continue
+
+            built[i] = self._build_node(values, offsets[i], built.__getitem__)
+            stack.pop()
+
+        return built[index]
+
+    def _top_level_indices(self):
+        indices = self._top_level
+        if indices is not None:
+            return indices
+
+        values = self._values
+        pos = self._offsets[self._root_index]
+        cls, names = self._classes[values[pos]]
+        if not issubclass(cls, c_ast.FileAST):
+            raise TypeError("root is not a FileAST")
+
+        pos += 2
+        for name in names:
+            if name == "ext":
+                break
+            _, pos = self._decode(values, pos, lambda index: None)
+
+        indices = []
+        v = values[pos]
+        if v & 3 == _TAG_LIST:
+            indices = [values[pos + 1 + k] >> 2 for k in range(v >> 2)]
+        self._top_level = indices
+        return indices
+
+    def __len__(self):
+        return len(self._top_level_indices())
+
+    def __getitem__(self, i):
+        return self.node(self._top_level_indices()[i])
+
+    def root(self):
+        """Build and return the whole AST."""
+        built = self._built
+        if self._root_index in built:
+            return built[self._root_index]
+
+        # Nodes only refer to nodes stored before them, so they can be built
+        # in order.
+        nodes = []
+        values = self._values
+        get_node = nodes.__getitem__
+        build_node = self._build_node
+
+        # Building many objects that are all kept would otherwise trigger
+        # repeated full collections, and an AST has no cycles to collect.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for i, offset in enumerate(self._offsets):
+                node = built.get(i) if built else None
+                if node is None:
+                    node = build_node(values, offset, get_node)
+                nodes.append(node)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        self._built = dict(enumerate(nodes))
+        return nodes[self._root_index]
+
+
+def loads(data):
+    """Return the AST stored in *data* by :func:`dumps`.
+
+    :raises ValueError: if *data* is not in a supported format.
+    """
+    return ASTReader(data).root()
+
+
+def load(file):
+    """Read an AST written by :func:`dump` from the binary file object
+    *file*.
+    """
+    return loads(file.read())
+
+# }}}
+
+
+# vim: fdm=marker
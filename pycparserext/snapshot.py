@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import struct
+
+from pycparserext import serialize
+
+
+FORMAT_VERSION = 1
+
+_MAGIC = b"PCXSNAP\0"
+
+# magic, version, sizes of: package versions, parser class name, typedef
+# names, other identifiers
+_HEADER = struct.Struct("<8s5i")
+
+
+def _class_name(cls):
+    return "%s.%s" % (cls.__module__, cls.__qualname__)
+
+
+class ParserSnapshot:
+    """The state of a parser after parsing a prelude, such as the system
+    headers that many translation units start with, as returned by
+    :meth:`~pycparserext.ext_c_parser.CParserBase.parse_prelude`.
+
+    Passing it as *snapshot* to
+    :meth:`~pycparserext.ext_c_parser.CParserBase.parse` parses text as if it
+    followed the prelude, without parsing the prelude again. The resulting
+    AST only holds the declarations of that text, those of the prelude are
+    in :attr:`ast`.
+
+    A snapshot can be shared by any number of parsers of the class that took
+    it, and saved to disk using :meth:`save`.
+
+    .. attribute:: parser_class_name
+
+    .. attribute:: scope
+
+        A :class:`dict` mapping the names declared in file scope to *True*
+        for typedef names and *False* for other identifiers. It must not be
+        modified.
+    """
+
+    def __init__(self, parser_class_name, scope, ast):
+        self.parser_class_name = parser_class_name
+        self.scope = scope
+        self._ast = ast
+        self._ast_reader = None
+
+    @property
+    def ast(self):
+        """The :class:`pycparser.c_ast.FileAST` of the prelude. For a
+        snapshot read by :meth:`load`, this is only built when first
+        accessed.
+        """
+        if self._ast is None:
+            self._ast = self._ast_reader.root()
+            self._ast_reader = None
+        return self._ast
+
+    def _check_parser(self, parser):
+        if _class_name(type(parser)) != self.parser_class_name:
+            raise ValueError("snapshot was taken by a '%s', not a '%s'"
+                    % (self.parser_class_name, _class_name(type(parser))))
+
+    # {{{ saving and loading
+
+    def dumps(self):
+        """Return a binary representation of the snapshot."""
+        from pycparserext.cache import _package_versions
+
+        parts = [
+                _package_versions(),
+                self.parser_class_name,
+                "\n".join(
+                    name for name, is_type in self.scope.items() if is_type),
+                "\n".join(
+                    name for name, is_type in self.scope.items()
+                    if not is_type),
+                ]
+        encoded = [part.encode() for part in parts]
+        return b"".join([
+                _HEADER.pack(_MAGIC, FORMAT_VERSION,
+                    *[len(part) for part in encoded]),
+                *encoded,
+                serialize.dumps(self.ast)])
+
+    def save(self, file):
+        """Write the snapshot (see :meth:`dumps`) to the binary file object
+        *file*.
+        """
+        file.write(self.dumps())
+
+    @classmethod
+    def loads(cls, data):
+        """Return the snapshot stored in *data* by :meth:`dumps`.
+
+        :raises ValueError: if *data* is not in a supported format, or was
+            written by different versions of :mod:`pycparser` or
+            :mod:`pycparserext`.
+        """
+        from pycparserext.cache import _package_versions
+
+        view = memoryview(data)
+        if view.nbytes < _HEADER.size:
+            raise ValueError("not a parser snapshot")
+
+        magic, version, *sizes = _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError("not a parser snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError("unsupported snapshot format version %d"
+                    % version)
+
+        parts = []
+        pos = _HEADER.size
+        for size in sizes:
+            parts.append(bytes(view[pos:pos + size]).decode())
+            pos += size
+        versions, parser_class_name, type_names, identifiers = parts
+
+        if versions != _package_versions():
+            raise ValueError("snapshot was written by different package "
+                    "versions (%s)" % versions)
+
+        scope = dict.fromkeys(identifiers.split("\n") if identifiers else (),
+                False)
+        scope.update(dict.fromkeys(
+                type_names.split("\n") if type_names else (), True))
+
+        result = cls(parser_class_name, scope, None)
+        result._ast_reader = serialize.ASTReader(view[pos:])
+        return result
+
+    @classmethod
+    def load(cls, file):
+        """Read a snapshot written by :meth:`save` from the binary file
+        object *file*.
+        """
+        return cls.loads(file.read())
+
+    # }}}
+
+
+# vim: fdm=marker
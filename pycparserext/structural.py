@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+from hashlib import blake2b
+
+from pycparser import c_ast
+
+
+DIGEST_SIZE = 16
+
+
+# {{{ node layout
+
+_FIELDS_CACHE = {}
+
+
+def _node_fields(cls):
+    """Return a tuple *(type_name, fields)* for node class *cls*. *fields*
+    lists *(name, encoded_name)* for all slots of *cls* except ``coord`` and
+    ``__weakref__``. This includes fields not listed by
+    :meth:`~pycparser.c_ast.Node.children` or ``attr_names``, such as
+    :attr:`~pycparserext.ext_c_parser.StructExt.attrib`.
+    """
+    try:
+        return _FIELDS_CACHE[cls]
+    except KeyError:
+        pass
+
+    fields = []
+    for base in reversed(cls.__mro__):
+        slots = base.__dict__.get("__slots__", ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for name in slots:
+            if name not in ("coord", "__weakref__") and name not in fields:
+                fields.append(name)
+
+    result = _FIELDS_CACHE[cls] = (
+            ("%s.%s" % (cls.__module__, cls.__qualname__)).encode(),
+            tuple((name, name.encode()) for name in fields))
+    return result
+
+
+def _iter_subnodes(value):
+    """Yield the nodes directly contained in the field value *value*."""
+    if isinstance(value, c_ast.Node):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            if isinstance(item, (c_ast.Node, list, tuple)):
+                yield from _iter_subnodes(item)
+
+# }}}
+
+
+class StructuralHasher:
+    """Computes structural digests of AST nodes and remembers them by node
+    identity, so that each node is hashed only once.
+
+    Two nodes have the same digest if they are of the same type and all their
+    fields are equal, where nodes contained in fields are compared
+    structurally and coordinates are ignored. The digest of a node is
+    computed from the digests of its children (as in a Merkle tree), so once
+    two trees have been hashed, comparing them or any of their subtrees takes
+    constant time.
+
+    Digests are not updated when nodes are modified. Use a new hasher after
+    modifying an AST.
+
+    :arg ignore_fields: names of node fields to leave out of the comparison,
+        e.g. ``("declname",)`` to consider types equal regardless of the
+        names they declare.
+    """
+
+    def __init__(self, ignore_fields=()):
+        self.ignore_fields = frozenset(ignore_fields)
+
+        # id(node) -> digest. The nodes are kept alive in a list, so that
+        # their ids stay unique. (Tuples of node and digest would be a lot of
+        # objects for the garbage collector to track.)
+        self._digests = {}
+        self._hashed_nodes = []
+        self._fields_cache = {}
+
+    def _fields(self, cls):
+        try:
+            return self._fields_cache[cls]
+        except KeyError:
+            pass
+
+        type_name, fields = _node_fields(cls)
+        result = self._fields_cache[cls] = (type_name, tuple(
+                field for field in fields
+                if field[0] not in self.ignore_fields))
+        return result
+
+    def _encode(self, parts, value):
+        """Append an encoding of the field value *value* to the list of
+        :class:`bytes` *parts*. Nodes contained in *value* must have been
+        hashed already.
+        """
+        if value is None:
+            parts.append(b"0")
+        elif isinstance(value, c_ast.Node):
+            parts.append(b"N" + self._digests[id(value)])
+        elif isinstance(value, str):
+            data = value.encode()
+            parts.append(b"S%d:%s" % (len(data), data))
+        elif isinstance(value, (list, tuple)):
+            parts.append(b"L%d:" % len(value))
+            for item in value:
+                self._encode(parts, item)
+        else:
+            data = repr(value).encode()
+            parts.append(b"R%d:%s" % (len(data), data))
+
+    def hash(self, node):
+        """Return the structural digest of *node* as :class:`bytes`."""
+        digests = self._digests
+        digest = digests.get(id(node))
+        if digest is not None:
+            return digest
+
+        hashed_nodes = self._hashed_nodes
+        node_type = c_ast.Node
+        encode = self._encode
+
+        # Post-order traversal with an explicit stack, since ASTs (e.g.
+        # long else-if chains) may be deeper than the recursion limit. Nodes
+        # on the stack still need to be expanded, tuples *(node, type_name,
+        # fields, values)* are ready to be hashed once their children are.
+        stack = [node]
+        while stack:
+            item = stack.pop()
+
+            if type(item) is tuple:
+                current, type_name, fields, values = item
+                parts = [type_name]
+                for (_, encoded_name), value in zip(
+                        fields, values, strict=True):
+                    parts.append(b"\0" + encoded_name)
+                    encode(parts, value)
+                digests[id(current)] = blake2b(
+                        b"".join(parts), digest_size=DIGEST_SIZE).digest()
+                hashed_nodes.append(current)
+                continue
+
+            if id(item) in digests:
+                continue
+
+            type_name, fields = self._fields(type(item))
+            values = [getattr(item, name, None) for name, _ in fields]
+            stack.append((item, type_name, fields, values))
+            for value in values:
+                if isinstance(value, node_type):
+                    if id(value) not in digests:
+                        stack.append(value)
+                elif value and isinstance(value, (list, tuple)):
+                    for child in value:
+                        if isinstance(child, node_type):
+                            if id(child) not in digests:
+                                stack.append(child)
+                        elif isinstance(child, (list, tuple)):
+                            stack.extend(_iter_subnodes(child))
+
+        return digests[id(node)]
+
+    def value_hash(self, value):
+        """Return the structural digest of a field value, i.e. a node,
+        a (possibly nested) list of nodes, or a plain value such as a string.
+        """
+        if isinstance(value, c_ast.Node):
+            return self.hash(value)
+
+        for node in _iter_subnodes(value):
+            self.hash(node)
+        parts = []
+        self._encode(parts, value)
+        return blake2b(b"".join(parts), digest_size=DIGEST_SIZE).digest()
+
+    def equal(self, a, b):
+        """Return whether the nodes or field values *a* and *b* are
+        structurally equal.
+        """
+        if a is b:
+            return True
+        return self.value_hash(a) == self.value_hash(b)
+
+
+def structural_hash(node, hasher=None):
+    """Return the structural digest of *node*. Pass a
+    :class:`StructuralHasher` as *hasher* to reuse digests across calls.
+    """
+    if hasher is None:
+        hasher = StructuralHasher()
+    return hasher.hash(node)
+
+
+def structurally_equal(a, b, hasher=None):
+    """Return whether the nodes *a* and *b* are equal, ignoring coordinates.
+    Pass a :class:`StructuralHasher` as *hasher* to reuse digests across
+    calls.
+    """
+    if a is b:
+        return True
+    if hasher is None:
+        hasher = StructuralHasher()
+    return hasher.equal(a, b)
+
+
+# vim: fdm=marker
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from pycparser import c_ast
+
+from pycparserext.ext_c_parser import (
+    ArrayDeclExt,
+    PreprocessorLine,
+    StructExt,
+    TypeDeclExt,
+)
+
+
+# Fields of extension nodes that hold nodes, but that
+# :meth:`~pycparser.c_ast.Node.children` does not report, since the node
+# classes inherit it from pycparser.
+_EXTRA_CHILD_FIELDS = {
+        TypeDeclExt: ("asm", "attributes", "init"),
+        ArrayDeclExt: ("asm", "attributes", "init"),
+        StructExt: ("attrib",),
+        }
+
+# Node classes that never have nodes below them
+_LEAF_CLASSES = frozenset({
+    c_ast.Break, c_ast.Constant, c_ast.Continue, c_ast.EllipsisParam,
+    c_ast.EmptyStatement, c_ast.Goto, c_ast.ID, c_ast.IdentifierType,
+    c_ast.Pragma, PreprocessorLine})
+
+
+def _named_child_nodes(node):
+    result = list(node.children())
+    extra_fields = _EXTRA_CHILD_FIELDS.get(type(node))
+    if extra_fields is not None:
+        for name in extra_fields:
+            child = getattr(node, name, None)
+            if isinstance(child, c_ast.Node):
+                result.append((name, child))
+    return result
+
+
+def child_nodes(node):
+    """Return a list of the nodes directly below *node*. Unlike
+    :meth:`~pycparser.c_ast.Node.children`, this includes those in the
+    extra fields of extension nodes, such as
+    :class:`~pycparserext.ext_c_parser.TypeDeclExt` ``attributes``.
+    """
+    return [child for _, child in _named_child_nodes(node)]
+
+
+def walk(node):
+    """Yield *node* and all nodes below it (see :func:`child_nodes`) in
+    pre-order. This uses an explicit stack, so *node* may be nested
+    arbitrarily deep, e.g. in long chains of ``else if``.
+    """
+    # The stack holds pairs *(name, node)*, as returned by
+    # :meth:`~pycparser.c_ast.Node.children`.
+    stack = [(None, node)]
+    while stack:
+        _, node = stack.pop()
+        yield node
+        cls = node.__class__
+        if cls in _EXTRA_CHILD_FIELDS:
+            stack.extend(reversed(_named_child_nodes(node)))
+        elif cls not in _LEAF_CLASSES:
+            stack.extend(reversed(node.children()))
+
+
+class NodeVisitor(c_ast.NodeVisitor):
+    """A replacement for :class:`pycparser.c_ast.NodeVisitor` that handles
+    ASTs of any depth, and which also visits the nodes below extension
+    nodes that :meth:`~pycparser.c_ast.Node.children` does not report (see
+    :func:`child_nodes`).
+
+    As with pycparser's visitor, define ``visit_XXX`` methods for the node
+    types of interest and call :meth:`generic_visit` from them to visit the
+    nodes below as well. The difference is that :meth:`generic_visit` only
+    puts those nodes on an explicit stack. They are visited (still in
+    pre-order) once the ``visit_XXX`` method has returned, and before
+    :meth:`visit` returns.
+    """
+
+    _stack = None
+    _visitor_cache = None
+
+    def _get_visitor(self, cls):
+        """Return the method visiting nodes of class *cls*. Return *None* if
+        :meth:`visit` may just schedule visiting the nodes below them
+        instead, or *False* if there is nothing to do for them at all.
+        """
+        visitor_cache = self._visitor_cache
+        if visitor_cache is None:
+            visitor_cache = self._visitor_cache = {}
+
+        try:
+            return visitor_cache[cls]
+        except KeyError:
+            pass
+
+        visitor = getattr(self, "visit_" + cls.__name__, None)
+        if visitor is None and (
+                type(self).generic_visit is not NodeVisitor.generic_visit
+                or cls in _EXTRA_CHILD_FIELDS):
+            visitor = self.generic_visit
+        elif visitor is None and cls in _LEAF_CLASSES:
+            visitor = False
+        visitor_cache[cls] = visitor
+        return visitor
+
+    def visit(self, node):
+        """Visit *node* and, by way of :meth:`generic_visit`, the nodes below
+        it. Return the result of the method visiting *node*.
+        """
+        visitor = self._get_visitor(node.__class__)
+        if not visitor:
+            visitor = self.generic_visit
+
+        outer_stack = self._stack
+        stack = self._stack = []
+        try:
+            result = visitor(node)
+
+            # As in walk, the stack holds pairs *(name, node)*.
+            visitor_cache = self._visitor_cache
+            get_visitor = self._get_visitor
+            pop = stack.pop
+            extend = stack.extend
+            while stack:
+                _, node = pop()
+                cls = node.__class__
+                visitor = visitor_cache.get(cls, get_visitor)
+                if visitor is get_visitor:
+                    visitor = get_visitor(cls)
+                if visitor is None:
+                    # inlined generic_visit
+                    extend(reversed(node.children()))
+                elif visitor is not False:
+                    visitor(node)
+            return result
+        finally:
+            self._stack = outer_stack
+
+    def generic_visit(self, node):
+        """Schedule visiting the nodes directly below *node*."""
+        stack = self._stack
+        if stack is None:
+            # called outside of visit
+            for child in child_nodes(node):
+                self.visit(child)
+        elif node.__class__ in _EXTRA_CHILD_FIELDS:
+            stack.extend(reversed(_named_child_nodes(node)))
+        else:
+            stack.extend(reversed(node.children()))
+
+
+# vim: fdm=marker
@@ -0,0 +1,846 @@
+"""Benchmarks for pycparserext.
+
+Usage::
+
+    python test/bench_pycparserext.py [NAME ...] [--json FILE]
+    python test/bench_pycparserext.py --compare OLD.json NEW.json
+
+Without names, all benchmarks are run. ``throughput`` measures lexing,
+parsing and code generation on bundled synthetic inputs. Results can be
+saved with ``--json`` and compared across commits with ``--compare``, which
+exits with a nonzero status if anything got slower or bigger by more than
+the given threshold.
+
+Timings are the best of several runs, each taken with the garbage collector
+disabled to reduce noise.
+"""
+from __future__ import annotations
+
+import gc
+import sys
+from time import perf_counter
+
+
+# {{{ inputs
+
+def make_gnu_source(n):
+    """Return synthetic GNU C resembling preprocessed system headers."""
+    parts = []
+    for i in range(n):
+        parts.append(
+            "typedef unsigned long int __u%d_t;\n"
+            "extern int __f%d (const char *__restrict __s, __u%d_t __n)\n"
+            "     __attribute__ ((__nothrow__ , __leaf__))"
+            " __attribute__ ((__nonnull__ (1)));\n"
+            "extern __inline __attribute__ ((__gnu_inline__)) int\n"
+            "__g%d (int __c)\n"
+            "{\n"
+            "  __typeof__ (__c) __r = __c;\n"
+            '  __asm__ __volatile__ ("" : "=r" (__r) : "0" (__r));\n'
+            "  return __r > 0 ? __r : -__r;\n"
+            "}\n" % (i, i, i, i))
+    return "".join(parts)
+
+
+def make_asm_source(n):
+    """Return synthetic GNU C resembling asm-heavy kernel code."""
+    parts = []
+    for i in range(n):
+        parts.append(
+            "static inline __attribute__((__always_inline__)) unsigned long\n"
+            "__read_cr%d(void)\n"
+            "{\n"
+            "  unsigned long __val;\n"
+            '  asm volatile("mov %%%%cr%d, %%0\\n\\t" : "=r" (__val) : : "memory");\n'
+            "  return __val;\n"
+            "}\n"
+            "static inline void\n"
+            "__set_bit%d(long __nr, volatile unsigned long *__addr)\n"
+            "{\n"
+            '  __asm__ __volatile__("lock; bts %%1,%%0"\n'
+            '      : "+m" (*(volatile long *) __addr)\n'
+            '      : "Ir" (__nr) : "memory", "cc");\n'
+            "}\n"
+            "struct __attribute__((__packed__)) desc%d {\n"
+            "  unsigned short limit0;\n"
+            "  unsigned short base0;\n"
+            "  unsigned int flags : 12 __attribute__((aligned(2)));\n"
+            "} __attribute__((aligned(8)));\n"
+            'register unsigned long current_stack_pointer%d asm("rsp");\n'
+            % (i % 8, i % 8, i, i, i))
+    return "".join(parts)
+
+
+def make_table_source(n):
+    """Return synthetic GNU C with a large generated table."""
+    parts = [(
+            "struct entry { int code; const char *name; short ops[4]; };\n"
+            "static const struct entry table[] __attribute__((aligned(64)))"
+            " = {\n")]
+    for i in range(n):
+        parts.append(
+            '  [%d ... %d] = { %d, "op_%d", { 1, 2, %d & 0xff, -1 } },\n'
+            % (8*i, 8*i + 7, i, i, i))
+    parts.append("};\n")
+    return "".join(parts)
+
+
+def make_opencl_source(n):
+    """Return synthetic OpenCL C kernels using vector types."""
+    parts = []
+    for i in range(n):
+        parts.append(
+            "__constant float4 coeffs%d = (float4)(1.0f, 2.0f, 3.0f, 4.0f);\n"
+            "typedef float4 vec%d_t __attribute__((aligned(16)));\n"
+            "__kernel void saxpy%d(__global const float4 *restrict x,\n"
+            "    __global float4 *restrict y, __local float4 *tmp, const float a)\n"
+            "{\n"
+            "  int gid = get_global_id(0);\n"
+            "  int lid = get_local_id(0);\n"
+            "  tmp[lid] = x[gid] * coeffs%d;\n"
+            "  barrier(CLK_LOCAL_MEM_FENCE);\n"
+            "  vec%d_t v = a * tmp[lid] + y[gid];\n"
+            "  int2 idx = (int2)(gid, lid);\n"
+            "  y[gid] = v.xyzw + (float4)(v.s0, v.s1, idx.x, idx.y);\n"
+            "}\n" % (i, i, i, i, i))
+    return "".join(parts)
+
+
+def make_nested_declarator_source(depth):
+    """Return a declaration like ``signal`` from ``<signal.h>``, nested
+    *depth* levels deep: each level is a function returning a function
+    pointer, whose parameter is the next level.
+    """
+    decl = "int x"
+    for i in range(depth):
+        decl = "void (*p%d(%s))(int)" % (i, decl)
+    return decl + ";\n"
+
+# }}}
+
+
+# {{{ utilities
+
+REPEAT = 5
+
+
+def best_of(f, repeat=None, with_gc=False):
+    """Return the smallest wall time of *repeat* calls to *f*. The garbage
+    collector is disabled while timing, unless *with_gc* is true.
+    """
+    if repeat is None:
+        repeat = REPEAT
+
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        if not with_gc:
+            gc.disable()
+        try:
+            start = perf_counter()
+            f()
+            elapsed = perf_counter() - start
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def peak_memory(f):
+    """Return the peak memory in bytes allocated during a call to *f*."""
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def count_nodes(ast):
+    """Return the number of distinct nodes in *ast*, including those in
+    fields that :meth:`~pycparser.c_ast.Node.children` does not list, such
+    as the attributes of extension nodes.
+    """
+    from pycparserext.structural import _iter_subnodes, _node_fields
+
+    seen = {id(ast)}
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        _, fields = _node_fields(type(node))
+        for name, _ in fields:
+            for child in _iter_subnodes(getattr(node, name, None)):
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    stack.append(child)
+    return len(seen)
+
+
+def count_tokens(lexer_class, text):
+    lexer = lexer_class(
+            error_func=lambda msg, line, column: None,
+            on_lbrace_func=lambda: None,
+            on_rbrace_func=lambda: None,
+            type_lookup_func=lambda name: False)
+    lexer.input(text)
+
+    ntokens = 0
+    token = lexer.token
+    while token() is not None:
+        ntokens += 1
+    return ntokens
+
+# }}}
+
+
+# {{{ nested declarators
+
+def bench_nested_declarators():
+    """Measure parse time for increasingly deep nested declarators. With
+    linear scaling, the time per level stays roughly constant.
+    """
+    from pycparserext.ext_c_parser import GnuCParser
+
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old_limit, 20000))
+    try:
+        results = {}
+        for depth in (50, 100, 200, 400):
+            text = make_nested_declarator_source(depth)
+            elapsed = best_of(lambda text=text: GnuCParser().parse(text))
+            results["depth_%d" % depth] = {
+                    "parse_s": elapsed,
+                    "us_per_level": 1e6 * elapsed / depth,
+                    }
+    finally:
+        sys.setrecursionlimit(old_limit)
+
+    return results
+
+# }}}
+
+
+# {{{ ast memory
+
+def retained_memory(f):
+    """Return *f()* and the memory in bytes retained by its result."""
+    import tracemalloc
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = f()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_ast_memory():
+    """Report the memory retained by the AST of a large GNU header, with and
+    without attribute interning.
+    """
+    from pycparserext.ext_c_parser import GnuCParser
+
+    text = make_gnu_source(2000)
+
+    ast, size = retained_memory(lambda: GnuCParser().parse(text))
+    _, interned_size = retained_memory(
+            lambda: GnuCParser(intern_attributes=True).parse(text))
+
+    nnodes = count_nodes(ast)
+    return {
+            "nodes": nnodes,
+            "ast_mb": size / 1e6,
+            "bytes_per_node": size / nnodes,
+            "interned_ast_mb": interned_size / 1e6,
+            }
+
+# }}}
+
+
+# {{{ throughput
+
+WORKLOADS = {
+        # name: (input generator, size, parser, generator)
+        "glibc_headers": (make_gnu_source, 2000, "GnuCParser", "GnuCGenerator"),
+        "kernel_asm": (make_asm_source, 1000, "GnuCParser", "GnuCGenerator"),
+        "opencl_kernels": (
+            make_opencl_source, 1000, "OpenCLCParser", "OpenCLCGenerator"),
+        }
+
+
+def measure_workload(parser_class, generator_class, text):
+    lexer_class = parser_class.lexer_class
+    ast = parser_class().parse(text)
+    ntokens = count_tokens(lexer_class, text)
+    nnodes = count_nodes(ast)
+
+    lex_s = best_of(lambda: count_tokens(lexer_class, text))
+    parse_s = best_of(lambda: parser_class().parse(text))
+    generate_s = best_of(lambda: generator_class().visit(ast))
+
+    return {
+            "chars": len(text),
+            "tokens": ntokens,
+            "nodes": nnodes,
+            "lex_s": lex_s,
+            "parse_s": parse_s,
+            "generate_s": generate_s,
+            "lex_tokens_per_s": ntokens / lex_s,
+            "parse_nodes_per_s": nnodes / parse_s,
+            "generate_nodes_per_s": nnodes / generate_s,
+            "parse_peak_mb":
+            peak_memory(lambda: parser_class().parse(text)) / 1e6,
+            "generate_peak_mb":
+            peak_memory(lambda: generator_class().visit(ast)) / 1e6,
+            }
+
+
+def bench_throughput():
+    """Measure lexing, parsing (including lexing) and code generation for
+    each of the :data:`WORKLOADS`.
+    """
+    from pycparserext import ext_c_generator, ext_c_parser
+
+    results = {}
+    for name, (make_source, size, parser_name, generator_name) \
+            in WORKLOADS.items():
+        results[name] = measure_workload(
+                getattr(ext_c_parser, parser_name),
+                getattr(ext_c_generator, generator_name),
+                make_source(size))
+
+    return results
+
+# }}}
+
+
+# {{{ generation
+
+def measure_generation(generator_class, ast):
+    from pycparser.c_generator import CGenerator
+
+    class GetattrGenerator(generator_class):
+        visit = CGenerator.visit
+        _generate_stmt = CGenerator._generate_stmt
+
+    nnodes = count_nodes(ast)
+    nchars = len(generator_class().visit(ast))
+    generate_s = best_of(lambda: generator_class().visit(ast))
+
+    return {
+            "generate_s": generate_s,
+            "getattr_generate_s": best_of(
+                lambda: GetattrGenerator().visit(ast)),
+            "generate_nodes_per_s": nnodes / generate_s,
+            "generate_chars_per_s": nchars / generate_s,
+            }
+
+
+def bench_generation():
+    """Measure code generation throughput for each of the :data:`WORKLOADS`
+    (at twice the size), also with dispatching visits by looking up
+    ``visit_XXX`` for each node as pycparser does, instead of using the
+    generators' dispatch tables.
+    """
+    from pycparserext import ext_c_generator, ext_c_parser
+
+    results = {}
+    for name, (make_source, size, parser_name, generator_name) \
+            in WORKLOADS.items():
+        results[name] = measure_generation(
+                getattr(ext_c_generator, generator_name),
+                getattr(ext_c_parser, parser_name)().parse(
+                    make_source(2 * size)))
+
+    return results
+
+# }}}
+
+
+# {{{ ABI diff
+
+def bench_abi_diff():
+    """Measure structural hashing of a large GNU header and comparing it
+    with a version in which some declarations changed.
+    """
+    from pycparserext.abi_diff import diff_declarations, index_declarations
+    from pycparserext.ext_c_parser import GnuCParser
+    from pycparserext.structural import StructuralHasher
+
+    text = make_gnu_source(2000)
+    old_ast = GnuCParser().parse(text)
+    new_ast = GnuCParser().parse(
+            text.replace("__nonnull__ (1)", "__nonnull__ (2)", 100))
+
+    ndecls = len(index_declarations(old_ast))
+    nchanges = len(diff_declarations(old_ast, new_ast))
+
+    hash_s = best_of(lambda: StructuralHasher().hash(old_ast))
+    diff_s = best_of(lambda: diff_declarations(old_ast, new_ast))
+
+    return {
+            "declarations": ndecls,
+            "changes": nchanges,
+            "hash_s": hash_s,
+            "hash_nodes_per_s": count_nodes(old_ast) / hash_s,
+            "diff_s": diff_s,
+            "diff_declarations_per_s": ndecls / diff_s,
+            }
+
+# }}}
+
+
+# {{{ declaration index
+
+def bench_declaration_index():
+    """Measure the cost of indexing the top-level declarations of a large GNU
+    header while parsing it, and of looking up all of its functions by name
+    in the index.
+    """
+    from pycparserext.ext_c_parser import GnuCParser
+
+    text = make_gnu_source(2000)
+    ast = GnuCParser(index_declarations=True).parse(text)
+    names = [name for name, decl in ast.index.items()
+            if decl.kind == "function"]
+
+    def look_up():
+        index = ast.index
+        for name in names:
+            index[name]
+
+    return {
+            "parse_s": best_of(lambda: GnuCParser().parse(text)),
+            "indexing_parse_s": best_of(
+                lambda: GnuCParser(index_declarations=True).parse(text)),
+            "lookup_all_functions_s": best_of(look_up),
+            }
+
+# }}}
+
+
+# {{{ serialization
+
+def bench_serialize():
+    """Compare storing and loading a parsed large GNU header in the binary
+    format of :mod:`pycparserext.serialize` with pickling it and with
+    parsing it again.
+    """
+    import pickle
+
+    from pycparserext import serialize
+    from pycparserext.ext_c_parser import GnuCParser
+
+    text = make_gnu_source(2000)
+    ast = GnuCParser().parse(text)
+    data = serialize.dumps(ast)
+    pickled = pickle.dumps(ast, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Loading creates many long-lived objects, so the garbage collector's
+    # share of the time matters. Also measure it as users would see it.
+    return {
+            "parse_s": best_of(lambda: GnuCParser().parse(text)),
+            "dump_s": best_of(lambda: serialize.dumps(ast)),
+            "load_s": best_of(lambda: serialize.loads(data)),
+            "load_with_gc_s": best_of(
+                lambda: serialize.loads(data), with_gc=True),
+            "load_one_decl_s": best_of(
+                lambda: serialize.ASTReader(data)[len(ast.ext) // 2]),
+            "size_mb": len(data) / 1e6,
+            "pickle_dump_s": best_of(
+                lambda: pickle.dumps(ast, protocol=pickle.HIGHEST_PROTOCOL)),
+            "pickle_load_s": best_of(lambda: pickle.loads(pickled)),
+            "pickle_load_with_gc_s": best_of(
+                lambda: pickle.loads(pickled), with_gc=True),
+            "pickle_size_mb": len(pickled) / 1e6,
+            }
+
+# }}}
+
+
+# {{{ prelude snapshots
+
+def bench_snapshot():
+    """Compare parsing a small translation unit along with a large GNU
+    prelude with parsing it starting from a snapshot of the prelude, taken
+    in memory or loaded from disk.
+    """
+    from pycparserext.ext_c_parser import GnuCParser
+    from pycparserext.snapshot import ParserSnapshot
+
+    prelude = make_gnu_source(2000)
+    text = '__u17_t f(__u3_t n) { return __f5("x", n); }\n'
+
+    parser = GnuCParser()
+    snapshot = parser.parse_prelude(prelude)
+    data = snapshot.dumps()
+
+    def parse_from_disk():
+        parser.parse(text, snapshot=ParserSnapshot.loads(data))
+
+    return {
+            "parse_with_prelude_s": best_of(
+                lambda: parser.parse(prelude + text)),
+            "parse_from_snapshot_s": best_of(
+                lambda: parser.parse(text, snapshot=snapshot)),
+            "parse_from_saved_snapshot_s": best_of(parse_from_disk),
+            "snapshot_size_mb": len(data) / 1e6,
+            }
+
+# }}}
+
+
+# {{{ lazy function bodies and initializers
+
+def bench_lazy_bodies():
+    """Compare parsing implementation-like GNU C with and without deferring
+    the parsing of function bodies, and with accessing all bodies
+    afterwards.
+    """
+    from pycparser import c_ast
+
+    from pycparserext.ext_c_parser import GnuCParser
+
+    def parse_and_access_bodies(text):
+        ast = GnuCParser(lazy_function_bodies=True).parse(text)
+        for node in ast.ext:
+            if isinstance(node, c_ast.FuncDef):
+                assert node.body is not None
+
+    results = {}
+    for name, text in [
+            ("gnu", make_gnu_source(2000)),
+            ("asm", make_asm_source(2000)),
+            ]:
+        results[name] = {
+                "eager_s": best_of(lambda text=text: GnuCParser().parse(text)),
+                "lazy_s": best_of(
+                    lambda text=text:
+                        GnuCParser(lazy_function_bodies=True).parse(text)),
+                "lazy_all_bodies_s": best_of(
+                    lambda text=text: parse_and_access_bodies(text)),
+                }
+    return results
+
+
+def bench_lazy_initializers():
+    """Compare parsing a large generated table with and without deferring
+    the parsing of its initializer.
+    """
+    from pycparserext.ext_c_parser import GnuCParser
+
+    text = make_table_source(20000)
+    return {
+            "eager_s": best_of(lambda: GnuCParser().parse(text)),
+            "lazy_s": best_of(
+                lambda: GnuCParser(lazy_initializers=True).parse(text)),
+            }
+
+# }}}
+
+
+# {{{ streaming generation
+
+def bench_generate_to():
+    """Compare generating code for a large OpenCL translation unit as a
+    string with writing it to a file as it is generated.
+    """
+    import os
+
+    from pycparserext.ext_c_generator import OpenCLCGenerator
+    from pycparserext.ext_c_parser import OpenCLCParser
+
+    ast = OpenCLCParser().parse(make_opencl_source(5000))
+
+    def generate_to_file():
+        with open(os.devnull, "w") as outf:
+            OpenCLCGenerator().generate_to(ast, outf)
+
+    return {
+            "visit_s": best_of(lambda: OpenCLCGenerator().visit(ast)),
+            "generate_to_file_s": best_of(generate_to_file),
+            "generate_to_list_s": best_of(
+                lambda: OpenCLCGenerator().generate_to(ast, [])),
+            "visit_peak_mb":
+            peak_memory(lambda: OpenCLCGenerator().visit(ast)) / 1e6,
+            "generate_to_file_peak_mb": peak_memory(generate_to_file) / 1e6,
+            }
+
+# }}}
+
+
+# {{{ deep chains
+
+def make_chain_source(n):
+    """Return synthetic generated C with an *n*-arm else-if chain, each arm
+    of which evaluates a polynomial with *n* terms.
+    """
+    return "int f(int x, int y)\n{\n  %s\n  else y = 0;\n  return y;\n}\n" % (
+            "\n  else ".join(
+                "if (x == %d) y = %s;" % (i, " + ".join(
+                    "%d * x" % j for j in range(n)))
+                for i in range(n)))
+
+
+def bench_deep_chains():
+    """Compare parsing, generating code for and visiting generated C with
+    long else-if chains and sums with and without recursing per link. The
+    recursive versions run with a raised recursion limit.
+    """
+    from pycparser import c_ast
+    from pycparser.c_generator import CGenerator
+
+    from pycparserext.ext_c_generator import GnuCGenerator
+    from pycparserext.ext_c_parser import GnuCParser
+    from pycparserext.traversal import NodeVisitor
+
+    class RecursiveGnuCGenerator(GnuCGenerator):
+        visit_BinaryOp = CGenerator.visit_BinaryOp
+        visit_If = CGenerator.visit_If
+
+    class IDCounter(NodeVisitor):
+        def __init__(self):
+            self.count = 0
+
+        def visit_ID(self, node):
+            self.count += 1
+
+    class RecursiveIDCounter(c_ast.NodeVisitor):
+        def __init__(self):
+            self.count = 0
+
+        def visit_ID(self, node):
+            self.count += 1
+
+    text = make_chain_source(300)
+    ast = GnuCParser().parse(text)
+
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, 20000))
+    try:
+        recursive_generate_s = best_of(
+                lambda: RecursiveGnuCGenerator().visit(ast))
+        recursive_visit_s = best_of(
+                lambda: RecursiveIDCounter().visit(ast))
+    finally:
+        sys.setrecursionlimit(recursion_limit)
+
+    return {
+            "parse_s": best_of(lambda: GnuCParser().parse(text)),
+            "generate_s": best_of(lambda: GnuCGenerator().visit(ast)),
+            "recursive_generate_s": recursive_generate_s,
+            "visit_s": best_of(lambda: IDCounter().visit(ast)),
+            "recursive_visit_s": recursive_visit_s,
+            }
+
+# }}}
+
+
+# {{{ snippets
+
+SNIPPETS = {
+        "gnu": [
+            "static inline int f%d(int x) { return x + %d; }",
+            "typedef struct { int a; char b[%d]; } s%d_t;",
+            ('extern void *g%d(unsigned long n) __attribute__((malloc))'
+                ' __asm__("g%d");'),
+            ],
+        "opencl": [
+            ("__kernel void k%d(__global float4 *a) "
+                "{ a[get_global_id(0)] *= (float4)(%d); }"),
+            "typedef struct { uint2 v; int n[%d]; } s%d_t;",
+            "constant half8 c%d = (half8)(%d);",
+            ],
+        }
+
+
+def bench_snippets():
+    """Measure the throughput of parsing many small snippets, with a new
+    parser for each, and with one parser reused, with and without
+    :meth:`~pycparserext.ext_c_parser.CParserBase.reset` after each parse.
+    """
+    from pycparserext.ext_c_parser import GnuCParser, OpenCLCParser
+
+    results = {}
+    for name, parser_class in [
+            ("gnu", GnuCParser),
+            ("opencl", OpenCLCParser),
+            ]:
+        snippets = [
+                template % (i, i)
+                for i in range(1000)
+                for template in SNIPPETS[name]]
+
+        def parse_new(parser_class=parser_class, snippets=snippets):
+            for snippet in snippets:
+                parser_class().parse(snippet)
+
+        def parse_reused(parser_class=parser_class, snippets=snippets):
+            parser = parser_class()
+            for snippet in snippets:
+                parser.parse(snippet)
+
+        def parse_reset(parser_class=parser_class, snippets=snippets):
+            parser = parser_class()
+            for snippet in snippets:
+                parser.parse(snippet)
+                parser.reset()
+
+        results[name] = {
+                "new_parser_per_s": len(snippets) / best_of(parse_new),
+                "reused_parser_per_s": len(snippets) / best_of(parse_reused),
+                "reset_parser_per_s": len(snippets) / best_of(parse_reset),
+                }
+    return results
+
+# }}}
+
+
+BENCHMARKS = {
+    "nested_declarators": bench_nested_declarators,
+    "ast_memory": bench_ast_memory,
+    "throughput": bench_throughput,
+    "generation": bench_generation,
+    "abi_diff": bench_abi_diff,
+    "declaration_index": bench_declaration_index,
+    "serialize": bench_serialize,
+    "snapshot": bench_snapshot,
+    "lazy_bodies": bench_lazy_bodies,
+    "lazy_initializers": bench_lazy_initializers,
+    "snippets": bench_snippets,
+    "generate_to": bench_generate_to,
+    "deep_chains": bench_deep_chains,
+    }
+
+
+# {{{ reporting
+
+def flatten(results, prefix=""):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            yield from flatten(value, prefix + key + ".")
+        else:
+            yield prefix + key, value
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return "%.4g" % value
+    return str(value)
+
+
+def metadata():
+    import platform
+    import subprocess
+    from datetime import datetime, timezone
+    from pathlib import Path
+
+    import pycparser
+
+    try:
+        commit = subprocess.run(
+                ["git", "rev-parse", "HEAD"],
+                cwd=Path(__file__).parent, capture_output=True, text=True,
+                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+            "date": datetime.now(timezone.utc).isoformat(),
+            "commit": commit,
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "pycparser": pycparser.__version__,
+            }
+
+
+def lower_is_better(metric):
+    """Return *True* if smaller values of *metric* are better, *False* if
+    larger ones are, and *None* if it is not a performance figure.
+    """
+    if metric.endswith("_per_s"):
+        return False
+    if metric.endswith(("_s", "_mb", "bytes_per_node")):
+        return True
+    return None
+
+
+def compare(old_path, new_path, threshold):
+    import json
+
+    with open(old_path) as inf:
+        old = dict(flatten(json.load(inf)["results"]))
+    with open(new_path) as inf:
+        new = dict(flatten(json.load(inf)["results"]))
+
+    nregressions = 0
+    for metric in sorted(old.keys() & new.keys()):
+        direction = lower_is_better(metric)
+        if direction is None or not old[metric]:
+            continue
+
+        ratio = new[metric] / old[metric]
+        worse = ratio - 1 if direction else 1 - ratio
+        flag = ""
+        if worse > threshold:
+            flag = "  REGRESSION"
+            nregressions += 1
+
+        print("%-45s %10s -> %10s  %+6.1f%%%s" % (
+            metric, format_value(old[metric]), format_value(new[metric]),
+            100 * (ratio - 1), flag))
+
+    return nregressions
+
+# }}}
+
+
+def main():
+    import argparse
+    import json
+
+    global REPEAT
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("names", nargs="*", metavar="NAME",
+            help="benchmarks to run, out of: %s" % ", ".join(BENCHMARKS))
+    parser.add_argument("--json", metavar="FILE",
+            help="save results to FILE")
+    parser.add_argument("--repeat", type=int, default=REPEAT,
+            help="number of timed runs to take the best of")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+            help="compare two result files saved with --json")
+    parser.add_argument("--threshold", type=float, default=0.1,
+            help="relative change considered a regression by --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    REPEAT = args.repeat
+
+    names = args.names or list(BENCHMARKS)
+    results = {}
+    for name in names:
+        print("== %s" % name)
+        results[name] = BENCHMARKS[name]()
+        for metric, value in flatten(results[name]):
+            print("%-45s %10s" % (metric, format_value(value)))
+
+    if args.json:
+        with open(args.json, "w") as outf:
+            json.dump({"meta": metadata(), "results": results}, outf,
+                    indent=2)
+
+
+if __name__ == "__main__":
+    main()
+
+# vim: fdm=marker
@@ -762,6 +762,1177 @@ def test_attribute_in_struct():
     assert _round_trip_matches(src)
 
 
+def test_parse_cache(tmp_path):
+    from pycparser.c_parser import ParseError
+
+    from pycparserext.cache import ParseCache
+    from pycparserext.ext_c_generator import GnuCGenerator
+    from pycparserext.ext_c_parser import GnuCParser
+
+    src = """
+    struct __attribute__((packed)) s { int a; };
+    int foo asm("renamed_foo");
+    extern int bar(int x) __attribute__((__nonnull__ (1), __leaf__));
+    void f(void) { asm volatile("nop"); }
+    """
+
+    cache = ParseCache(tmp_path / "cache")
+    p = GnuCParser(cache=cache)
+
+    first_ast = p.parse(src, filename="x.h")
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+
+    cached_ast = p.parse(src, filename="x.h")
+    assert cached_ast is not first_ast
+    assert _compare_asts(first_ast, cached_ast)
+    assert GnuCGenerator().visit(cached_ast) == GnuCGenerator().visit(first_ast)
+
+    # the key depends on the initial type symbols
+    p.parse("foo_t x;", initial_type_symbols={"foo_t"})
+    assert len(list((tmp_path / "cache").iterdir())) == 2
+
+    # ... and on the other identifiers in the initial scope, since
+    # declaring one of them as a typedef name is an error
+    snapshot = p.parse_prelude("int x;")
+    p.parse("typedef int x; x y;")
+    with pytest.raises(ParseError):
+        p.parse("typedef int x; x y;", snapshot=snapshot)
+    assert len(list((tmp_path / "cache").iterdir())) == 3
+
+    # ... and on options that affect the AST
+    interned_ast = GnuCParser(cache=cache, intern_attributes=True).parse(
+            src, filename="x.h")
+    assert len(list((tmp_path / "cache").iterdir())) == 4
+    assert _compare_asts(first_ast, interned_ast)
+
+    # lazy parsers do not use the cache
+    lazy_ast = GnuCParser(cache=cache, lazy_function_bodies=True).parse(
+            src, filename="x.h")
+    assert not lazy_ast.ext[-1].body_parsed
+    assert len(list((tmp_path / "cache").iterdir())) == 4
+
+    # eviction keeps the cache within its size bound
+    cache.max_size = 0
+    cache.evict()
+    assert cache.total_size() == 0
+
+
+def test_incremental_parse():
+    from pycparserext.ext_c_parser import GnuCParser
+    from pycparserext.incremental import IncrementalParser
+
+    def ast_with_coords(ast):
+        result = []
+
+        def dump(node):
+            result.append((type(node).__name__,
+                           [getattr(node, a) for a in node.attr_names],
+                           str(node.coord) if node.coord else None))
+            for _, child in node.children():
+                dump(child)
+
+        dump(ast)
+        return result
+
+    parts = [
+        "typedef int T%d;\nint f%d(T%d a) {\n  return a + %d;\n}\n"
+        % (i, i, i, i)
+        for i in range(20)]
+
+    inc = IncrementalParser(GnuCParser())
+    first_ast = inc.parse("".join(parts), "a.c")
+    first_coords = ast_with_coords(first_ast)
+    assert inc.n_reparsed == 40
+
+    # edit a function body, adding a line
+    parts[10] = parts[10].replace("return a", "a++;\n  return a")
+    src = "".join(parts)
+    ast = inc.parse(src, "a.c")
+    assert inc.n_reparsed == 1
+    assert inc.n_reused == 39
+    assert ast_with_coords(ast) == ast_with_coords(GnuCParser().parse(src, "a.c"))
+    # the previously returned AST is left alone
+    assert ast_with_coords(first_ast) == first_coords
+
+    # turning a typedef into a variable changes how later code parses
+    parts[3] = (parts[3]
+                .replace("typedef int T3;", "int T3;")
+                .replace("T3 a", "int a"))
+    parts[4] = parts[4] + "int g(void) { return T3 * 2; }\n"
+    src = "".join(parts)
+    ast = inc.parse(src, "a.c")
+    assert inc.n_reparsed < 10
+    assert ast_with_coords(ast) == ast_with_coords(GnuCParser().parse(src, "a.c"))
+
+    # interned attribute lists keep the coordinates of their first occurrence
+    parts = [
+        "int g%d(void) __attribute__((unused));\nint f%d(void) {\n"
+        "  return %d;\n}\n" % (i, i, i)
+        for i in range(10)]
+    inc = IncrementalParser(GnuCParser(intern_attributes=True))
+    inc.parse("".join(parts), "a.c")
+    parts[5] = parts[5].replace("return", "\n  return")
+    src = "".join(parts)
+    ast = inc.parse(src, "a.c")
+    assert inc.n_reused
+    assert ast_with_coords(ast) == ast_with_coords(
+            GnuCParser(intern_attributes=True).parse(src, "a.c"))
+
+    # the parser's index_declarations is honored
+    from pycparserext.ext_c_parser import FileASTExt
+
+    inc = IncrementalParser(GnuCParser(index_declarations=True))
+    inc.parse(src, "a.c")
+    ast = inc.parse(src.replace("int f7", "long f7"), "a.c")
+    assert inc.n_reused
+    assert isinstance(ast, FileASTExt)
+    assert ast.index["f7"].node is ast.ext[15]
+    assert ast.index["g9"].node is ast.ext[18]
+
+
+def test_pickle_extension_nodes():
+    import pickle
+
+    from pycparserext.ext_c_generator import GnuCGenerator
+    from pycparserext.ext_c_parser import GnuCParser, PreprocessorLine
+
+    src = """
+    struct __attribute__((packed)) s { int a; };
+    int foo asm("renamed_foo") __attribute__((aligned(8)));
+    int f(int a) __attribute__((__nonnull__ (1)));
+    int f(int a) {
+        __typeof__(a) b = __builtin_types_compatible_p(int, long);
+        __typeof__(int *) c;
+        asm volatile("nop" : : : "memory");
+        switch (a) { case 1 ... 2: break; }
+        return b;
+    }
+    int tbl[] = { [0 ... 2] = 1 };
+    """
+    ast = GnuCParser().parse(src)
+    unpickled = pickle.loads(pickle.dumps(ast))
+    assert _compare_asts(ast, unpickled)
+    assert "decls=" in repr(unpickled.ext[0].type)
+    assert "attrib=" in repr(unpickled.ext[0].type)
+    assert "declname=" in repr(unpickled.ext[1].type)
+    assert "asm=" in repr(unpickled.ext[1].type)
+    assert GnuCGenerator().visit(unpickled) == GnuCGenerator().visit(ast)
+
+    ppline = pickle.loads(pickle.dumps(PreprocessorLine("#define X 1\n")))
+    assert ppline.contents == "#define X 1\n"
+
+    from pycparser import c_ast
+
+    from pycparserext.ext_c_parser import StructExt
+
+    struct = pickle.loads(pickle.dumps(
+            StructExt.from_pycparser(c_ast.Struct("s", None))))
+    assert struct.attrib is None
+    assert "attrib=None" in repr(struct)
+
+
+def test_parse_many(tmp_path):
+    from pycparserext.ext_c_generator import OpenCLCGenerator
+    from pycparserext.ext_c_parser import OpenCLCParser
+    from pycparserext.parallel import parse_many
+
+    good_path = tmp_path / "good.cl"
+    good_path.write_text("__kernel void k(__global float4 *x) { x[0] = 1; }\n")
+
+    undecodable_path = tmp_path / "latin1.cl"
+    undecodable_path.write_bytes(b"int x; /* \xff */\n")
+
+    sources = [
+        good_path,
+        "float2 f(float2 a) { return a; }",
+        "int broken(;",
+        tmp_path / "missing.cl",
+        undecodable_path,
+        # too deep to send back from a worker
+        "int x = %s1%s;" % ("(" * 100000, ")" * 100000),
+        ] + ["int i%d;" % i for i in range(10)]
+    results = sorted(
+            parse_many(iter(sources), parser_class=OpenCLCParser, workers=2),
+            key=lambda r: r.index)
+
+    assert [r.index for r in results] == list(range(len(sources)))
+    assert results[0].source == str(good_path)
+    assert results[0].ast.ext[0].coord.file == str(good_path)
+    assert "__kernel" in OpenCLCGenerator().visit(results[0].ast)
+    assert results[1].error is None
+    assert results[1].source is None
+    assert results[2].ast is None
+    assert results[2].error.startswith(":1:")
+    assert results[3].ast is None
+    assert results[3].error is not None
+    assert results[4].source == str(undecodable_path)
+    assert results[4].error.startswith("UnicodeDecodeError: ")
+    assert results[5].ast is None
+    assert results[5].error.startswith("RecursionError: ")
+    assert all(r.error is None for r in results[6:])
+
+
+def test_parse_parallel():
+    from pycparserext.ext_c_parser import GnuCParser
+    from pycparserext.parallel import parse_parallel
+
+    src = "".join(
+            '# %d "hdr%d.h"\n'
+            "typedef struct s%d { int a; } T%d;\n"
+            'static T%d f%d(T%d x) { char c = "};{"[0]; return x; } '
+            "int v%d = 3;\n"
+            "struct s%d g%d(void) { struct s%d r = {0}; return r; }\n"
+            % ((10*i + 1, i % 3) + (i,)*9)
+            for i in range(40))
+
+    def dump(node):
+        result = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            result.append((type(node).__name__, str(node.coord),
+                tuple(getattr(node, a) for a in node.attr_names)))
+            stack.extend(child for _, child in node.children())
+        return result
+
+    ref = GnuCParser().parse(src, "main.c")
+    ast = parse_parallel(src, filename="main.c", workers=2, min_chunk_size=256)
+    assert dump(ast) == dump(ref)
+
+    # with an index, as returned by a sequential parse
+    from pycparserext.ext_c_parser import FileASTExt
+
+    ref = GnuCParser(index_declarations=True).parse(src, "main.c")
+    ast = parse_parallel(src, filename="main.c", workers=2, min_chunk_size=256,
+            parser_kwargs={"index_declarations": True})
+    assert isinstance(ast, FileASTExt)
+    assert dump(ast) == dump(ref)
+
+    def dump_index(index):
+        return [(decl.name, decl.kind, str(decl.coord))
+                for decls in [index.names, index.tags]
+                for decl in decls.values()]
+
+    assert dump_index(ast.index) == dump_index(ref.index)
+
+    from pycparser.c_parser import ParseError
+    with pytest.raises(ParseError):
+        parse_parallel(src + "int broken(;\n", workers=2, min_chunk_size=256)
+
+    # a typedef name redeclared in a later chunk, which each chunk accepts
+    with pytest.raises(ParseError):
+        parse_parallel("int U;\n" + src + "typedef int U;\n",
+                workers=2, min_chunk_size=256)
+
+
+def test_tokenize(tmp_path):
+    import mmap
+
+    from pycparser.c_parser import ParseError
+
+    from pycparserext.ext_c_lexer import GnuCLexer, OpenCLCLexer
+
+    src = ('# 5 "a.h"\n'
+            "size_t x __attribute__((aligned(8)));\n"
+            'char *s = "\u00e9"; asm("nop");\n')
+    toks = list(GnuCLexer.tokenize(src, type_names={"size_t"}))
+    assert toks[0] == ("TYPEID", "size_t", 5, 1)
+    assert toks[2] == ("__ATTRIBUTE__", "__attribute__", 5, 10)
+    assert toks[-5] == ("ASM", "asm", 6, 16)
+
+    path = tmp_path / "a.i"
+    path.write_text(src, encoding="utf-8")
+    with open(path, "rb") as inf, \
+            mmap.mmap(inf.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        assert list(GnuCLexer.tokenize(
+            mm, type_names={"size_t"}, chunk_size=7)) == toks
+
+    assert [tok.type for tok in OpenCLCLexer.tokenize(
+        "__kernel void f(); // comment\n")] == [
+            "__KERNEL", "VOID", "ID", "LPAREN", "RPAREN", "SEMI"]
+
+    # typedef names take precedence over extension keywords
+    assert [tok.type for tok in GnuCLexer.tokenize(
+        "typeof x; typeof(x) y;", type_names={"x"})][:3] == [
+            "TYPEOF", "TYPEID", "SEMI"]
+    assert next(GnuCLexer.tokenize(
+        "typeof x;", type_names={"typeof"})).type == "TYPEID"
+
+    with pytest.raises(ParseError, match=r"f\.c:2:2"):
+        list(GnuCLexer.tokenize("int\n @;", "f.c"))
+
+
+def test_parse_file(tmp_path):
+    from pycparserext.cache import ParseCache
+    from pycparserext.ext_c_generator import GnuCGenerator
+    from pycparserext.ext_c_parser import GnuCParser
+
+    src = "".join(
+            "typedef int t%d;\n"
+            "t%d f%d(t%d x) __attribute__((__const__));\n"
+            'char *s%d = "\u00e9";\n' % (i, i, i, i, i)
+            for i in range(50))
+    path = tmp_path / "big.i"
+    path.write_text(src, encoding="utf-8")
+
+    p = GnuCParser()
+    ref = p.parse(src, str(path))
+    ast = p.parse_file(path, chunk_size=100)
+    assert _compare_asts(ast, ref)
+    assert ast.ext[-1].coord.file == str(path)
+    assert ast.ext[-1].coord.line == 150
+    assert GnuCGenerator().visit(ast) == GnuCGenerator().visit(ref)
+
+    empty_path = tmp_path / "empty.i"
+    empty_path.write_text("")
+    assert p.parse_file(empty_path).ext == []
+
+    # parse and parse_file share cache entries
+    cache = ParseCache(tmp_path / "cache")
+    p = GnuCParser(cache=cache)
+    p.parse(src, str(path))
+    p.parse_file(path)
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+
+
+def test_profile():
+    from pycparserext.ext_c_parser import GnuCParser
+    from pycparserext.profiling import LEXER_ENTRY
+
+    src = """
+        typedef int t;
+        extern int f(t x) __attribute__((__nonnull__(1))) asm("g");
+        void h(void) { t y = (t) 1; asm volatile("nop"); }
+        """
+
+    profiles = []
+    p = GnuCParser()
+    with p.profile(callback=profiles.append) as prof:
+        ast = p.parse(src)
+
+    assert profiles == [prof]
+    assert prof.tokens == prof.entries[LEXER_ENTRY].calls > 0
+    entry = prof.entries["_parse_external_declaration"]
+    assert entry.calls == 3
+    assert entry.cumulative_time >= entry.self_time > 0
+    assert prof.entries["_parse_translation_unit"].calls == 1
+    assert sum(e.backtracks for e in prof.entries.values()) > 0
+    assert "_parse_external_declaration" in prof.report()
+
+    # wrappers are removed again
+    assert "_parse_external_declaration" not in vars(p)
+    assert "token" not in vars(p.clex)
+    assert _compare_asts(p.parse(src), ast)
+
+
+def test_nested_declarators():
+    src = """
+        typedef int T;
+        void (*signal(int sig, void (*func)(int)))(int);
+        int (*(*f(T (*g)(T), int (T)))(void))[3];
+        """
+    decl = "int x"
+    for i in range(30):
+        decl = "void (*p%d(%s))(int)" % (i, decl)
+    src += decl + ";\n"
+
+    assert _round_trip_matches(src)
+
+
+def test_group_matching_token_stream():
+    from pycparserext.ext_c_parser import GnuCParser, _GroupMatchingTokenStream
+
+    parser = GnuCParser()
+    parser.clex.input("f(a[(1)], { b ] }) ; g(")
+    tokens = _GroupMatchingTokenStream(parser.clex)
+
+    # f ( a [ ( 1 ) ] , { b ] } ) ; g (
+    assert tokens.group_end(1) == 14
+    assert tokens.group_end(3) == 8
+    assert tokens.group_end(4) == 7
+    assert tokens.group_end(9) == 13
+    assert tokens.group_end(16) is None
+
+    tokens._index = 14
+    tokens.discard_consumed()
+    assert tokens.peek().type == "SEMI"
+    assert tokens.group_end(2) is None
+
+    src = """
+        extern int snprintf(char *__restrict s, unsigned long maxlen,
+            const char *__restrict format, ...)
+            __attribute__((__nothrow__, __leaf__))
+            __attribute__((__format__(__printf__, 3, 4)))
+            __attribute__((__nonnull__(1, 3)));
+        void (*(*set_handler)(int sig, void (*handler)(int)))(int)
+            __attribute__((__nonnull__(2), __warn_unused_result__));
+        """
+    assert _round_trip_matches(src)
+
+
+def test_intern_attributes():
+    from pycparserext.ext_c_generator import GnuCGenerator
+    from pycparserext.ext_c_parser import GnuCParser
+
+    src = """
+        extern int f(int *p) __attribute__((__nothrow__, __leaf__))
+            __attribute__((__nonnull__(1)));
+        extern int g(int *q) __attribute__((__nothrow__, __leaf__))
+            __attribute__((__nonnull__ (1)));
+        extern int h(int *r) __attribute__((__nonnull__(2)));
+        struct __attribute__((packed)) s1 { int x; };
+        struct __attribute__((packed)) s2 { int y; };
+        int a __attribute__((aligned(sizeof(struct s1))));
+        """
+
+    parser = GnuCParser(intern_attributes=True)
+    ast = parser.parse(src)
+    f, g, h, s1, s2, _a = ast.ext
+
+    assert f.type.attributes is g.type.attributes
+    assert f.type.attributes is not h.type.attributes
+    assert s1.type.attrib is s2.type.attrib
+    assert s1.type.attrib == s2.type.attrib
+
+    gen = GnuCGenerator()
+    assert gen.visit(ast) == gen.visit(GnuCParser().parse(src))
+
+    # the table does not outlive a parse
+    table_size = len(parser._interned_attributes)
+    other_ast = parser.parse(src)
+    assert len(parser._interned_attributes) == table_size
+    assert other_ast.ext[0].type.attributes is not f.type.attributes
+    parser.reset()
+    assert not parser._interned_attributes
+
+
+def test_structural_hash():
+    from pycparser import c_ast
+
+    from pycparserext.ext_c_parser import GnuCParser
+    from pycparserext.structural import StructuralHasher, structurally_equal
+
+    old = GnuCParser().parse("""
+        struct __attribute__((packed)) s { int x; };
+        extern int f(int *p) __attribute__((__nonnull__(1)));
+        int g(void) { asm("nop" : : "r"(1)); return 0; }
+        """)
+    new = GnuCParser().parse("""
+
+        struct __attribute__((packed)) s { int x; };
+        extern int f(int *p) __attribute__((__nonnull__(2)));
+        int g(void) { asm("nop" : : "r"(2)); return 0; }
+        """)
+
+    hasher = StructuralHasher()
+    assert structurally_equal(old.ext[0], new.ext[0], hasher)
+    assert hasher.hash(old.ext[0]) == hasher.hash(new.ext[0])
+    assert not structurally_equal(old.ext[1], new.ext[1], hasher)
+    assert not structurally_equal(old.ext[2], new.ext[2], hasher)
+    assert not structurally_equal(old, new)
+
+    # StructExt.attrib is not among the node's children
+    old.ext[0].type.attrib.exprlist.exprs[0].name = "aligned"
+    assert not structurally_equal(old.ext[0], new.ext[0])
+
+    # deeper than the recursion limit
+    def make_deep(leaf):
+        node = c_ast.Constant("int", leaf)
+        for _ in range(5000):
+            node = c_ast.UnaryOp("-", node)
+        return node
+
+    assert structurally_equal(make_deep("1"), make_deep("1"))
+    assert not structurally_equal(make_deep("1"), make_deep("2"))
+
+
+def test_abi_diff():
+    from pycparserext.abi_diff import Difference, diff_declarations
+    from pycparserext.ext_c_parser import GnuCParser
+
+    old = GnuCParser().parse("""
+        extern int f(int a, char *b) __asm__("f1")
+            __attribute__((__nonnull__(2)));
+        extern int g(int a);
+        extern void gone(void);
+        struct __attribute__((packed)) s { int x; char y; int z : 3; };
+        typedef int v4 __attribute__((vector_size(16)));
+        enum e { A, B = 3 };
+        int var __asm__("v1");
+        """)
+    new = GnuCParser().parse("""
+
+        extern int f(int a, long *b) __asm__("f2")
+            __attribute__((__nonnull__(1)));
+        extern int g(int renamed);
+        extern long added(void);
+        struct s { char y; int x; long w; int z : 4; };
+        typedef int v4 __attribute__((vector_size(32)));
+        enum e { A, B = 4 };
+        int var __asm__("v2");
+        """)
+
+    changes = {
+            (change.kind, change.category, change.name): change.differences
+            for change in diff_declarations(old, new)}
+
+    assert set(changes["changed", "function", "f"]) == {
+            Difference("parameter 2 type", "char *", "long *"),
+            Difference("attributes", "__nonnull__(2)", "__nonnull__(1)"),
+            Difference("asm label", '__asm__("f1")', '__asm__("f2")')}
+    assert set(changes["changed", "struct", "s"]) == {
+            Difference("attributes", "packed", None),
+            Difference("member order", "x, y, z", "y, x, z"),
+            Difference("member w", None, "long w"),
+            Difference("member z bit width", "3", "4")}
+    assert changes["changed", "typedef", "v4"] == (
+            Difference("attributes", "vector_size(16)", "vector_size(32)"),)
+    assert changes["changed", "enum", "e"] == (
+            Difference("enumerator B value", "3", "4"),)
+    assert changes["changed", "variable", "var"] == (
+            Difference("asm label", '__asm__("v1")', '__asm__("v2")'),)
+    assert ("removed", "function", "gone") in changes
+    assert ("added", "function", "added") in changes
+
+    # renamed parameters and moved lines are not changes
+    assert len(changes) == 7
+
+    # declarations are matched as by DeclarationIndex: definitions take
+    # precedence over later declarations, and tags defined in members are
+    # in file scope, also with an index made by the parser
+    old = GnuCParser(index_declarations=True).parse("""
+        struct s;
+        struct t { struct inner { int a; } in; };
+        int count = 1;
+        extern int count;
+        """)
+    new = GnuCParser().parse("""
+        struct t { struct inner { long a; } in; };
+        long count = 1;
+        """)
+    assert old.index is not None
+    changes = {
+            (change.kind, change.category, change.name): change.differences
+            for change in diff_declarations(old, new)}
+    assert set(changes) == {
+            ("changed", "struct", "t"),
+            ("changed", "struct", "inner"),
+            ("changed", "variable", "count")}
+    assert changes["changed", "struct", "inner"] == (
+            Difference("member a type", "int", "long"),)
+    assert changes["changed", "variable", "count"] == (
+            Difference("type", "int", "long"),)
+
+    # attributes following the closing brace of a tag definition end up
+    # with the declaration, but belong to the tag
+    old = GnuCParser().parse("""
+        struct s { int a; } __attribute__((packed));
+        union u { int a; };
+        enum e { A } __attribute__((packed));
+        """)
+    new = GnuCParser().parse("""
+        struct s { int a; };
+        union u { int a; } __attribute__((aligned(8)));
+        enum e { A } __attribute__((packed));
+        """)
+    changes = {
+            (change.kind, change.category, change.name): change.differences
+            for change in diff_declarations(old, new)}
+    assert changes == {
+            ("changed", "struct", "s"): (
+                Difference("attributes", "packed", None),),
+            ("changed", "union", "u"): (
+                Difference("attributes", None, "aligned(8)"),),
+            }
+
+
+def test_serialize():
+    from pycparserext import serialize
+    from pycparserext.ext_c_generator import GnuCGenerator
+    from pycparserext.ext_c_parser import GnuCParser
+    from pycparserext.structural import structurally_equal
+
+    src = """
+    struct __attribute__((packed)) s { int a; };
+    int foo asm("renamed_foo") __attribute__((aligned(8)));
+    int f(int a) __attribute__((__nonnull__ (1)));
+    int g(int b) __attribute__((__nonnull__ (1)));
+    int f(int a) {
+        __typeof__(a) b = __builtin_types_compatible_p(int, long);
+        __typeof__(int *) c;
+        asm volatile("nop" : : : "memory");
+        switch (a) { case 1 ... 2: break; }
+        return b;
+    }
+    int tbl[] = { [0 ... 2] = 1 };
+    """
+    ast = GnuCParser(intern_attributes=True).parse(src, "x.c")
+    data = serialize.dumps(ast)
+
+    loaded = serialize.loads(data)
+    assert structurally_equal(ast, loaded)
+    assert GnuCGenerator().visit(loaded) == GnuCGenerator().visit(ast)
+    assert str(loaded.ext[4].decl.coord) == str(ast.ext[4].decl.coord)
+    assert loaded.ext[2].type.attributes is loaded.ext[3].type.attributes
+
+    reader = serialize.ASTReader(memoryview(data))
+    assert len(reader) == len(ast.ext)
+    assert structurally_equal(reader[4], ast.ext[4])
+    assert reader[4] is reader[4]
+    assert reader.root().ext[4] is reader[4]
+
+    with pytest.raises(ValueError):
+        serialize.loads(b"not an AST")
+    with pytest.raises(ValueError):
+        serialize.loads(data[:len(data) // 2])
+
+
+def test_lazy_function_bodies():
+    import pickle
+
+    from pycparser.c_parser import ParseError
+
+    from pycparserext.ext_c_generator import GnuCGenerator
+    from pycparserext.ext_c_parser import FuncDefExt, GnuCParser
+    from pycparserext.structural import structurally_equal
+
+    src = """
+        typedef int T;
+        static int f(int T) {
+            T = 2;
+            { typedef char U; U u = T; }
+            const char *s = "}{"; char c = '}';
+            return ({ int x = T; x + s[c]; });
+        }
+        int g(void)
+        {
+            T t = sizeof(T);
+        #line 50 "inner.c"
+            return t;
+        }
+        int h(a) int a; { return a; }
+        int after;
+        """
+
+    parser = GnuCParser(lazy_function_bodies=True)
+    ast = parser.parse(src, "x.c")
+    eager_ast = GnuCParser().parse(src, "x.c")
+
+    _, f, g, h, after = ast.ext
+    assert isinstance(f, FuncDefExt)
+    assert not f.body_parsed
+    # bodies with directives and old-style definitions are parsed eagerly
+    assert not isinstance(g, FuncDefExt)
+    assert not isinstance(h, FuncDefExt)
+    assert after.coord == eager_ast.ext[-1].coord
+
+    assert structurally_equal(f.body, eager_ast.ext[1].body)
+    assert f.body_parsed
+    assert (f.body.block_items[-1].coord
+            == eager_ast.ext[1].body.block_items[-1].coord)
+
+    gen = GnuCGenerator()
+    assert gen.visit(parser.parse(src)) == gen.visit(eager_ast)
+
+    # The body is parsed by a parser of its own, leaving the one that
+    # created the AST alone.
+    ast = parser.parse(src, "x.c")
+    parser.parse("int other;")
+    assert structurally_equal(ast.ext[1].body, eager_ast.ext[1].body)
+    assert parser.clex._lexdata == "int other;"
+    del ast
+    ast = parser.parse(src, "x.c")
+    state = (parser.clex, parser.clex._lexdata, parser._tokens,
+            parser._scope_stack)
+    assert ast.ext[1].body
+    assert (parser.clex, parser.clex._lexdata, parser._tokens,
+            parser._scope_stack) == state
+
+    f = pickle.loads(pickle.dumps(parser.parse(src, "x.c").ext[1]))
+    assert structurally_equal(f.body, eager_ast.ext[1].body)
+    assert "decl=" in repr(f)
+    assert "body=" in repr(f)
+
+    ast = parser.parse("int f(void) { return 0 0; }")
+    with pytest.raises(ParseError):
+        assert ast.ext[0].body
+
+    # '//' comments, which the OpenCL lexer skips, may contain braces
+    from pycparserext.ext_c_parser import OpenCLCParser
+
+    src = """
+        int f(int a) {
+            // close } here
+            return a / 2;
+        }
+        """
+    ast = OpenCLCParser(lazy_function_bodies=True).parse(src)
+    assert structurally_equal(ast, OpenCLCParser().parse(src))
+
+
+def test_lazy_initializers():
+    from pycparserext.ext_c_generator import GnuCGenerator
+    from pycparserext.ext_c_parser import DeclExt, GnuCParser, TypeDeclExt
+    from pycparserext.structural import structurally_equal
+
+    src = """
+        typedef struct { int code; const char *name; } entry;
+        static const entry table[] __attribute__((aligned(8))) = {
+            [0 ... 7] = { 1, "}" },
+            [8] = { .code = sizeof(entry), .name = (char []) { 'x' } },
+        };
+        int x = 3, y[] = { 1, 2 };
+        int f(void) { static int z[] = { 1 }; return z[0]; }
+        int after;
+        """
+
+    parser = GnuCParser(lazy_initializers=True)
+    ast = parser.parse(src, "x.c")
+    eager_ast = GnuCParser().parse(src, "x.c")
+
+    _, table, x, y, f, after = ast.ext
+    assert isinstance(table, DeclExt)
+    assert isinstance(table.type.type, TypeDeclExt)
+    assert table.type.type.attributes.exprs[0].name.name == "aligned"
+    assert not table.init_parsed
+    assert not isinstance(x, DeclExt)
+    assert isinstance(y, DeclExt)
+    assert after.coord == eager_ast.ext[-1].coord
+
+    assert structurally_equal(table.init, eager_ast.ext[1].init)
+    assert table.init_parsed
+    assert "storage=" in repr(table)
+    assert "init=" in repr(table)
+    assert structurally_equal(f, eager_ast.ext[4])
+
+    gen = GnuCGenerator()
+    assert gen.visit(parser.parse(src)) == gen.visit(eager_ast)
+
+    # '//' comments, which the OpenCL lexer skips, may contain braces
+    from pycparserext.ext_c_parser import OpenCLCParser
+
+    src = "__constant int tbl[2] = { 1, // }\n 2 };"
+    ast = OpenCLCParser(lazy_initializers=True).parse(src)
+    assert structurally_equal(ast, OpenCLCParser().parse(src))
+
+
+def test_parser_reset():
+    from pycparser.c_parser import ParseError
+
+    from pycparserext.ext_c_parser import OpenCLCParser
+
+    parser = OpenCLCParser()
+    with pytest.raises(ParseError):
+        parser.parse("typedef int foo; void f(void) { foo x = ; }")
+
+    parser.reset()
+    assert parser._scope_stack == [
+            dict.fromkeys(OpenCLCParser.initial_type_symbols, True)]
+    assert parser.clex._lexdata == ""
+
+    # Neither the failed parse nor this one leaks typedef names.
+    parser.parse("typedef float4 foo;")
+    with pytest.raises(ParseError):
+        parser.parse("foo x;")
+
+    ast = parser.parse("foo x; float4 y;", initial_type_symbols={"foo"})
+    assert [decl.name for decl in ast.ext] == ["x", "y"]
+    with pytest.raises(ParseError):
+        parser.parse("foo x;")
+
+
+def test_parser_pool():
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    from pycparser.c_parser import ParseError
+
+    from pycparserext.ext_c_parser import OpenCLCParser
+    from pycparserext.pool import ParserPool
+
+    pool = ParserPool(OpenCLCParser, max_size=2)
+
+    def parse(i):
+        if i % 7 == 0:
+            with pytest.raises(ParseError):
+                pool.parse("typedef int t%d; int f(void) {" % i)
+            return None
+        return pool.parse("typedef float%d t%d; t%d x;" % (2 << i % 3, i, i))
+
+    with ThreadPoolExecutor(8) as executor:
+        asts = list(executor.map(parse, range(100)))
+
+    for i, ast in enumerate(asts):
+        if ast is not None:
+            assert ast.ext[-1].type.type.names == ["t%d" % i]
+    assert pool.size <= 2
+
+    with pool.parser() as p1, pool.parser() as p2:
+        assert p1 is not p2
+        with pytest.raises(TimeoutError):
+            pool.acquire(timeout=0.01)
+
+    ast = asyncio.run(pool.parse_async("float4 x;"))
+    assert ast.ext[0].name == "x"
+
+    # deferred bodies do not use the pooled parser
+    pool = ParserPool(max_size=1,
+            parser_kwargs={"lazy_function_bodies": True})
+    ast = pool.parse("int f(void) { return 1; }")
+    other_ast = pool.parse("int g(void) { int x; return 2; }")
+    assert ast.ext[0].body.block_items[0].expr.value == "1"
+    assert other_ast.ext[0].body.block_items[0].name == "x"
+
+
+def test_generate_to():
+    import io
+
+    from pycparserext.ext_c_generator import GnuCGenerator, OpenCLCGenerator
+    from pycparserext.ext_c_parser import GnuCParser, OpenCLCParser
+
+    gnu_src = """
+    #pragma once
+    int x __attribute__((aligned(8)));
+    int f(int a) { return a + 1; }
+    struct s { int a; };
+    """
+    opencl_src = """
+    #pragma OPENCL EXTENSION cl_khr_fp64: enable
+    __kernel void k(__global float *a) { a[0] = 1; }
+    """
+    for parser, gen, src in [
+            (GnuCParser(), GnuCGenerator(), gnu_src),
+            (OpenCLCParser(), OpenCLCGenerator(), opencl_src),
+            ]:
+        ast = parser.parse(src)
+        expected = gen.visit(ast)
+
+        pieces = []
+        gen.generate_to(ast, pieces)
+        assert len(pieces) == len(ast.ext)
+        assert "".join(pieces) == expected
+
+        out = io.StringIO()
+        gen.generate_to(ast, out)
+        assert out.getvalue() == expected
+
+        out = io.StringIO()
+        gen.generate_to(ast.ext[-1], out)
+        assert out.getvalue() == gen.visit(ast.ext[-1])
+
+
+def test_deep_chains():
+    from pycparser import c_ast
+    from pycparser.c_generator import CGenerator
+
+    from pycparserext.ext_c_generator import GnuCGenerator
+    from pycparserext.ext_c_parser import GnuCParser
+    from pycparserext.traversal import NodeVisitor, child_nodes, walk
+
+    class RecursiveGnuCGenerator(GnuCGenerator):
+        visit_BinaryOp = CGenerator.visit_BinaryOp
+        visit_TernaryOp = CGenerator.visit_TernaryOp
+        visit_Assignment = CGenerator.visit_Assignment
+        visit_If = CGenerator.visit_If
+        visit_StructRef = CGenerator.visit_StructRef
+        visit_ArrayRef = CGenerator.visit_ArrayRef
+        visit_FuncCall = CGenerator.visit_FuncCall
+
+    def make_source(n):
+        return """
+            int f(int x, int y)
+            {
+              x = y = x += (y = 2) + (x ? 1 : 2);
+              %s
+              else { y = x - (x - 1) * (x << 2) || x && !x; }
+              y = x%s;
+              %s 0;
+              y = (*g)(x)%s;
+              return %s 0;
+            }
+            """ % (
+                " else ".join(
+                    "if (x == %d) y = %d;" % (i, i) for i in range(n)),
+                "".join(" %s x" % "+*-/<&|"[i % 7] for i in range(n)),
+                "".join("%s %s= " % ("xy"[i % 2], "+-*"[i % 3])
+                    for i in range(n)),
+                "".join(["->a", "[x]", "(y, 1)", ".b"][i % 4]
+                    for i in range(n)),
+                "".join("x == %d ? %d :" % (i, i) for i in range(n)))
+
+    ast = GnuCParser().parse(make_source(20))
+    for reduce_parentheses in [False, True]:
+        assert (GnuCGenerator(reduce_parentheses=reduce_parentheses).visit(ast)
+                == RecursiveGnuCGenerator(
+                    reduce_parentheses=reduce_parentheses).visit(ast))
+
+    # deeper than the recursion limit
+    ast = GnuCParser().parse(make_source(2000))
+    code = GnuCGenerator(reduce_parentheses=True).visit(ast)
+    assert code.count("else") == 2000
+    assert code.count("(y, 1)") == 500
+
+    # overrides for links of postfix chains take effect
+    class CallHidingGenerator(GnuCGenerator):
+        def visit_FuncCall(self, n):
+            return "CALL"
+
+    expr = GnuCParser().parse("int z = a[1].b(x)->c[2];").ext[0].init
+    assert CallHidingGenerator().visit(expr) == "CALL->c[2]"
+    assert GnuCGenerator().visit(expr) == "a[1].b(x)->c[2]"
+
+    class IDCollector(NodeVisitor):
+        def __init__(self):
+            self.names = []
+
+        def visit_ID(self, node):
+            self.names.append(node.name)
+
+    collector = IDCollector()
+    collector.visit(ast)
+    assert len(collector.names) == sum(
+            isinstance(node, c_ast.ID) for node in walk(ast))
+    assert collector.names[:4] == ["x", "y", "x", "y"]
+
+    class Counter(c_ast.NodeVisitor):
+        def __init__(self):
+            self.nodes = []
+
+        def generic_visit(self, node):
+            self.nodes.append(node)
+            super().generic_visit(node)
+
+    class IterativeCounter(NodeVisitor):
+        def __init__(self):
+            self.nodes = []
+
+        def generic_visit(self, node):
+            self.nodes.append(node)
+            super().generic_visit(node)
+
+    ast = GnuCParser().parse(make_source(3))
+    counter = Counter()
+    counter.visit(ast)
+    iterative_counter = IterativeCounter()
+    iterative_counter.visit(ast)
+    assert iterative_counter.nodes == counter.nodes == list(walk(ast))
+
+    # nodes below extension nodes that children() leaves out
+    ast = GnuCParser().parse(
+            "int x __attribute__((aligned(8))) = 1;"
+            "void f(void) { for (int i = 0, *j = 0;;); }")
+    type_decl = ast.ext[0].type
+    assert type_decl.attributes in child_nodes(type_decl)
+    assert any(isinstance(node, c_ast.Constant) and node.value == "8"
+            for node in walk(ast))
+    assert "int i = 0, *j = 0" in GnuCGenerator().visit(ast)
+
+
+def test_generator_dispatch():
+    from pycparserext.ext_c_generator import GnuCGenerator
+    from pycparserext.ext_c_parser import (
+        ArrayDeclExt,
+        FuncDeclExt,
+        GnuCParser,
+        TypeDeclExt,
+    )
+
+    ast = GnuCParser().parse("""
+        int x __attribute__((aligned(8)));
+        int y[4] __attribute__((aligned(8)));
+        int f(int a) __attribute__((pure));
+        int g(int a) { return a + 1; }
+        """)
+
+    class UpperIDGenerator(GnuCGenerator):
+        def visit_ID(self, n):
+            return n.name.upper()
+
+    # overrides in subclasses take effect, also after the base class has
+    # visited nodes of the same class
+    assert "return a + 1;" in GnuCGenerator().visit(ast)
+    assert "return A + 1;" in UpperIDGenerator().visit(ast)
+    assert "return a + 1;" in GnuCGenerator().visit(ast)
+
+    # extension nodes without a visit method of their own are visited like
+    # the pycparser nodes they extend
+    gen = GnuCGenerator()
+    type_decl = ast.ext[0].type
+    assert isinstance(type_decl, TypeDeclExt)
+    assert gen.visit(type_decl).split() == [
+            "int", "__attribute__((aligned(8)))"]
+    array_decl = ast.ext[1].type
+    assert isinstance(array_decl.type, TypeDeclExt)
+    assert gen.visit(ArrayDeclExt.from_pycparser(array_decl)).split() == [
+            "int", "[4]", "__attribute__((aligned(8)))"]
+    func_decl = ast.ext[2].type
+    assert isinstance(func_decl, FuncDeclExt)
+    assert gen.visit(func_decl).split() == [
+            "int", "f(int", "a)", "__attribute__((pure))"]
+
+    # struct attributes are kept by all generators that know about them
+    from pycparserext.ext_c_generator import OpenCLCGenerator
+    from pycparserext.ext_c_parser import OpenCLCParser, StructExt
+
+    for parser, generator in [
+            (GnuCParser(), GnuCGenerator()),
+            (OpenCLCParser(), OpenCLCGenerator())]:
+        ast = parser.parse("struct __attribute__((packed)) s { int a; } x;")
+        assert isinstance(ast.ext[0].type.type, StructExt)
+        code = generator.visit(ast)
+        assert "} __attribute__((packed)) x;" in code
+
+        # also for nodes whose attrib slot was never set
+        struct = StructExt.__new__(StructExt)
+        struct.name = "s"
+        struct.decls = None
+        assert generator.visit(struct) == "struct s"
+
+
+def test_declaration_index(tmp_path):
+    from pycparser import c_ast
+
+    from pycparserext.cache import ParseCache
+    from pycparserext.decl_index import DeclarationIndex
+    from pycparserext.ext_c_parser import FileASTExt, GnuCParser
+
+    src = """
+        struct s;
+        typedef struct s s_t;
+        extern int counter;
+        int f(int) __asm__("f_impl") __attribute__((pure));
+        struct s {
+            struct inner { int a; } in;
+            int b;
+        } __attribute__((aligned(16)));
+        enum color { RED, GREEN = 2 };
+        int counter __attribute__((aligned(8))) = 0;
+        int f(int x) { return x; }
+        int f(int);
+        union u *up;
+        """
+
+    ast = GnuCParser().parse(src)
+    assert type(ast) is c_ast.FileAST
+
+    for parser in [
+            GnuCParser(index_declarations=True),
+            GnuCParser(index_declarations=True, lazy_function_bodies=True),
+            GnuCParser(index_declarations=True,
+                cache=ParseCache(tmp_path / "cache")),
+            ]:
+        for _ in range(2):
+            # The second time, the cache, if any, is hit.
+            ast = parser.parse(src)
+            assert isinstance(ast, FileASTExt)
+            index = ast.index
+
+            assert sorted(index) == [
+                    "GREEN", "RED", "counter", "f", "s_t", "up"]
+            assert index["s_t"].kind == "typedef"
+            assert index["GREEN"].kind == "enumerator"
+            assert index["GREEN"].node.value.value == "2"
+
+            # definitions take precedence over other declarations
+            counter = index["counter"]
+            assert counter.kind == "variable"
+            assert counter.is_definition
+            assert counter.coord.line == 11
+            assert [attr.name.name for attr in counter.attributes] == [
+                    "aligned"]
+
+            f = index["f"]
+            assert f.kind == "function"
+            assert isinstance(f.node, c_ast.FuncDef)
+            assert f.node.decl.name == "f"
+
+            # tags resolve to their definitions
+            s = index.tag("s")
+            assert s.kind == "struct"
+            assert s.is_definition
+            assert s.node is ast.ext[4].type
+            assert [attr.name.name for attr in s.attributes] == ["aligned"]
+            assert index.tag("inner").node.decls[0].name == "a"
+            assert index.tag("color").kind == "enum"
+            assert not index.tag("u").is_definition
+            assert index.tag("s_t") is None
+
+    # the asm label and attributes of the prototype
+    index = DeclarationIndex.from_ast(GnuCParser().parse(
+            """int f(int) __asm__("f_impl") __attribute__((pure));"""))
+    f = index["f"]
+    assert not f.is_definition
+    assert f.asm.template.exprs[0].value == '"f_impl"'
+    assert [attr.name for attr in f.attributes] == ["pure"]
+
+
+def test_parser_snapshot(tmp_path):
+    from io import BytesIO
+
+    from pycparser.c_parser import ParseError
+
+    from pycparserext.cache import ParseCache
+    from pycparserext.ext_c_generator import GnuCGenerator
+    from pycparserext.ext_c_parser import GnuCParser, OpenCLCParser
+    from pycparserext.snapshot import ParserSnapshot
+
+    prelude = """
+    typedef unsigned long size_t;
+    typedef struct { int fd; } FILE __attribute__((aligned(8)));
+    extern FILE *stdin;
+    enum { EOF_MARK = -1 };
+    size_t strlen(const char *s);
+    """
+    text = "size_t n; FILE *f; int g(void) { return EOF_MARK; }"
+
+    p = GnuCParser()
+    with pytest.raises(ParseError):
+        p.parse(text)
+
+    snapshot = p.parse_prelude(prelude, "prelude.h")
+    assert snapshot.scope["size_t"] is True
+    assert snapshot.scope["FILE"] is True
+    assert snapshot.scope["stdin"] is False
+    assert snapshot.scope["EOF_MARK"] is False
+    assert snapshot.scope["__builtin_va_list"] is True
+    assert len(snapshot.ast.ext) == 5
+
+    ast = p.parse(text, snapshot=snapshot)
+    assert len(ast.ext) == 3
+    assert (GnuCGenerator().visit(snapshot.ast) + GnuCGenerator().visit(ast)
+            == GnuCGenerator().visit(p.parse(prelude + text)))
+
+    # on disk, with the AST of the prelude built on access
+    buf = BytesIO()
+    snapshot.save(buf)
+    buf.seek(0)
+    loaded = ParserSnapshot.load(buf)
+    assert loaded.scope == snapshot.scope
+    assert loaded._ast is None
+    assert _compare_asts(loaded.ast, snapshot.ast)
+    other_parser = GnuCParser()
+    assert _compare_asts(other_parser.parse(text, snapshot=loaded), ast)
+
+    with pytest.raises(ValueError):
+        ParserSnapshot.loads(b"not a snapshot at all")
+    with pytest.raises(ValueError):
+        OpenCLCParser().parse(text, snapshot=loaded)
+
+    # extending a snapshot
+    extended = p.parse_prelude("typedef FILE *file_ptr;", snapshot=snapshot)
+    assert len(extended.ast.ext) == 6
+    p.parse("file_ptr fp; size_t m;", snapshot=extended)
+
+    # the typedef names of the snapshot are part of the cache key
+    cache = ParseCache(tmp_path / "cache")
+    p = GnuCParser(cache=cache)
+    with pytest.raises(ParseError):
+        p.parse(text)
+    assert _compare_asts(p.parse(text, snapshot=snapshot), ast)
+    assert _compare_asts(p.parse(text, snapshot=snapshot), ast)
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+
+
 if __name__ == "__main__":
     import sys
     if len(sys.argv) > 1: